@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Limits of concurrently running crawls."""
+from collections import defaultdict, deque
+
+from twisted.internet import defer, reactor
+from twisted.web.error import Error
+
+from .conf import settings
+
+
+class CrawlRejected(Error):
+    """Crawl can't be started because server is overloaded."""
+
+    def __init__(self, message, retry_after):
+        super(CrawlRejected, self).__init__('503', message=message)
+        self.retry_after = retry_after
+
+
+class QueuedCrawl(object):
+
+    def __init__(self, spider_name, enqueued):
+        self.spider_name = spider_name
+        self.enqueued = enqueued
+        self.dfd = None
+        self.timeout_call = None
+
+
+class AdmissionControl(object):
+    """Limits number of concurrently running crawls, globally and per spider.
+
+    Crawls that can't be started wait in FIFO queue. Crawl is rejected if
+    queue is full or it waited in queue longer than allowed. Crawl waiting
+    for its spider's limit doesn't block crawls of other spiders queued
+    after it.
+
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or reactor
+        self.max_crawls = int(settings.CONCURRENT_CRAWLS)
+        self.max_spider_crawls = int(settings.CONCURRENT_CRAWLS_PER_SPIDER)
+        self.queue_size = int(settings.CRAWL_QUEUE_SIZE)
+        self.max_wait = float(settings.CRAWL_QUEUE_TIMEOUT)
+        self.retry_after = int(settings.CRAWL_QUEUE_RETRY_AFTER)
+        self.active = 0
+        self.active_spiders = defaultdict(int)
+        self.queue = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.max_crawls or self.max_spider_crawls)
+
+    def run(self, spider_name, func, *args, **kwargs):
+        """Call func when crawl of spider can be started.
+
+        :param func: function returning Deferred
+        :return: Deferred with result of func, it fails with
+            CrawlRejected if crawl can't be started.
+
+        """
+        if not self.enabled:
+            return defer.maybeDeferred(func, *args, **kwargs)
+
+        def start(_):
+            dfd = defer.maybeDeferred(func, *args, **kwargs)
+            return dfd.addBoth(self._release, spider_name)
+
+        return self.acquire(spider_name).addCallback(start)
+
+    def acquire(self, spider_name):
+        """Return Deferred that fires when crawl of spider can be started,
+        release() must be called when crawl is finished."""
+        if (not self._can_start(spider_name) and
+                len(self.queue) >= self.queue_size):
+            self.rejected += 1
+            return defer.fail(CrawlRejected(
+                "Too many crawls, try again later", self.retry_after))
+        queued = QueuedCrawl(spider_name, self.clock.seconds())
+        queued.dfd = defer.Deferred(lambda _: self._cancel(queued))
+        if self.max_wait > 0:
+            queued.timeout_call = self.clock.callLater(
+                self.max_wait, self._timeout, queued)
+        self.queue.append(queued)
+        self._process_queue()
+        return queued.dfd
+
+    def release(self, spider_name):
+        self.active -= 1
+        self.active_spiders[spider_name] -= 1
+        if not self.active_spiders[spider_name]:
+            del self.active_spiders[spider_name]
+        self._process_queue()
+
+    def _release(self, result, spider_name):
+        self.release(spider_name)
+        return result
+
+    def _can_start(self, spider_name):
+        if self.max_crawls and self.active >= self.max_crawls:
+            return False
+        if (self.max_spider_crawls and
+                self.active_spiders[spider_name] >= self.max_spider_crawls):
+            return False
+        return True
+
+    def _next_startable(self):
+        for queued in self.queue:
+            if self.max_crawls and self.active >= self.max_crawls:
+                return None
+            if self._can_start(queued.spider_name):
+                return queued
+        return None
+
+    def _process_queue(self):
+        # queue is scanned again after every started crawl, as crawl
+        # can finish and process queue before callback returns
+        while True:
+            queued = self._next_startable()
+            if queued is None:
+                break
+            self.queue.remove(queued)
+            if queued.timeout_call is not None:
+                queued.timeout_call.cancel()
+            wait_time = self.clock.seconds() - queued.enqueued
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            self.admitted += 1
+            self.active += 1
+            self.active_spiders[queued.spider_name] += 1
+            queued.dfd.callback(None)
+
+    def _cancel(self, queued):
+        """Crawl isn't needed anymore, e.g. client disconnected."""
+        if queued in self.queue:
+            self.queue.remove(queued)
+        if queued.timeout_call is not None and queued.timeout_call.active():
+            queued.timeout_call.cancel()
+
+    def _timeout(self, queued):
+        self.queue.remove(queued)
+        self.timed_out += 1
+        queued.dfd.errback(CrawlRejected(
+            "Timed out waiting for crawl to start, try again later",
+            self.retry_after))
+
+    def get_stats(self):
+        admitted = self.admitted
+        return {
+            'active': self.active,
+            'queued': len(self.queue),
+            'admitted': admitted,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'avg_wait_time': (
+                self.total_wait_time / admitted if admitted else 0.0),
+            'max_wait_time': self.max_wait_time,
+        }
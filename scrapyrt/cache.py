@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Caches for crawl results."""
+from collections import OrderedDict
+import time
+
+import six
+
+from .conf import settings
+
+
+class CacheEntry(object):
+
+    def __init__(self, result, ttl, stale_while_revalidate=0,
+                 stale_if_error=0):
+        self.result = result
+        self.created = time.time()
+        self.expires = self.created + ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.expires
+
+    def can_revalidate(self, now=None):
+        """Entry is expired but can be served while it's refreshed."""
+        return (now or time.time()) < self.expires + self.stale_while_revalidate
+
+    def can_serve_on_error(self, now=None):
+        """Entry is expired but can be served if refresh failed."""
+        return (now or time.time()) < self.expires + self.stale_if_error
+
+
+class MemoryResultCache(object):
+    """In-memory cache of crawl results with LRU eviction.
+
+    Cache size is limited by total number of items in cached results
+    (results without items count as one item), least recently used
+    results are evicted first.
+
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.max_size = int(settings.RESULT_CACHE_MAX_ITEMS)
+        self.default_ttl = float(settings.RESULT_CACHE_TTL)
+        self.spider_ttl = settings.RESULT_CACHE_SPIDER_TTL or {}
+        if isinstance(self.spider_ttl, six.string_types):
+            # passed in command line, e.g. spider1:3600,spider2:0
+            self.spider_ttl = dict(ttl.split(':', 1)
+                                   for ttl in self.spider_ttl.split(',')
+                                   if ttl)
+        self.stale_while_revalidate = float(
+            settings.RESULT_CACHE_STALE_WHILE_REVALIDATE)
+        self.stale_if_error = float(settings.RESULT_CACHE_STALE_IF_ERROR)
+
+    def get_ttl(self, spider_name):
+        return float(self.spider_ttl.get(spider_name, self.default_ttl))
+
+    def get(self, key):
+        """Get cached entry, it can be expired.
+
+        Entries that are expired and can't be served anymore are removed.
+
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if not (entry.can_revalidate(now) or entry.can_serve_on_error(now)):
+            self.delete(key)
+            return None
+        # mark as recently used
+        del self.entries[key]
+        self.entries[key] = entry
+        return entry
+
+    def set(self, key, spider_name, result):
+        ttl = self.get_ttl(spider_name)
+        if ttl <= 0:
+            return
+        self.delete(key)
+        entry = CacheEntry(result, ttl, self.stale_while_revalidate,
+                           self.stale_if_error)
+        self.entries[key] = entry
+        self.size += self._get_entry_size(entry)
+        while self.size > self.max_size and self.entries:
+            self.delete(next(six.iterkeys(self.entries)))
+
+    def delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= self._get_entry_size(entry)
+
+    def _get_entry_size(self, entry):
+        return max(len(entry.result.get('items') or ()), 1)
+
+    def __len__(self):
+        return len(self.entries)
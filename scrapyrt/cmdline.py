@@ -10,12 +10,17 @@ from scrapy.utils.conf import closest_scrapy_cfg
 from scrapy.utils.misc import load_object
 from twisted.application import app
 from twisted.application.internet import TCPServer
-from twisted.application.service import Application
-from twisted.internet import reactor
+from twisted.application.service import Application, Service
 from twisted.web.server import Site
 
 from .log import setup_logging
+from .logqueue import log_writer
 from .conf import settings
+from .conf.spider_settings import project_settings_cache
+from .offload import callback_pool
+from .workers import (
+    create_listening_socket, stop_with_master, WorkerMaster
+)
 
 
 def parse_arguments():
@@ -48,18 +53,67 @@ def parse_arguments():
     parser.add_argument('-S', '--settings', dest='settings',
                         metavar='project.settings',
                         help='custom project settings module path')
+    parser.add_argument('-w', '--workers', dest='workers',
+                        type=int,
+                        default=0,
+                        help='number of worker processes sharing the port, '
+                             'by default server runs in single process')
     return parser.parse_args()
 
 
-def get_application(arguments):
+class AdoptedPortServer(Service):
+    """Serve factory on listening socket created by another process."""
+
+    def __init__(self, sock, factory):
+        self.sock = sock
+        self.factory = factory
+        self._port = None
+
+    def startService(self):
+        from twisted.internet import reactor
+        Service.startService(self)
+        self._port = reactor.adoptStreamPort(
+            self.sock.fileno(), self.sock.family, self.factory)
+
+    def stopService(self):
+        Service.stopService(self)
+        if self._port is not None:
+            return self._port.stopListening()
+
+
+def get_application(arguments, sock=None):
     ServiceRoot = load_object(settings.SERVICE_ROOT)
-    site = Site(ServiceRoot())
+    root = ServiceRoot()
+    site = Site(root)
     application = Application('scrapyrt')
-    server = TCPServer(arguments.port, site, interface=arguments.ip)
+    if sock is not None:
+        server = AdoptedPortServer(sock, site)
+    else:
+        server = TCPServer(arguments.port, site, interface=arguments.ip)
     server.setServiceParent(application)
+    recycler = getattr(root, 'recycler', None)
+    if recycler is not None:
+        # recycled process stops accepting connections
+        recycler.server = server
     return application
 
 
+def run_server(arguments, sock=None):
+    # reactor is imported here, in pre-fork mode it must be installed
+    # in worker process
+    from twisted.internet import reactor
+    application = get_application(arguments, sock)
+    app.startApplication(application, save=False)
+    if callback_pool.enabled:
+        callback_pool.start()
+        reactor.addSystemEventTrigger('after', 'shutdown', callback_pool.close)
+    if sock is not None:
+        stop_with_master()
+    if log_writer.enabled:
+        reactor.addSystemEventTrigger('after', 'shutdown', log_writer.stop)
+    reactor.run()
+
+
 def find_scrapy_project(project):
     project_config_path = closest_scrapy_cfg()
     if not project_config_path:
@@ -88,9 +142,19 @@ def execute():
     settings.set('PROJECT_SETTINGS', find_scrapy_project(arguments.project))
     settings.freeze()
     setup_logging()
-    application = get_application(arguments)
-    app.startApplication(application, save=False)
-    reactor.run()
+    # import spiders before accepting first request
+    project_settings_cache.get_spider_loader()
+    if arguments.workers > 0:
+        if 'twisted.internet.reactor' in sys.modules:
+            raise RuntimeError(
+                'Twisted reactor was installed while loading project, '
+                'it can not be shared by worker processes')
+        sock = create_listening_socket(arguments.port, arguments.ip)
+        master = WorkerMaster(
+            arguments.workers, lambda sock: run_server(arguments, sock), sock)
+        master.run()
+    else:
+        run_server(arguments)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Compression of responses negotiated with Accept-Encoding header."""
+import zlib
+
+# supported content codings in order of preference
+ENCODINGS = ('gzip', 'deflate')
+
+_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def parse_accept_encoding(accept_encoding):
+    """Return dict of content codings to their quality values."""
+    qualities = {}
+    for coding in (accept_encoding or '').split(','):
+        coding, _, params = coding.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def select_encoding(accept_encoding):
+    """Return content coding supported by client or None if response
+    shouldn't be compressed."""
+    qualities = parse_accept_encoding(accept_encoding)
+    selected = None
+    selected_quality = 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > selected_quality:
+            selected, selected_quality = encoding, quality
+    return selected
+
+
+def get_compressor(encoding, level):
+    return zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+
+
+def compress_chunks(chunks, encoding, level):
+    """Compress list of bytes chunks, return list of compressed chunks."""
+    compressor = get_compressor(encoding, level)
+    compressed = [compressor.compress(chunk) for chunk in chunks]
+    compressed.append(compressor.flush())
+    return [chunk for chunk in compressed if chunk]
+
+
+class StreamCompressor(object):
+    """Compresses streamed response, every written record is flushed, so
+    that client can decompress it as soon as it's received."""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        self._compressor = get_compressor(encoding, level)
+
+    def compress(self, data):
+        return (self._compressor.compress(data) +
+                self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def flush(self):
+        return self._compressor.flush()
@@ -14,18 +14,137 @@ SPIDER_LOG_FILE_TIMEFORMAT = '%Y-%m-%dT%H%M%S.%f'
 # Path to spiders log directory
 LOG_DIR = 'logs'
 
+# Layout of spider logs in LOG_DIR: 'crawl' - new file for every crawl,
+# 'spider' - one stream per spider, 'process' - one stream per process,
+# 'memory' - log is kept in memory and written to file only if crawl
+# failed or logged errors.
+# Streams are rotated by size, every line of them has id of its crawl.
+SPIDER_LOG_LAYOUT = 'crawl'
+SPIDER_LOG_MAX_BYTES = 100 * 1024 * 1024
+# number of rotated files of stream that are kept
+SPIDER_LOG_BACKUP_COUNT = 5
+# Log level of crawls, SPIDER_LOG_LEVELS can set it for some spiders,
+# e.g. {'spider': 'WARNING'}.
+SPIDER_LOG_LEVEL = 'DEBUG'
+SPIDER_LOG_LEVELS = {}
+# One of every this number of crawls logs at DEBUG level regardless of
+# level of its spider. 0 disables sampling.
+SPIDER_LOG_DEBUG_SAMPLING = 0
+# number of last log records of crawl kept in 'memory' layout
+SPIDER_LOG_BUFFER_SIZE = 1000
+# log kept in memory is written to file when crawl logs that many errors,
+# 0 writes it only when crawl failed
+SPIDER_LOG_ERROR_THRESHOLD = 1
+
 LOG_ENCODING = 'utf-8'
 
+# Number of log records queued to be written by background thread, so
+# that log files aren't written by reactor thread. 0 disables queue,
+# files are written right away.
+LOG_QUEUE_SIZE = 0
+# What happens when queue is full: 'drop' - record is dropped and counted,
+# 'block' - wait until writer thread makes space in queue.
+LOG_QUEUE_FULL_POLICY = 'drop'
+
 # Root server resource, should inherit from scrapyrt.resources.RealtimeAPI
 SERVICE_ROOT = 'scrapyrt.resources.RealtimeApi'
 
 # Resources list
 RESOURCES = {
     'crawl.json': 'scrapyrt.resources.CrawlResource',
+    'jobs.json': 'scrapyrt.resources.JobResource',
+    'metrics.json': 'scrapyrt.resources.MetricsResource',
 }
 
 CRAWL_MANAGER = 'scrapyrt.core.CrawlManager'
 
+# Names of spiders that are kept running between API calls. Requests from
+# API are scheduled in running spider instead of starting new crawl.
+WARM_SPIDERS = []
+
+# Identical crawl.json calls that come while the same crawl is running
+# get result of running crawl instead of starting new one.
+COALESCE_CRAWLS = False
+
+# Cache of crawl.json results, e.g. 'scrapyrt.cache.MemoryResultCache'.
+# Disabled by default.
+RESULT_CACHE = None
+# Seconds results are fresh
+RESULT_CACHE_TTL = 60
+# Per spider TTL, {spider_name: seconds}, 0 disables cache for spider
+RESULT_CACHE_SPIDER_TTL = {}
+# Limit of total number of items in cached results
+RESULT_CACHE_MAX_ITEMS = 10000
+# Seconds expired result can be returned while it's refreshed
+RESULT_CACHE_STALE_WHILE_REVALIDATE = 0
+# Seconds expired result can be returned if crawl refreshing it failed
+RESULT_CACHE_STALE_IF_ERROR = 0
+
+# Maximum number of crawls running at the same time, 0 means no limit
+CONCURRENT_CRAWLS = 0
+# Maximum number of crawls of the same spider running at the same time,
+# 0 means no limit
+CONCURRENT_CRAWLS_PER_SPIDER = 0
+# Maximum number of crawls waiting to be started when limit is reached,
+# crawls above that are rejected with 503
+CRAWL_QUEUE_SIZE = 100
+# Seconds crawl can wait in queue before it's rejected, 0 means no limit
+CRAWL_QUEUE_TIMEOUT = 30
+# Value of Retry-After header of rejected crawls
+CRAWL_QUEUE_RETRY_AFTER = 5
+
+# Maximum number of jobs kept by jobs.json, oldest finished jobs are
+# removed when limit is reached
+JOB_STORE_SIZE = 1000
+# Seconds results of finished jobs are kept
+JOB_RESULT_TTL = 3600
+
+# Maximum number of requests in batch crawl
+BATCH_MAX_REQUESTS = 500
+
+# Compress responses with gzip or deflate if client accepts it in
+# Accept-Encoding header
+RESPONSE_COMPRESSION = True
+# Responses smaller than this number of bytes aren't compressed, streamed
+# responses are always compressed
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+# zlib compression level, from 1 (fastest) to 9 (best compression)
+RESPONSE_COMPRESSION_LEVEL = 6
+
+# JSON library used to decode requests and encode responses: 'orjson',
+# 'simplejson', 'json' or path to backend class. 'auto' selects the
+# fastest installed library.
+JSON_BACKEND = 'auto'
+
+# Responses with at least this number of items are encoded to JSON in
+# thread pool instead of reactor thread. 0 disables encoding in threads.
+JSON_ENCODE_THREAD_MIN_ITEMS = 1000
+
+# Number of processes calling spider callbacks marked as CPU-bound with
+# scrapyrt.offload.cpu_bound decorator or listed in cpu_bound_callbacks
+# attribute of spider. 0 disables pool, all callbacks are called in
+# server process.
+CALLBACK_POOL_SIZE = 0
+# Callback called in pool fails when its result isn't received in this
+# number of seconds, e.g. because pool process died. 0 disables timeout.
+CALLBACK_POOL_TIMEOUT = 60
+
+# Process is stopped after this number of crawls to release memory it
+# accumulated, it stops accepting connections and waits for running
+# crawls to finish. Supervisor or master process started with --workers
+# option should start new process. 0 disables recycling.
+RECYCLE_AFTER_CRAWLS = 0
+# Process is recycled when its resident memory goes over this number of
+# megabytes, checked after every crawl. 0 disables recycling.
+RECYCLE_MEMORY_LIMIT = 0
+
+# Only this number of dropped items is kept and returned in response of
+# crawl, item_dropped_count stat has number of all dropped items.
+MAX_DROPPED_ITEMS = 100
+# Spider error tracebacks with the same exception type and stack are
+# grouped and counted, only this number of distinct tracebacks is kept.
+MAX_ERROR_TRACEBACKS = 20
+
 # Limit spider run time
 TIMEOUT_LIMIT = 1000
 # disable in production
@@ -1,12 +1,26 @@
 # -*- coding: utf-8 -*-
+from copy import deepcopy
+import warnings
+
+from scrapy.exceptions import ScrapyDeprecationWarning
+from scrapy.interfaces import ISpiderLoader
 from scrapy.settings import Settings
+from scrapy.utils.misc import load_object
+from zope.interface.exceptions import Invalid
+from zope.interface.verify import verifyClass
+try:
+    from scrapy.settings import BaseSettings
+except ImportError:
+    # Scrapy 1.0, settings are never nested there
+    BaseSettings = None
 
 from . import settings
+from .. import log
 
 
 def get_scrapyrt_settings(log_file=None):
     spider_settings = {
-        "LOG_LEVEL": "DEBUG",
+        "LOG_LEVEL": settings.SPIDER_LOG_LEVEL,
         "LOG_ENABLED": bool(log_file),
         "LOG_FILE": log_file,
         "LOG_STDOUT": False,
@@ -29,3 +43,204 @@ def get_project_settings(module=None, custom_settings=None):
         assert isinstance(custom_settings, dict)
         crawler_settings.setdict(custom_settings, priority='cmdline')
     return crawler_settings
+
+
+_MUTABLE = (BaseSettings or Settings, dict, list)
+
+
+def _init_empty_settings(empty_settings):
+    # Settings.__init__ loads all default settings, overlay gets them
+    # from base instead
+    if BaseSettings is None:
+        empty_settings.frozen = False
+        empty_settings.attributes = {}
+    else:
+        BaseSettings.__init__(empty_settings)
+
+
+class SettingsOverlay(Settings):
+    """Mutable settings on top of frozen base settings.
+
+    Attributes are shared with base settings until they are changed
+    (copy-on-write), so creating overlay is much cheaper than building
+    settings from scratch or calling ``Settings.copy()``. Copy of overlay,
+    e.g. the one made by Scrapy crawler, is overlay on the same base.
+
+    """
+
+    def __init__(self, base, values=None, priority='cmdline'):
+        assert base.frozen, "Base settings must be frozen"
+        _init_empty_settings(self)
+        self.attributes = dict(base.attributes)
+        self._shared = set(self.attributes)
+        if values:
+            self.setdict(values, priority)
+
+    def _unshare(self, name):
+        if name in self._shared:
+            self._shared.discard(name)
+            self.attributes[name] = deepcopy(self.attributes[name])
+
+    def __getitem__(self, opt_name):
+        # mutable settings can be modified in place, e.g.
+        # settings['EXTENSIONS'][name] = None
+        attribute = self.attributes.get(opt_name)
+        if attribute is not None and isinstance(attribute.value, _MUTABLE):
+            self._unshare(opt_name)
+        return super(SettingsOverlay, self).__getitem__(opt_name)
+
+    def set(self, name, value, priority='project'):
+        self._assert_mutability()
+        self._unshare(name)
+        super(SettingsOverlay, self).set(name, value, priority)
+
+    def __delitem__(self, name):
+        self._assert_mutability()
+        self._shared.discard(name)
+        del self.attributes[name]
+
+    def copy(self):
+        settings_copy = self.__class__.__new__(self.__class__)
+        _init_empty_settings(settings_copy)
+        settings_copy.attributes = dict(self.attributes)
+        settings_copy._shared = set(self._shared)
+        # only attributes changed in this overlay are copied
+        for name in set(self.attributes) - self._shared:
+            settings_copy.attributes[name] = deepcopy(self.attributes[name])
+        settings_copy.frozen = self.frozen
+        return settings_copy
+
+
+def get_spider_loader_path(crawler_settings):
+    """Return path of spider loader class, deprecated SPIDER_MANAGER_CLASS
+    takes precedence over SPIDER_LOADER_CLASS as in Scrapy."""
+    return crawler_settings.get('SPIDER_MANAGER_CLASS',
+                                crawler_settings.get('SPIDER_LOADER_CLASS'))
+
+
+def build_spider_loader(crawler_settings):
+    """Build spider loader the same way as Scrapy's
+    ``scrapy.crawler._get_spider_loader``.
+
+    It isn't called directly, because importing scrapy.crawler installs
+    reactor, and spiders are loaded before workers are forked.
+
+    """
+    if crawler_settings.get('SPIDER_MANAGER_CLASS'):
+        warnings.warn(
+            'SPIDER_MANAGER_CLASS option is deprecated. '
+            'Please use SPIDER_LOADER_CLASS.',
+            category=ScrapyDeprecationWarning, stacklevel=2
+        )
+    loader_cls = load_object(get_spider_loader_path(crawler_settings))
+    try:
+        verifyClass(ISpiderLoader, loader_cls)
+    except Invalid:
+        # DoesNotImplement or other errors in newer zope.interface
+        warnings.warn(
+            'SPIDER_LOADER_CLASS (previously named SPIDER_MANAGER_CLASS) does '
+            'not fully implement scrapy.interfaces.ISpiderLoader interface. '
+            'Please add all missing methods to avoid unexpected runtime errors.',
+            category=ScrapyDeprecationWarning, stacklevel=2
+        )
+    return loader_cls.from_settings(crawler_settings.frozencopy())
+
+
+class ProjectSettingsCache(object):
+    """Frozen Scrapy settings and spider loaders for project and its spiders.
+
+    Settings are built once per project settings module and per spider
+    (including spider ``custom_settings``) and reused by all crawls.
+    Crawls should get :class:`SettingsOverlay` on top of cached settings
+    instead of modifying them.
+
+    """
+
+    def __init__(self):
+        self._settings = {}
+        self._spider_loaders = {}
+        self.hits = 0
+        self.rebuilds = 0
+
+    def get(self, spider_name=None, module=None):
+        """Get frozen settings for project, or for spider if spider_name
+        is passed.
+
+        If spider can't be found project settings are returned.
+
+        """
+        if module is None:
+            module = settings.PROJECT_SETTINGS
+        key = (module, spider_name)
+        try:
+            crawler_settings = self._settings[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return crawler_settings
+
+        if spider_name is None:
+            crawler_settings = self._build_project_settings(module)
+        else:
+            project_settings = self.get(module=module)
+            try:
+                spidercls = self.load_spider(project_settings, spider_name)
+            except KeyError:
+                # don't cache anything for unknown spiders,
+                # crawl will fail with proper error later
+                return project_settings
+            crawler_settings = SettingsOverlay(project_settings)
+            spidercls.update_settings(crawler_settings)
+        crawler_settings.freeze()
+        self._settings[key] = crawler_settings
+        self.rebuilds += 1
+        log.msg(u"Built settings for project {} spider {}".format(
+            module, spider_name))
+        return crawler_settings
+
+    def _build_project_settings(self, module):
+        return get_project_settings(
+            module, custom_settings=get_scrapyrt_settings())
+
+    def get_spider_loader(self, crawler_settings=None):
+        """Get spider loader shared by all crawls.
+
+        Spider loader imports and scans all SPIDER_MODULES, so it's done
+        only once per spider loader class and SPIDER_MODULES combination;
+        after that finding spider class by name is a dict lookup.
+
+        """
+        if crawler_settings is None:
+            crawler_settings = self.get()
+        key = (get_spider_loader_path(crawler_settings),
+               tuple(crawler_settings.getlist('SPIDER_MODULES')))
+        try:
+            return self._spider_loaders[key]
+        except KeyError:
+            pass
+        spider_loader = build_spider_loader(crawler_settings)
+        self._spider_loaders[key] = spider_loader
+        log.msg(u"Loaded spiders from {}".format(list(key[1])))
+        return spider_loader
+
+    def load_spider(self, project_settings, spider_name):
+        return self.get_spider_loader(project_settings).load(spider_name)
+
+    def reload(self):
+        """Drop all cached settings and spider loaders and load project
+        spiders again."""
+        self._settings.clear()
+        self._spider_loaders.clear()
+        self.get_spider_loader()
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'rebuilds': self.rebuilds,
+            'size': len(self._settings),
+            'spider_loaders': len(self._spider_loaders),
+        }
+
+
+project_settings_cache = ProjectSettingsCache()
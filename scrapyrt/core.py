@@ -2,22 +2,36 @@
 from collections import OrderedDict
 from copy import deepcopy
 import datetime
+import itertools
 import os
 import six
+import time
 import types
 
 from scrapy import signals, log as scrapy_log
+from scrapy.core.engine import ExecutionEngine
 from scrapy.crawler import CrawlerRunner, Crawler
-from scrapy.exceptions import DontCloseSpider
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
 from scrapy.http import Request
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.misc import load_object
+from twisted.python.failure import Failure
 from twisted.web.error import Error
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 
 from . import log
+from . import signals as scrapyrt_signals
 from .conf import settings
-from .conf.spider_settings import get_scrapyrt_settings, get_project_settings
+from .conf.spider_settings import project_settings_cache, SettingsOverlay
 from .decorators import deprecated
-from .log import setup_spider_logging
+from .log import (
+    CRAWL_ID_META_KEY, get_log_id, get_spider_log_level, LogBuffer,
+    mark_log_stream, remove_log_counter_handler, sample_debug_log,
+    setup_spider_logging
+)
+from .offload import callback_pool
+from .utils import get_failure_signature
 
 
 class ScrapyrtCrawler(Crawler):
@@ -32,6 +46,8 @@ class ScrapyrtCrawler(Crawler):
     """
     def __init__(self, spidercls, crawler_settings, start_requests=False):
         super(ScrapyrtCrawler, self).__init__(spidercls, crawler_settings)
+        # logs are counted by spider log dispatcher
+        remove_log_counter_handler(self)
         self.start_requests = start_requests
 
     @defer.inlineCallbacks
@@ -40,7 +56,11 @@ class ScrapyrtCrawler(Crawler):
         self.crawling = True
         try:
             self.spider = self._create_spider(*args, **kwargs)
+            if callback_pool.enabled:
+                callback_pool.offload_callbacks(self.spider, args, kwargs)
             self.engine = self._create_engine()
+            downloader = self.engine.downloader
+            downloader.handlers = DownloadTracker(downloader.handlers)
             if self.start_requests:
                 start_requests = iter(self.spider.start_requests())
             else:
@@ -52,17 +72,92 @@ class ScrapyrtCrawler(Crawler):
             raise
 
 
+class DownloadTracker(object):
+    """Wraps download handlers of downloader to keep Deferreds of
+    downloads in progress, so that they can be cancelled when crawl
+    doesn't need their responses anymore.
+
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        # request -> Deferred of its download
+        self.downloads = {}
+
+    def __getattr__(self, name):
+        return getattr(self.handlers, name)
+
+    def download_request(self, request, spider):
+        dfd = defer.maybeDeferred(
+            self.handlers.download_request, request, spider)
+        if not dfd.called:
+            self.downloads[request] = dfd
+            dfd.addBoth(self._download_finished, request)
+        return dfd
+
+    def _download_finished(self, result, request):
+        self.downloads.pop(request, None)
+        return result
+
+    def cancel(self, predicate=None):
+        """Cancel downloads of requests predicate returns True for,
+        or all downloads if it's not given."""
+        for request, dfd in list(self.downloads.items()):
+            if predicate is None or predicate(request):
+                dfd.cancel()
+
+
+class WarmScrapyrtCrawler(ScrapyrtCrawler):
+    """Crawler used by WarmCrawler."""
+
+    def _create_engine(self):
+        return ScrapyrtExecutionEngine(self, lambda _: self.stop())
+
+
+class ScrapyrtExecutionEngine(ExecutionEngine):
+    """Execution engine that sends request_processed signal for every
+    request that was downloaded and processed by spider, so that
+    it's possible to find out when requests from single API call are done
+    while spider is still running.
+
+    """
+
+    def _handle_downloader_output(self, response, request, spider):
+        dfd = super(ScrapyrtExecutionEngine, self)._handle_downloader_output(
+            response, request, spider)
+        if dfd is None:
+            # new request was scheduled instead (e.g. redirect)
+            self._request_processed(None, request, spider)
+            return dfd
+        return dfd.addBoth(self._request_processed, request, spider)
+
+    def _request_processed(self, result, request, spider):
+        self.signals.send_catch_log(
+            signal=scrapyrt_signals.request_processed,
+            request=request, spider=spider)
+        return result
+
+
 class ScrapyrtCrawlerProcess(CrawlerRunner):
 
+    crawler_class = ScrapyrtCrawler
+
     def __init__(self, settings, scrapyrt_manager):
-        super(ScrapyrtCrawlerProcess, self).__init__(settings)
+        # CrawlerRunner.__init__ creates new spider loader which imports
+        # and scans all spider modules, so it gets settings without them
+        # and shared spider loader is used instead.
+        runner_settings = settings.copy()
+        runner_settings.set('SPIDER_MODULES', [], priority='cmdline')
+        super(ScrapyrtCrawlerProcess, self).__init__(runner_settings)
+        self.settings = settings
+        self.spider_loader = project_settings_cache.get_spider_loader(settings)
         self.scrapyrt_manager = scrapyrt_manager
 
     def crawl(self, spidercls, *args, **kwargs):
         if isinstance(spidercls, six.string_types):
             spidercls = self.spider_loader.load(spidercls)
         # creating our own crawler that will allow us to disable start requests easily
-        crawler = ScrapyrtCrawler(
+        crawler = self.crawler_class(
             spidercls, self.settings, self.scrapyrt_manager.start_requests)
         self.scrapyrt_manager.crawler = crawler
         # Connecting signals to handlers that control crawl process
@@ -77,7 +172,10 @@ class ScrapyrtCrawlerProcess(CrawlerRunner):
         crawler.signals.connect(self.scrapyrt_manager.handle_scheduling,
                                 signals.request_scheduled)
         dfd = super(ScrapyrtCrawlerProcess, self).crawl(crawler, *args, **kwargs)
-        _cleanup_handler = setup_spider_logging(crawler.spider, self.settings)
+        # crawl can keep its log in memory instead of file
+        log_buffer = getattr(self.scrapyrt_manager, 'log_buffer', None)
+        _cleanup_handler = setup_spider_logging(
+            crawler.spider, self.settings, log_buffer)
 
         def cleanup_logging(result):
             _cleanup_handler()
@@ -103,6 +201,11 @@ class ScrapyrtCrawlerProcess(CrawlerRunner):
                 pass
 
 
+class WarmCrawlerProcess(ScrapyrtCrawlerProcess):
+
+    crawler_class = WarmScrapyrtCrawler
+
+
 def monkey_patch_and_connect_log_observer(crawler, log_observer):
     """Ugly hack to close log file.
 
@@ -135,13 +238,29 @@ class CrawlManager(object):
         self.log_dir = settings.LOG_DIR
         self.items = []
         self.items_dropped = []
+        self.max_dropped_items = int(settings.MAX_DROPPED_ITEMS)
+        # list of tracebacks with counts, grouped by failure signature
         self.errors = []
+        self.error_groups = {}
+        self.max_errors = int(settings.MAX_ERROR_TRACEBACKS)
         self.max_requests = int(max_requests) if max_requests else None
         self.timeout_limit = int(settings.TIMEOUT_LIMIT)
         self.request_count = 0
         self.debug = settings.DEBUG
         self.crawler_process = None
         self.crawler = None
+        self.warm_crawler = None
+        # set when crawl is running in warm crawler shared with other crawls
+        self.crawl_id = None
+        # id of crawl in log stream shared by many crawls
+        self.log_id = None
+        # LogBuffer with log records of crawl in 'memory' log layout
+        self.log_buffer = None
+        # whether buffered log is returned with results
+        self.include_log = False
+        # crawl logs at DEBUG level regardless of its spider log level
+        self.debug_log = False
+        self.crawl_stats = None
         # callback will be added after instantiation of crawler object
         # because we need to know if spider has method available
         self.callback_name = request_kwargs.pop('callback', None) or 'parse'
@@ -151,8 +270,32 @@ class CrawlManager(object):
             self.request = None
         self.start_requests = start_requests
         self._request_scheduled = False
+        # object with write_item method, items are passed to it
+        # instead of being collected when response is streamed
+        self.stream = None
+        # time.time() when results must be returned, even if crawl
+        # isn't finished
+        self.deadline = None
+        # set when results are returned before crawl is finished
+        self.partial_reason = None
+        # crawl is stopped when spider scrapes that many items
+        self.max_items = None
+        self.items_count = 0
+        # set when crawl is stopped because it has all results it needs
+        self.finish_reason = None
+        # Deferred returned by limit_time, fired with results
+        self.result_dfd = None
 
     def crawl(self, *args, **kwargs):
+        if self.use_warm_crawler(*args, **kwargs):
+            try:
+                self.warm_crawler = self.get_warm_crawler()
+            except KeyError as e:
+                # Spider not found.
+                raise Error('404', message=str(e))
+            dfd = self.warm_crawler.crawl(self)
+            dfd.addCallback(self.return_items)
+            return self.limit_time(dfd)
         self.crawler_process = ScrapyrtCrawlerProcess(
             self.get_project_settings(), self)
         try:
@@ -160,8 +303,120 @@ class CrawlManager(object):
         except KeyError as e:
             # Spider not found.
             raise Error('404', message=str(e))
+        if self.log_buffer is not None:
+            dfd.addBoth(self.save_log)
         dfd.addCallback(self.return_items)
-        return dfd
+        return self.limit_time(dfd)
+
+    def stop(self, reason):
+        """Close spider before crawl is finished, results collected after
+        that are ignored."""
+        self.partial_reason = reason
+        spider = getattr(self.crawler, 'spider', None)
+        if spider is not None:
+            self.close_spider(spider, reason=reason)
+            self.cancel_downloads()
+
+    def finish_early(self, reason):
+        """Close spider when crawl got all results it needs and return
+        them without waiting for spider to close."""
+        self.finish_reason = reason
+        self.close_spider(self.crawler.spider, reason=reason)
+        # downloads are cancelled outside of signal handler calling this
+        reactor.callLater(0, self.cancel_downloads)
+        self.return_early()
+
+    def return_early(self):
+        """Fire Deferred returned by limit_time with results collected
+        so far."""
+        if self.result_dfd is not None and not self.result_dfd.called:
+            self.result_dfd.callback(self.return_items(None))
+
+    def cancel_downloads(self):
+        """Cancel downloads of this crawl that are still in progress,
+        only requests of this crawl are cancelled in warm crawler."""
+        engine = getattr(self.crawler, 'engine', None)
+        tracker = getattr(getattr(engine, 'downloader', None), 'handlers', None)
+        if not isinstance(tracker, DownloadTracker):
+            return
+        if self.warm_crawler is not None:
+            tracker.cancel(lambda request: (
+                get_crawl_id(request) == self.crawl_id))
+        else:
+            tracker.cancel()
+
+    def get_time_limit(self):
+        """Return number of seconds crawl can run and reason of stopping
+        crawl when they pass."""
+        time_limit, reason = self.timeout_limit, 'timeout'
+        if self.deadline is not None:
+            remaining = max(self.deadline - time.time(), 0)
+            if remaining < time_limit:
+                time_limit, reason = remaining, 'deadline_exceeded'
+        return time_limit, reason
+
+    def limit_time(self, dfd):
+        """Return results collected so far if crawl takes too long.
+
+        Spider is closed when time limit is reached, but results are
+        returned right away without waiting for it, e.g. when download
+        is stuck.
+
+        """
+        time_limit, reason = self.get_time_limit()
+
+        def time_limit_reached():
+            self.stop(reason)
+            self.return_early()
+
+        def cancel(_):
+            # results are not needed anymore, e.g. client disconnected
+            if delayed_call.active():
+                delayed_call.cancel()
+            self.stop('client_disconnected')
+            del self.items[:]
+            del self.items_dropped[:]
+            del self.errors[:]
+            self.error_groups.clear()
+
+        result_dfd = self.result_dfd = defer.Deferred(cancel)
+        delayed_call = reactor.callLater(time_limit, time_limit_reached)
+
+        def crawl_finished(result):
+            if delayed_call.active():
+                delayed_call.cancel()
+            if not result_dfd.called:
+                result_dfd.callback(result)
+            elif isinstance(result, Failure):
+                log.err(result, "Crawl failed after time limit was reached")
+
+        dfd.addBoth(crawl_finished)
+        return result_dfd
+
+    def use_warm_crawler(self, *args, **kwargs):
+        """Warm crawler can only be used for crawls that just schedule
+        single request and don't pass arguments to spider."""
+        warm_spiders = settings.WARM_SPIDERS
+        if isinstance(warm_spiders, six.string_types):
+            # passed in command line
+            warm_spiders = warm_spiders.split(',')
+        return bool(
+            self.spider_name in warm_spiders and self.request and
+            not self.start_requests and not args and not kwargs)
+
+    def get_warm_crawler(self):
+        warm_crawler = warm_crawlers.get(self.spider_name)
+        if warm_crawler is None:
+            warm_crawler = WarmCrawler(
+                self.spider_name, self.get_project_settings(shared=True))
+            warm_crawlers[self.spider_name] = warm_crawler
+        return warm_crawler
+
+    @property
+    def stats(self):
+        if self.crawl_stats is not None:
+            return self.crawl_stats
+        return self.crawler.stats
 
     def _get_log_file_path(self):
         log_dir = os.path.join(self.log_dir, self.spider_name)
@@ -171,11 +426,58 @@ class CrawlManager(object):
         filename = datetime.datetime.now().strftime(time_format) + '.log'
         return os.path.join(log_dir, filename)
 
-    def get_project_settings(self):
-        # set logfile for a job
-        log_file = self._get_log_file_path()
-        custom_settings = get_scrapyrt_settings(log_file=log_file)
-        return get_project_settings(custom_settings=custom_settings)
+    def get_project_settings(self, shared=False):
+        """Return settings of crawler.
+
+        :param shared: settings are for crawler shared by many crawls,
+            e.g. warm crawler, its log can't be kept in memory of one crawl
+        """
+        base_settings = project_settings_cache.get(self.spider_name)
+        values = {'LOG_LEVEL': self.get_log_level(shared)}
+        layout = settings.SPIDER_LOG_LAYOUT
+        if layout == 'memory' and not shared:
+            self.log_buffer = LogBuffer(int(settings.SPIDER_LOG_BUFFER_SIZE))
+            values.update({
+                'LOG_FILE': None,
+                'LOG_ENABLED': False,
+            })
+        elif layout in ('spider', 'process'):
+            # crawl writes to log stream shared with other crawls,
+            # its lines are tagged with crawl id
+            self.log_id = get_log_id(next(crawl_ids))
+            values.update({
+                'LOG_FILE': None,
+                'LOG_ENABLED': True,
+                'SCRAPYRT_CRAWL_ID': self.log_id,
+            })
+        else:
+            # set logfile for a job
+            log_file = self._get_log_file_path()
+            values.update({
+                'LOG_FILE': log_file,
+                'LOG_ENABLED': bool(log_file),
+            })
+        return SettingsOverlay(base_settings, values)
+
+    def get_log_level(self, shared=False):
+        """Return log level of crawl, DEBUG if it was requested with debug
+        argument or crawl was sampled, level of spider otherwise.
+
+        Crawler shared by many crawls logs at level of spider.
+        """
+        if not shared and (self.debug_log or sample_debug_log()):
+            return 'DEBUG'
+        return get_spider_log_level(self.spider_name)
+
+    def save_log(self, result):
+        """Write log kept in memory to file if crawl failed or logged
+        SPIDER_LOG_ERROR_THRESHOLD errors."""
+        threshold = int(settings.SPIDER_LOG_ERROR_THRESHOLD)
+        if isinstance(result, Failure) or (
+                threshold and self.log_buffer.errors >= threshold):
+            self.log_buffer.save(
+                self._get_log_file_path(), settings.LOG_ENCODING)
+        return result
 
     @deprecated(use_instead='.crawl()')
     def create_crawler(self, **kwargs):
@@ -194,17 +496,21 @@ class CrawlManager(object):
 
         """
         if spider is self.crawler.spider and self.request and not self._request_scheduled:
-            callback = getattr(self.crawler.spider, self.callback_name)
-            assert callable(callback), 'Invalid callback'
-            self.request = self.request.replace(callback=callback)
-            modify_request = getattr(
-                self.crawler.spider, "modify_realtime_request", None)
-            if callable(modify_request):
-                self.request = modify_request(self.request)
+            self.prepare_request(spider)
             spider.crawler.engine.crawl(self.request, spider)
             self._request_scheduled = True
             raise DontCloseSpider
 
+    def prepare_request(self, spider):
+        """Set callback to request for url given to api and let spider
+        modify it."""
+        callback = getattr(spider, self.callback_name)
+        assert callable(callback), 'Invalid callback'
+        self.request = self.request.replace(callback=callback)
+        modify_request = getattr(spider, "modify_realtime_request", None)
+        if callable(modify_request):
+            self.request = modify_request(self.request)
+
     def handle_scheduling(self, request, spider):
         """Handler of request_scheduled signal.
 
@@ -218,31 +524,61 @@ class CrawlManager(object):
 
     def limit_runtime(self, spider):
         """Stop crawl if it takes too long."""
-        start_time = self.crawler.stats.get_value("start_time")
+        start_time = self.stats.get_value("start_time")
         time_now = datetime.datetime.utcnow()
-        if (time_now - start_time).seconds >= self.timeout_limit:
-            spider.crawler.engine.close_spider(spider, reason="timeout")
+        if (time_now - start_time).total_seconds() >= self.timeout_limit:
+            self.close_spider(spider, reason="timeout")
 
     def limit_requests(self, spider):
         """Stop crawl after reaching max_requests."""
         if self.max_requests and self.max_requests <= self.request_count:
             reason = "stop generating requests, only {} requests allowed".format(
                 self.max_requests)
-            spider.crawler.engine.close_spider(spider, reason=reason)
+            self.close_spider(spider, reason=reason)
         else:
             self.request_count += 1
 
+    def close_spider(self, spider, reason):
+        """Stop crawl. Only requests of this crawl are stopped if spider
+        is running in warm crawler."""
+        if self.warm_crawler is not None:
+            self.warm_crawler.finish(self.crawl_id, reason)
+        else:
+            spider.crawler.engine.close_spider(spider, reason=reason)
+
     def handle_spider_error(self, failure, spider):
         if spider is self.crawler.spider and self.debug:
-            fail_data = failure.getTraceback()
-            self.errors.append(fail_data)
+            signature = get_failure_signature(failure)
+            error = self.error_groups.get(signature)
+            if error is not None:
+                error["count"] += 1
+            elif len(self.errors) < self.max_errors:
+                error = {"traceback": failure.getTraceback(), "count": 1}
+                self.errors.append(error)
+                self.error_groups[signature] = error
+
+    @property
+    def collecting(self):
+        """Whether crawl still collects results."""
+        return self.partial_reason is None and self.finish_reason is None
 
     def get_item(self, item, response, spider):
-        if spider is self.crawler.spider:
-            self.items.append(item)
+        if spider is self.crawler.spider and self.collecting:
+            if self.stream is not None:
+                self.stream.write_item(item)
+            else:
+                self.items.append(item)
+            self.items_count += 1
+            if self.max_items and self.items_count >= self.max_items:
+                self.finish_early('max_items_reached')
 
     def collect_dropped(self, item, response, exception, spider):
-        if spider is self.crawler.spider:
+        if (spider is self.crawler.spider and
+                len(self.items_dropped) < self.max_dropped_items):
+            # only url and status are kept, not to keep response body
+            # in memory until crawl is finished
+            if response is not None:
+                response = {"url": response.url, "status": response.status}
             self.items_dropped.append({
                 "item": item,
                 "exception": str(exception),
@@ -250,7 +586,11 @@ class CrawlManager(object):
             })
 
     def return_items(self, result):
-        stats = self.crawler.stats.get_stats()
+        stats = self.stats.get_stats()
+        if self.finish_reason is not None:
+            # spider can still be closing
+            stats = dict(stats)
+            stats.setdefault('finish_reason', self.finish_reason)
         stats = OrderedDict((k, v) for k, v in sorted(stats.items()))
         results = {
             "items": self.items,
@@ -258,8 +598,13 @@ class CrawlManager(object):
             "stats": stats,
             "spider_name": self.spider_name,
         }
+        if self.partial_reason is not None:
+            results["partial"] = True
+            results["partial_reason"] = self.partial_reason
         if self.debug:
             results["errors"] = self.errors
+        if self.include_log and self.log_buffer is not None:
+            results["log"] = self.log_buffer.get_lines()
         return results
 
     def create_spider_request(self, kwargs):
@@ -276,3 +621,315 @@ class CrawlManager(object):
         msg = msg.format(self.spider_name, url, repr(kwargs))
         log.msg(msg)
         return req
+
+
+WARM_CRAWL_MIDDLEWARE = 'scrapyrt.core.WarmCrawlMiddleware'
+WARM_CRAWL_DUPEFILTER = 'scrapyrt.core.CrawlDupeFilter'
+DEFAULT_DUPEFILTER = 'scrapy.dupefilters.RFPDupeFilter'
+
+# spider name -> running WarmCrawler
+warm_crawlers = {}
+# ids are unique in process, not only in warm crawler
+crawl_ids = itertools.count(1)
+
+
+def get_crawl_id(request_or_response):
+    try:
+        return request_or_response.meta.get(CRAWL_ID_META_KEY)
+    except AttributeError:
+        # failure or response without request
+        return None
+
+
+class WarmCrawlSlot(object):
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.dfd = defer.Deferred()
+        # requests scheduled for this crawl that are not processed yet
+        self.inprogress = 0
+
+
+class WarmCrawler(object):
+    """Long running crawler of a spider shared by many API calls.
+
+    Spider is never closed when idle. Request of every CrawlManager is
+    scheduled in running engine and tagged with crawl id, so that items,
+    dropped items and errors go to CrawlManager they belong to.
+    Crawl is finished when all its requests are processed.
+
+    """
+    start_requests = False
+
+    def __init__(self, spider_name, crawler_settings):
+        self.spider_name = spider_name
+        self.crawler = None
+        self.crawls = {}
+        self._pending = []
+        # crawler writes to log stream, lines of every crawl are
+        # tagged with its own log id there
+        self.log_stream = crawler_settings.get('SCRAPYRT_CRAWL_ID') is not None
+        crawler_settings['SPIDER_MIDDLEWARES'][WARM_CRAWL_MIDDLEWARE] = 0
+        crawler_settings['DOWNLOADER_MIDDLEWARES'][WARM_CRAWL_MIDDLEWARE] = 0
+        # custom dupefilter of project is kept as is
+        if crawler_settings.get('DUPEFILTER_CLASS') == DEFAULT_DUPEFILTER:
+            crawler_settings.set('DUPEFILTER_CLASS', WARM_CRAWL_DUPEFILTER,
+                                 priority='cmdline')
+        self.crawler_process = WarmCrawlerProcess(crawler_settings, self)
+        # sets self.crawler
+        dfd = self.crawler_process.crawl(spider_name)
+        self.crawler.warm_crawler = self
+        self.crawler.signals.connect(self.request_dropped,
+                                     signals.request_dropped)
+        self.crawler.signals.connect(self.request_processed,
+                                     scrapyrt_signals.request_processed)
+        dfd.addBoth(self.crawler_finished)
+
+    @property
+    def is_open(self):
+        engine = self.crawler.engine
+        return (self.crawler.crawling and engine is not None and
+                self.crawler.spider in engine.open_spiders)
+
+    def crawl(self, manager):
+        manager.crawl_id = next(crawl_ids)
+        manager.warm_crawler = self
+        manager.crawler = self.crawler
+        manager.crawl_stats = StatsCollector(self.crawler)
+        manager.crawl_stats.set_value(
+            'start_time', datetime.datetime.utcnow())
+        slot = WarmCrawlSlot(manager)
+        self.crawls[manager.crawl_id] = slot
+        if self.log_stream:
+            manager.log_id = get_log_id(manager.crawl_id)
+            mark_log_stream(self.spider_name, manager.log_id, 'start')
+        if self.is_open:
+            self.schedule(manager)
+        else:
+            # will be scheduled when spider is opened
+            self._pending.append(manager)
+        return slot.dfd
+
+    def schedule(self, manager):
+        if manager.crawl_id not in self.crawls:
+            return
+        spider = self.crawler.spider
+        try:
+            manager.prepare_request(spider)
+        except Exception:
+            # only this crawl fails, other crawls are still scheduled
+            slot = self.crawls.pop(manager.crawl_id)
+            slot.dfd.errback()
+            self._mark_finished(manager)
+            return
+        manager.request.meta[CRAWL_ID_META_KEY] = manager.crawl_id
+        dupefilter = self.get_dupefilter()
+        if dupefilter is not None:
+            dupefilter.open_crawl(manager.crawl_id)
+        manager._request_scheduled = True
+        self.crawler.engine.crawl(manager.request, spider)
+
+    def finish(self, crawl_id, reason):
+        slot = self.crawls.pop(crawl_id, None)
+        if slot is None:
+            return
+        dupefilter = self.get_dupefilter()
+        if dupefilter is not None:
+            dupefilter.close_crawl(crawl_id)
+        stats = slot.manager.crawl_stats
+        stats.set_value('finish_time', datetime.datetime.utcnow())
+        stats.set_value('finish_reason', reason)
+        self._mark_finished(slot.manager)
+        slot.dfd.callback(reason)
+
+    def _mark_finished(self, manager):
+        if self.log_stream:
+            mark_log_stream(self.spider_name, manager.log_id, 'finish')
+
+    def get_dupefilter(self):
+        """Return CrawlDupeFilter of running spider or None."""
+        engine_slot = getattr(self.crawler.engine, 'slot', None)
+        scheduler = getattr(engine_slot, 'scheduler', None)
+        dupefilter = getattr(scheduler, 'df', None)
+        if isinstance(dupefilter, CrawlDupeFilter):
+            return dupefilter
+        return None
+
+    def _get_slot(self, request_or_response):
+        return self.crawls.get(get_crawl_id(request_or_response))
+
+    def get_item(self, item, response, spider):
+        slot = self._get_slot(response)
+        if slot is not None:
+            slot.manager.crawl_stats.inc_value('item_scraped_count')
+            slot.manager.get_item(item, response, spider)
+
+    def collect_dropped(self, item, response, exception, spider):
+        slot = self._get_slot(response)
+        if slot is not None:
+            slot.manager.crawl_stats.inc_value('item_dropped_count')
+            slot.manager.collect_dropped(item, response, exception, spider)
+
+    def handle_spider_error(self, failure, response, spider):
+        slot = self._get_slot(response)
+        if slot is not None:
+            slot.manager.crawl_stats.inc_value(
+                'spider_exceptions/{}'.format(failure.value.__class__.__name__))
+            slot.manager.handle_spider_error(failure, spider)
+
+    def handle_scheduling(self, request, spider):
+        slot = self._get_slot(request)
+        if slot is not None:
+            slot.inprogress += 1
+            slot.manager.crawl_stats.inc_value('scheduler/enqueued')
+            slot.manager.handle_scheduling(request, spider)
+
+    def request_dropped(self, request, spider):
+        self._request_done(request)
+
+    def request_processed(self, request, spider):
+        self._request_done(request)
+
+    def _request_done(self, request):
+        slot = self._get_slot(request)
+        if slot is None:
+            return
+        slot.inprogress -= 1
+        if slot.inprogress <= 0:
+            self.finish(slot.manager.crawl_id, 'finished')
+
+    def spider_idle(self, spider):
+        pending, self._pending = self._pending, []
+        for manager in pending:
+            self.schedule(manager)
+        raise DontCloseSpider
+
+    def crawler_finished(self, result):
+        if warm_crawlers.get(self.spider_name) is self:
+            del warm_crawlers[self.spider_name]
+        reason = self.crawler.stats.get_value(
+            'finish_reason', 'warm crawler stopped')
+        for crawl_id in list(self.crawls):
+            self.finish(crawl_id, reason)
+        return result
+
+
+class BatchCrawler(WarmCrawler):
+    """Crawler running requests of many CrawlManagers at once.
+
+    Unlike WarmCrawler spider is closed as soon as all crawls are finished.
+    Duplicate requests are filtered per crawl, so that results of every
+    request don't depend on other requests of the batch.
+
+    """
+
+    def spider_idle(self, spider):
+        pending, self._pending = self._pending, []
+        for manager in pending:
+            self.schedule(manager)
+        if self.crawls:
+            raise DontCloseSpider
+
+
+class BatchCrawlManager(object):
+    """Runs crawls of many requests of one spider in single crawler, so
+    that they share downloader slots and connections.
+
+    Every request is crawled by its own CrawlManager, items, stats and
+    errors are collected separately for each of them.
+
+    """
+
+    def __init__(self, spider_name, requests_kwargs, max_requests=None,
+                 max_items=None):
+        self.spider_name = spider_name
+        crawl_manager_cls = load_object(settings.CRAWL_MANAGER)
+        self.managers = [
+            crawl_manager_cls(spider_name, request_kwargs, max_requests)
+            for request_kwargs in requests_kwargs
+        ]
+        for manager in self.managers:
+            manager.max_items = max_items
+        self.batch_crawler = None
+
+    def crawl(self):
+        """Return Deferred with list of (success, result) tuples,
+        one for each request, see DeferredList."""
+        try:
+            self.batch_crawler = BatchCrawler(
+                self.spider_name,
+                self.managers[0].get_project_settings(shared=True))
+        except KeyError as e:
+            # Spider not found.
+            raise Error('404', message=str(e))
+        dfds = []
+        for manager in self.managers:
+            dfd = self.batch_crawler.crawl(manager)
+            dfd.addCallback(manager.return_items)
+            dfds.append(manager.limit_time(dfd))
+        return defer.DeferredList(dfds, consumeErrors=True)
+
+
+class CrawlDupeFilter(RFPDupeFilter):
+    """Dupefilter of crawler shared by many crawls.
+
+    Fingerprints are kept separately for every crawl and forgotten when
+    crawl is finished, so that crawl gets the same requests as if it was
+    run in its own crawler. Requests without crawl id are filtered as
+    usual.
+
+    """
+
+    def __init__(self, path=None, debug=False):
+        super(CrawlDupeFilter, self).__init__(path, debug)
+        # crawl id -> set of fingerprints
+        self.crawl_fingerprints = {}
+
+    def open_crawl(self, crawl_id):
+        self.crawl_fingerprints.setdefault(crawl_id, set())
+
+    def close_crawl(self, crawl_id):
+        self.crawl_fingerprints.pop(crawl_id, None)
+
+    def request_seen(self, request):
+        crawl_id = get_crawl_id(request)
+        if crawl_id is None:
+            return super(CrawlDupeFilter, self).request_seen(request)
+        fingerprints = self.crawl_fingerprints.get(crawl_id)
+        if fingerprints is None:
+            # crawl is finished, its request would be ignored anyway
+            return True
+        fp = self.request_fingerprint(request)
+        if fp in fingerprints:
+            return True
+        fingerprints.add(fp)
+
+
+class WarmCrawlMiddleware(object):
+    """Spider and downloader middleware used by warm crawlers.
+
+    Passes crawl id from response to requests generated by spider and
+    ignores requests of crawls that are already finished.
+
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_spider_output(self, response, result, spider):
+        crawl_id = get_crawl_id(response)
+        for request_or_item in result:
+            if crawl_id is not None and isinstance(request_or_item, Request):
+                request_or_item.meta.setdefault(CRAWL_ID_META_KEY, crawl_id)
+            yield request_or_item
+
+    def process_request(self, request, spider):
+        crawl_id = get_crawl_id(request)
+        warm_crawler = getattr(self.crawler, 'warm_crawler', None)
+        if crawl_id is not None and (
+                warm_crawler is None or crawl_id not in warm_crawler.crawls):
+            raise IgnoreRequest("Crawl {} is finished".format(crawl_id))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Crawls running in background, results are fetched later by job id."""
+from collections import OrderedDict
+import time
+import uuid
+
+from twisted.internet.defer import CancelledError
+from twisted.web.error import Error
+
+from . import log
+from .conf import settings
+
+
+class Job(object):
+    """Crawl of CrawlManager running in background."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, manager):
+        self.id = uuid.uuid4().hex
+        self.manager = manager
+        self.spider_name = manager.spider_name
+        self.status = self.PENDING
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        # Deferred of crawl, cancelled to remove pending job from
+        # admission queue
+        self.crawl_dfd = None
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def start(self, *args, **kwargs):
+        """Start crawl, called when crawl is admitted."""
+        if self.status == self.CANCELLED:
+            return None
+        self.status = self.RUNNING
+        return self.manager.crawl(*args, **kwargs)
+
+    def cancel(self):
+        if self.done:
+            return
+        status = self.status
+        self.status = self.CANCELLED
+        if status == self.RUNNING:
+            spider = getattr(self.manager.crawler, 'spider', None)
+            if spider is not None:
+                self.manager.close_spider(spider, reason=self.CANCELLED)
+        elif self.crawl_dfd is not None:
+            # frees its place in admission queue
+            self.crawl_dfd.cancel()
+
+    def set_result(self, result):
+        """Set response of finished crawl."""
+        self.result = result
+        if self.status != self.CANCELLED:
+            self.status = self.FINISHED
+        self._finish()
+
+    def set_error(self, failure):
+        if self.status == self.CANCELLED and failure.check(CancelledError):
+            self._finish()
+            return
+        exception = failure.value
+        if isinstance(exception, Error):
+            code = int(exception.status)
+            message = exception.message
+        else:
+            log.err(failure)
+            code = 500
+            message = failure.getErrorMessage()
+        self.error = {'code': code, 'message': message}
+        if self.status != self.CANCELLED:
+            self.status = self.FAILED
+        self._finish()
+
+    def _finish(self):
+        self.finished = time.time()
+        # manager keeps crawler and all its state
+        self.manager = None
+        self.crawl_dfd = None
+
+
+class JobStore(object):
+    """Bounded store of jobs.
+
+    Finished jobs are removed after JOB_RESULT_TTL seconds, and oldest
+    finished jobs are removed when store is full. New jobs are rejected
+    if store is full of running jobs.
+
+    """
+
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.max_jobs = int(settings.JOB_STORE_SIZE)
+        self.ttl = float(settings.JOB_RESULT_TTL)
+
+    def add(self, job):
+        self.remove_expired()
+        if len(self.jobs) >= self.max_jobs:
+            self._evict_finished()
+        if len(self.jobs) >= self.max_jobs:
+            raise Error('503', message="Too many jobs, try again later")
+        self.jobs[job.id] = job
+
+    def get(self, job_id):
+        self.remove_expired()
+        return self.jobs.get(job_id)
+
+    def remove(self, job_id):
+        return self.jobs.pop(job_id, None)
+
+    def remove_expired(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.done and now - job.finished >= self.ttl:
+                del self.jobs[job_id]
+
+    def _evict_finished(self):
+        for job_id, job in self.jobs.items():
+            if job.done:
+                del self.jobs[job_id]
+                return
+
+    def get_stats(self):
+        stats = dict((status, 0) for status in (
+            Job.PENDING, Job.RUNNING, Job.FINISHED, Job.FAILED,
+            Job.CANCELLED))
+        for job in self.jobs.values():
+            stats[job.status] += 1
+        stats['total'] = len(self.jobs)
+        return stats
+
+    def __len__(self):
+        return len(self.jobs)
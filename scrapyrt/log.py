@@ -1,18 +1,33 @@
 # -*- coding: utf-8 -*-
+from collections import deque
+from contextlib import contextmanager
+import datetime
+import itertools
 import logging
 import os
+import re
 import sys
 from logging.config import dictConfig
 
+import six
+
 from scrapy.settings import Settings
-from scrapy.utils.log import DEFAULT_LOGGING, TopLevelFormatter
+from scrapy.utils.log import (
+    DEFAULT_LOGGING, LogCounterHandler, TopLevelFormatter
+)
 from twisted.python import log
 from twisted.python.log import startLoggingWithObserver
 from twisted.python.logfile import DailyLogFile
 
 from .conf import settings as scrapyrt_settings
+from .logqueue import log_writer, QueuedFile
 from .utils import to_bytes
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 DEBUG = logging.DEBUG
 INFO = logging.INFO
 WARNING = logging.WARNING
@@ -36,6 +51,30 @@ def err(_stuff=None, _why=None, **kwargs):
     log.err(_stuff, _why, **kwargs)
 
 
+def get_spider_log_level(spider_name):
+    """Return log level of spider from SPIDER_LOG_LEVELS, or
+    SPIDER_LOG_LEVEL if it's not set for spider."""
+    levels = scrapyrt_settings.SPIDER_LOG_LEVELS or {}
+    if isinstance(levels, six.string_types):
+        # passed in command line, e.g. spider1:INFO,spider2:WARNING
+        levels = dict(level.split(':', 1)
+                      for level in levels.split(',') if level)
+    return levels.get(spider_name, scrapyrt_settings.SPIDER_LOG_LEVEL)
+
+
+# number of crawls that chose whether they log at DEBUG level
+_debug_log_samples = itertools.count()
+
+
+def sample_debug_log():
+    """Return True for one of every SPIDER_LOG_DEBUG_SAMPLING crawls, that
+    should log at DEBUG level."""
+    sampling = int(scrapyrt_settings.SPIDER_LOG_DEBUG_SAMPLING or 0)
+    if sampling <= 0:
+        return False
+    return next(_debug_log_samples) % sampling == 0
+
+
 class ScrapyrtFileLogObserver(log.FileLogObserver):
 
     def __init__(self, f, encoding='utf-8'):
@@ -75,19 +114,369 @@ class ScrapyrtFileLogObserver(log.FileLogObserver):
         log.FileLogObserver.emit(self, eventDict)
 
 
-class SpiderFilter(logging.Filter):
-    """Filter messages from other spiders and undefined loggers.
+class SpiderLogDispatcher(logging.Handler):
+    """Single root handler passing records of spiders to handlers of their
+    crawls, so that cost of logging doesn't grow with number of running
+    crawls.
 
-    Accept messages that have 'spider' key in extra and it matches given spider.
+    Records without 'spider' in extra or of spiders without registered
+    handler are ignored. Records passed to handler are counted in
+    ``log_count/<level>`` stats of spider's crawler, instead of
+    LogCounterHandler Scrapy adds for every crawler, see
+    remove_log_counter_handler.
 
     """
 
-    def __init__(self, spider):
-        self.spider = spider
+    def __init__(self):
+        logging.Handler.__init__(self)
+        # spider -> handler
+        self.handlers = {}
+
+    def register(self, spider, handler):
+        self.handlers[spider] = handler
+
+    def unregister(self, spider, handler):
+        if self.handlers.get(spider) is handler:
+            del self.handlers[spider]
 
-    def filter(self, record):
+    def handle(self, record):
         spider = getattr(record, 'spider', None)
-        return spider and spider is self.spider
+        if spider is None:
+            return False
+        handler = self.handlers.get(spider)
+        if handler is None:
+            return False
+        if record.levelno >= handler.level:
+            handler.handle(record)
+            crawler = getattr(spider, 'crawler', None)
+            if crawler is not None and crawler.stats is not None:
+                crawler.stats.inc_value(
+                    'log_count/{}'.format(record.levelname), spider=spider)
+        return True
+
+    def emit(self, record):
+        self.handle(record)
+
+
+def remove_log_counter_handler(crawler):
+    """Remove LogCounterHandler added to root logger by Crawler.__init__.
+
+    Every record would pass through one such handler per running crawl,
+    records of spiders are counted by SpiderLogDispatcher instead.
+
+    Handler is found on root logger by its crawler attribute. If there's
+    none, e.g. other Scrapy version adds it differently, warning is logged
+    once, because records of spiders can be counted twice then.
+
+    """
+    global _log_counter_handler_missing
+    handlers = [handler for handler in logging.root.handlers
+                if isinstance(handler, LogCounterHandler) and
+                getattr(handler, 'crawler', None) is crawler]
+    for handler in handlers:
+        logging.root.removeHandler(handler)
+    if not handlers and not _log_counter_handler_missing:
+        _log_counter_handler_missing = True
+        msg("LogCounterHandler of crawler isn't found on root logger, "
+            "log records of spiders can be counted twice", level=WARNING)
+
+
+# set when remove_log_counter_handler didn't find handler to remove
+_log_counter_handler_missing = False
+
+
+spider_log_dispatcher = SpiderLogDispatcher()
+
+
+def get_spider_log_dispatcher():
+    """Return dispatcher of spider logs, added to root logger when it's
+    used first time."""
+    if spider_log_dispatcher not in logging.root.handlers:
+        logging.root.addHandler(spider_log_dispatcher)
+    return spider_log_dispatcher
+
+
+class LogStream(object):
+    """Append-only log file shared by many crawls and rotated by size.
+
+    Every line is prefixed with id of crawl it belongs to. Files are named
+    ``<name>.<number>.log`` and never renamed when rotated, every one of
+    them has ``<name>.<number>.index`` file with offsets at which crawls
+    started and finished, so that lines of crawl can be found without
+    reading whole stream, see iter_crawl_log.
+
+    """
+
+    def __init__(self, directory, name, max_bytes=0, backup_count=0,
+                 encoding='utf-8'):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.encoding = encoding
+        self.number = max(get_log_stream_numbers(directory, name) or [1])
+        self.file = None
+        self.index_file = None
+
+    def get_path(self, number, extension='log'):
+        return os.path.join(self.directory, '{}.{}.{}'.format(
+            self.name, number, extension))
+
+    def open(self):
+        if self.file is None:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            self.file = open(self.get_path(self.number), 'ab')
+            self.file.seek(0, os.SEEK_END)
+            self.index_file = open(self.get_path(self.number, 'index'), 'ab')
+        return self.file
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.index_file.close()
+            self.file = self.index_file = None
+
+    def write(self, crawl_id, text, flush=True):
+        f = self.open()
+        prefix = u'[{}] '.format(crawl_id)
+        lines = [prefix + line for line in text.splitlines()]
+        f.write(u'\n'.join(lines).encode(self.encoding, 'replace') + b'\n')
+        if flush:
+            f.flush()
+        if self.max_bytes and f.tell() >= self.max_bytes:
+            self.rotate()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def mark(self, crawl_id, event):
+        """Write offset at which crawl starts or finishes to index.
+
+        Other processes can append to the same stream (``spider`` layout
+        with many workers), so position of own file object can be behind
+        end of file. Offset is taken at end of file while it's locked,
+        after own buffered lines are written.
+
+        """
+        f = self.open()
+        f.flush()
+        with lock_file(f):
+            f.seek(0, os.SEEK_END)
+            line = u'{}\t{}\t{}\t{}\n'.format(
+                crawl_id, event, f.tell(),
+                datetime.datetime.utcnow().isoformat())
+            self.index_file.write(line.encode('utf-8'))
+            self.index_file.flush()
+
+    def rotate(self):
+        self.close()
+        self.number += 1
+        for number in get_log_stream_numbers(self.directory, self.name):
+            if number <= self.number - self.backup_count - 1:
+                for extension in ('log', 'index'):
+                    path = self.get_path(number, extension)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+
+@contextmanager
+def lock_file(f):
+    """Hold exclusive lock of file shared with other processes, file
+    isn't locked where fcntl isn't available."""
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def get_log_stream_numbers(directory, name):
+    """Return sorted numbers of existing files of log stream."""
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(r'^{}\.(\d+)\.log$'.format(re.escape(name)))
+    numbers = []
+    for filename in os.listdir(directory):
+        match = pattern.match(filename)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+
+def iter_crawl_log(directory, name, crawl_id):
+    """Yield lines of crawl from log stream, using its index to read only
+    part of stream that was written while crawl was running."""
+    crawl_id = str(crawl_id)
+    prefix = '[{}] '.format(crawl_id).encode('utf-8')
+    start = end = None
+    numbers = get_log_stream_numbers(directory, name)
+    for number in numbers:
+        index_path = os.path.join(
+            directory, '{}.{}.index'.format(name, number))
+        if not os.path.exists(index_path):
+            continue
+        with open(index_path, 'rb') as f:
+            for line in f:
+                fields = line.decode('utf-8').split('\t')
+                if fields[0] != crawl_id:
+                    continue
+                if fields[1] == 'start':
+                    start = (number, int(fields[2]))
+                elif fields[1] == 'finish':
+                    end = (number, int(fields[2]))
+    if start is None:
+        return
+    for number in numbers:
+        if number < start[0] or (end is not None and number > end[0]):
+            continue
+        path = os.path.join(directory, '{}.{}.log'.format(name, number))
+        limit = end[1] if end is not None and number == end[0] else None
+        with open(path, 'rb') as f:
+            if number == start[0]:
+                f.seek(start[1])
+            while limit is None or f.tell() < limit:
+                line = f.readline()
+                if not line:
+                    break
+                if line.startswith(prefix):
+                    yield line[len(prefix):].rstrip(b'\n')
+
+
+# name of log stream -> LogStream
+log_streams = {}
+
+
+def get_log_stream(layout, spider_name):
+    """Return log stream crawls of spider write to in given
+    SPIDER_LOG_LAYOUT."""
+    log_dir = scrapyrt_settings.LOG_DIR
+    if layout == 'spider':
+        directory, name = os.path.join(log_dir, spider_name), spider_name
+    elif layout == 'process':
+        directory, name = log_dir, 'process-{}'.format(os.getpid())
+    else:
+        raise ValueError("Unknown SPIDER_LOG_LAYOUT: {}".format(layout))
+    key = (directory, name)
+    stream = log_streams.get(key)
+    if stream is None:
+        stream = LogStream(
+            directory, name,
+            max_bytes=int(scrapyrt_settings.SPIDER_LOG_MAX_BYTES),
+            backup_count=int(scrapyrt_settings.SPIDER_LOG_BACKUP_COUNT),
+            encoding=scrapyrt_settings.LOG_ENCODING)
+        log_streams[key] = stream
+    return stream
+
+
+# crawls sharing one crawler (warm crawlers and batches) tag their
+# requests with crawl id under this meta key, see scrapyrt.core.WarmCrawler
+CRAWL_ID_META_KEY = 'scrapyrt_crawl_id'
+
+
+def get_log_id(crawl_id):
+    """Return id lines of crawl are tagged with in log stream, it's unique
+    among processes writing to the same stream."""
+    return '{}-{}'.format(os.getpid(), crawl_id)
+
+
+def get_record_log_id(record):
+    """Return log id of crawl that request or response passed in record
+    arguments belongs to, e.g. of 'Crawled (200) <GET ...>' record,
+    or None."""
+    args = record.args
+    if isinstance(args, dict):
+        args = args.values()
+    elif not isinstance(args, tuple):
+        return None
+    for arg in args:
+        # Response.meta raises AttributeError if there is no request
+        meta = getattr(arg, 'meta', None)
+        if isinstance(meta, dict) and CRAWL_ID_META_KEY in meta:
+            return get_log_id(meta[CRAWL_ID_META_KEY])
+    return None
+
+
+def mark_log_stream(spider_name, log_id, event):
+    """Write offset at which crawl starts or finishes to index of log
+    stream of spider, in log writer thread if it's enabled."""
+    log_stream = get_log_stream(scrapyrt_settings.SPIDER_LOG_LAYOUT,
+                                spider_name)
+    log_writer.write(log_stream.mark, (log_id, event), droppable=False)
+
+
+class LogStreamHandler(logging.Handler):
+    """Writes records of crawl to shared log stream.
+
+    Records about request or response of crawl that shares crawler with
+    other crawls are tagged with log id of that crawl, other records with
+    id of crawler.
+
+    """
+
+    def __init__(self, stream, crawl_id):
+        logging.Handler.__init__(self)
+        self.stream = stream
+        self.crawl_id = crawl_id
+
+    def emit(self, record):
+        try:
+            crawl_id = get_record_log_id(record) or self.crawl_id
+            log_writer.write(
+                self.stream.write, (crawl_id, self.format(record), False),
+                self.stream)
+        except Exception:
+            self.handleError(record)
+
+
+class LogBuffer(logging.Handler):
+    """Keeps last formatted records of crawl in memory, so that log is
+    written to file only when it's needed."""
+
+    def __init__(self, capacity):
+        logging.Handler.__init__(self)
+        self.lines = deque(maxlen=capacity)
+        # number of records that were pushed out of full buffer
+        self.dropped = 0
+        self.errors = 0
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(line)
+        if record.levelno >= ERROR:
+            self.errors += 1
+
+    def get_lines(self):
+        lines = list(self.lines)
+        if self.dropped:
+            lines.insert(0, u'[{} earlier log records dropped]'.format(
+                self.dropped))
+        return lines
+
+    def save(self, path, encoding='utf-8'):
+        """Write buffered records to file, in log writer thread if it's
+        enabled."""
+        log_writer.write(write_log_file, (path, self.get_lines(), encoding),
+                         droppable=False)
+
+
+def write_log_file(path, lines, encoding='utf-8'):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'ab') as f:
+        for line in lines:
+            f.write(line.encode(encoding, 'replace') + b'\n')
 
 
 def setup_logging():
@@ -100,6 +489,8 @@ def setup_logging():
         )
     else:
         logfile = sys.stderr
+    if log_writer.enabled:
+        logfile = QueuedFile(logfile)
     observer = ScrapyrtFileLogObserver(logfile, scrapyrt_settings.LOG_ENCODING)
     startLoggingWithObserver(observer.emit, setStdout=False)
 
@@ -114,7 +505,7 @@ def setup_logging():
     dictConfig(DEFAULT_LOGGING)
 
 
-def setup_spider_logging(spider, settings):
+def setup_spider_logging(spider, settings, handler=None):
     """Initialize and configure default loggers
 
     Copied from Scrapy and updated, because version from Scrapy:
@@ -126,6 +517,8 @@ def setup_spider_logging(spider, settings):
 
     so there's no way to reuse it.
 
+    :param handler: handler records of spider are passed to, e.g.
+        LogBuffer, by default it's created from LOG_FILE setting.
     :return: method that should be called to cleanup handler.
 
     """
@@ -136,32 +529,44 @@ def setup_spider_logging(spider, settings):
     # if settings.getbool('LOG_STDOUT'):
     #     sys.stdout = StreamLogger(logging.getLogger('stdout'))
     filename = settings.get('LOG_FILE')
-    if filename:
-        encoding = settings.get('LOG_ENCODING')
-        handler = logging.FileHandler(filename, encoding=encoding)
-    elif settings.getbool('LOG_ENABLED'):
-        handler = logging.StreamHandler()
-    else:
-        handler = logging.NullHandler()
+    # set when crawls write to log stream shared with other crawls
+    crawl_id = settings.get('SCRAPYRT_CRAWL_ID')
+    log_stream = None
+    if handler is None:
+        if crawl_id is not None:
+            log_stream = get_log_stream(
+                scrapyrt_settings.SPIDER_LOG_LAYOUT, spider.name)
+            handler = LogStreamHandler(log_stream, crawl_id)
+            log_writer.write(log_stream.mark, (crawl_id, 'start'),
+                             droppable=False)
+        elif filename:
+            encoding = settings.get('LOG_ENCODING')
+            handler = logging.FileHandler(filename, encoding=encoding)
+            if log_writer.enabled:
+                handler.stream = QueuedFile(handler.stream)
+        elif settings.getbool('LOG_ENABLED'):
+            handler = logging.StreamHandler()
+        else:
+            handler = logging.NullHandler()
     formatter = logging.Formatter(
         fmt=settings.get('LOG_FORMAT'),
         datefmt=settings.get('LOG_DATEFORMAT')
     )
     handler.setFormatter(formatter)
     handler.setLevel(settings.get('LOG_LEVEL'))
-    filters = [
-        TopLevelFormatter(['scrapy']),
-        SpiderFilter(spider),
-    ]
-    for _filter in filters:
-        handler.addFilter(_filter)
-    logging.root.addHandler(handler)
+    handler.addFilter(TopLevelFormatter(['scrapy']))
+    dispatcher = get_spider_log_dispatcher()
+    dispatcher.register(spider, handler)
 
     _cleanup_functions = [
-        lambda: [handler.removeFilter(f) for f in filters],
-        lambda: logging.root.removeHandler(handler),
+        lambda: dispatcher.unregister(spider, handler),
         handler.close,
     ]
+    if log_stream is not None:
+        # stream stays open for next crawls
+        _cleanup_functions.append(
+            lambda: log_writer.write(log_stream.mark, (crawl_id, 'finish'),
+                                     droppable=False))
 
     def cleanup():
         for func in _cleanup_functions:
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Log writing in background thread.
+
+When LOG_QUEUE_SIZE is set, log files aren't written by reactor thread.
+Formatted records are put to bounded queue, background thread writes them
+and flushes files after batch of writes. When queue is full records are
+dropped or reactor thread waits for free space, depending on
+LOG_QUEUE_FULL_POLICY. Tasks that aren't records, e.g. closing of file,
+are never dropped.
+
+"""
+import os
+import sys
+import threading
+import traceback
+
+from six.moves import queue
+
+from .conf import settings
+
+
+# files are flushed when queue is empty or after that many writes
+FLUSH_EVERY = 1000
+# seconds to wait for queued records to be written when process stops
+STOP_TIMEOUT = 5.0
+
+_STOP = object()
+
+
+class LogWriter(object):
+    """Calls functions writing logs in background thread."""
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def queue_size(self):
+        return int(settings.LOG_QUEUE_SIZE)
+
+    @property
+    def enabled(self):
+        return self.queue_size > 0
+
+    @property
+    def block(self):
+        policy = settings.LOG_QUEUE_FULL_POLICY
+        if policy not in ('drop', 'block'):
+            raise ValueError(
+                "Unknown LOG_QUEUE_FULL_POLICY: {}".format(policy))
+        return policy == 'block'
+
+    @property
+    def running(self):
+        # thread isn't running in process forked after it was started
+        return (self.thread is not None and self.thread.is_alive() and
+                self.pid == os.getpid())
+
+    def start(self):
+        if not self.running:
+            self.queue = queue.Queue(self.queue_size)
+            self.pid = os.getpid()
+            self.thread = threading.Thread(
+                target=self._run, name='scrapyrt-log-writer')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Write queued records and stop thread."""
+        if not self.running:
+            return
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def write(self, func, args=(), flushable=None, droppable=True):
+        """Call func with args in background thread, flushable object is
+        flushed after batch of writes. Function is called right away if
+        queue is disabled. When queue is full tasks that aren't droppable
+        wait for free space regardless of LOG_QUEUE_FULL_POLICY."""
+        if not self.enabled:
+            func(*args)
+            if flushable is not None:
+                flushable.flush()
+            return
+        self.start()
+        try:
+            self.queue.put((func, args, flushable),
+                           self.block or not droppable)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            pending = set()
+            while task is not _STOP:
+                self._call(task, pending)
+                if self.written % FLUSH_EVERY == 0:
+                    self._flush(pending)
+                try:
+                    task = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._flush(pending)
+            if task is _STOP:
+                return
+
+    def _call(self, task, pending):
+        func, args, flushable = task
+        try:
+            func(*args)
+        except Exception:
+            # can't be logged, logging is what failed
+            traceback.print_exc(file=sys.stderr)
+        self.written += 1
+        if flushable is not None:
+            pending.add(flushable)
+
+    def _flush(self, pending):
+        for flushable in pending:
+            try:
+                flushable.flush()
+            except ValueError:
+                # file was closed
+                pass
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+        pending.clear()
+
+    def get_stats(self):
+        return {
+            'queued': self.queue.qsize() if self.running else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+
+log_writer = LogWriter()
+
+
+class QueuedFile(object):
+    """File-like object writing to file in log writer thread."""
+
+    def __init__(self, f, writer=None):
+        self.file = f
+        self.writer = writer or log_writer
+
+    def write(self, data):
+        self.writer.write(self.file.write, (data,), self.file)
+
+    def flush(self):
+        # file is flushed by log writer
+        pass
+
+    def close(self):
+        self.writer.write(self.file.close, droppable=False)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
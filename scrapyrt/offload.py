@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""CPU-bound spider callbacks running in pool of processes.
+
+Callbacks marked with ``cpu_bound`` decorator or listed in spider's
+``cpu_bound_callbacks`` attribute are called in separate process, so that
+parsing of big responses doesn't block reactor and other crawls. Response
+is sent to pool process, where callback is called on spider instance
+created there with arguments of crawl, and items and requests it returns
+are sent back.
+
+"""
+from collections import OrderedDict
+import multiprocessing
+import traceback
+import types
+
+from scrapy.http import Request
+from scrapy.utils.misc import load_object
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+from scrapy.utils.spider import iterate_spider_output
+from six.moves import cPickle as pickle
+from twisted.internet import defer
+
+from . import log
+from .conf import settings
+from .conf.spider_settings import project_settings_cache, SettingsOverlay
+
+
+def cpu_bound(func):
+    """Mark spider callback to be called in pool of processes."""
+    func.cpu_bound = True
+    return func
+
+
+class OffloadedCallbackError(Exception):
+    """Callback failed in pool process, message contains its traceback."""
+
+
+def get_cpu_bound_callbacks(spider):
+    names = set(getattr(spider, 'cpu_bound_callbacks', ()))
+    spidercls = type(spider)
+    for name in dir(spidercls):
+        if getattr(getattr(spidercls, name, None), 'cpu_bound', False):
+            names.add(name)
+    return sorted(names)
+
+
+def response_to_dict(response, spider):
+    response_cls = type(response)
+    return {
+        'cls': '{}.{}'.format(response_cls.__module__, response_cls.__name__),
+        'url': response.url,
+        'status': response.status,
+        'headers': dict(response.headers),
+        'body': response.body,
+        'flags': response.flags,
+        'request': request_to_dict(response.request, spider),
+    }
+
+
+def response_from_dict(d, spider):
+    response_cls = load_object(d['cls'])
+    request = request_from_dict(d['request'], spider)
+    return response_cls(url=d['url'], status=d['status'],
+                        headers=d['headers'], body=d['body'],
+                        flags=d['flags'], request=request)
+
+
+# number of spider instances kept by pool process, spider is created for
+# every distinct combination of spider arguments
+MAX_SPIDERS = 100
+
+# crawlers and spider instances of pool process
+_crawlers = {}
+_spiders = OrderedDict()
+
+
+def _get_crawler(spider_name):
+    crawler = _crawlers.get(spider_name)
+    if crawler is None:
+        # scrapy.crawler imports reactor, which mustn't be imported
+        # before workers are forked
+        from scrapy.crawler import Crawler
+        spider_loader = project_settings_cache.get_spider_loader()
+        spidercls = spider_loader.load(spider_name)
+        crawler = Crawler(spidercls, SettingsOverlay(
+            project_settings_cache.get(spider_name)))
+        log.remove_log_counter_handler(crawler)
+        _crawlers[spider_name] = crawler
+    return crawler
+
+
+def _get_spider(spider_name, spider_args=((), {})):
+    """Return spider created with its crawler and crawl arguments, so
+    that callbacks can use spider.settings, spider.crawler and attributes
+    set from arguments the same way as in server process."""
+    args, kwargs = spider_args
+    key = pickle.dumps((spider_name, args, sorted(kwargs.items())))
+    spider = _spiders.pop(key, None)
+    if spider is None:
+        crawler = _get_crawler(spider_name)
+        spider = crawler.spidercls.from_crawler(crawler, *args, **kwargs)
+    _spiders[key] = spider
+    while len(_spiders) > MAX_SPIDERS:
+        _spiders.popitem(last=False)
+    return spider
+
+
+def _call_callback(task):
+    """Called in pool process with pickled (spider_name, callback_name,
+    response_data, spider_args) task, returns pickled (success, output)
+    tuple. Errors are returned too, so that pool reports them the same
+    way on Python 2 and 3, which have different pool error handling."""
+    try:
+        spider_name, callback_name, response_data, spider_args = (
+            pickle.loads(task))
+        spider = _get_spider(spider_name, spider_args)
+        response = response_from_dict(response_data, spider)
+        output = []
+        result = getattr(spider, callback_name)(response)
+        for obj in iterate_spider_output(result):
+            if isinstance(obj, Request):
+                output.append((True, request_to_dict(obj, spider)))
+            else:
+                output.append((False, obj))
+        return pickle.dumps((True, output), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return pickle.dumps((False, traceback.format_exc()),
+                            pickle.HIGHEST_PROTOCOL)
+
+
+class CallbackPool(object):
+    """Pool of CALLBACK_POOL_SIZE processes calling CPU-bound callbacks."""
+
+    def __init__(self):
+        self._pool = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def processes(self):
+        return int(settings.CALLBACK_POOL_SIZE)
+
+    @property
+    def enabled(self):
+        return self.processes > 0
+
+    def start(self):
+        """Start pool processes.
+
+        Pool should be started before reactor is running, processes are
+        forked and share project and spiders loaded by server.
+
+        """
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.processes)
+            log.msg("Started pool of {} callback processes".format(
+                self.processes))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    @property
+    def timeout(self):
+        return float(settings.CALLBACK_POOL_TIMEOUT)
+
+    def offload_callbacks(self, spider, args=(), kwargs=None):
+        """Replace CPU-bound callbacks of spider instance with functions
+        calling them in pool. args and kwargs are arguments spider was
+        created with, spider of pool process gets the same arguments."""
+        spider_args = (tuple(args), dict(kwargs or {}))
+        for name in get_cpu_bound_callbacks(spider):
+            callback = self._make_callback(name, spider_args)
+            setattr(spider, name, types.MethodType(callback, spider))
+
+    def _make_callback(self, name, spider_args):
+        pool = self
+
+        def callback(spider, response):
+            return pool.call(spider, name, response, spider_args)
+        # requests are serialized with name of their callback
+        callback.__name__ = str(name)
+        return callback
+
+    def call(self, spider, callback_name, response, spider_args=((), {})):
+        """Call spider callback in pool, return Deferred fired with list
+        of items and requests returned by callback.
+
+        Deferred fails with OffloadedCallbackError if callback fails,
+        arguments can't be sent to pool or result isn't received in
+        CALLBACK_POOL_TIMEOUT seconds, e.g. because pool process died.
+
+        """
+        # task is pickled here, pool fails to report pickling errors
+        # on Python 2
+        try:
+            task = pickle.dumps(
+                (spider.name, callback_name,
+                 response_to_dict(response, spider), spider_args),
+                pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:
+            self.failed += 1
+            return defer.fail(OffloadedCallbackError("{}: {}".format(
+                exc.__class__.__name__, exc)))
+        dfd = defer.Deferred()
+
+        # reactor isn't imported at module level, as server imports this
+        # module before workers are forked
+        from twisted.internet import reactor
+
+        def done(result):
+            reactor.callFromThread(self._finished, result, dfd, spider)
+
+        self.start().apply_async(_call_callback, (task,), callback=done)
+        self.pending += 1
+        if self.timeout > 0:
+            timeout_call = reactor.callLater(
+                self.timeout, self._failed, dfd,
+                "Callback {} didn't finish in {} seconds".format(
+                    callback_name, self.timeout))
+            dfd.addBoth(self._cancel_timeout, timeout_call)
+        return dfd
+
+    @staticmethod
+    def _cancel_timeout(result, timeout_call):
+        if timeout_call.active():
+            timeout_call.cancel()
+        return result
+
+    def _failed(self, dfd, message):
+        if dfd.called:
+            return
+        self.pending -= 1
+        self.failed += 1
+        dfd.errback(OffloadedCallbackError(message))
+
+    def _finished(self, result, dfd, spider):
+        if dfd.called:
+            # timed out
+            return
+        self.pending -= 1
+        success, output = pickle.loads(result)
+        if not success:
+            self.failed += 1
+            dfd.errback(OffloadedCallbackError(output))
+            return
+        self.completed += 1
+        results = []
+        for is_request, obj in output:
+            if is_request:
+                obj = request_from_dict(obj, spider)
+            results.append(obj)
+        dfd.callback(results)
+
+    def get_stats(self):
+        return {
+            'processes': self.processes,
+            'pending': self.pending,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+
+callback_pool = CallbackPool()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Restart of long running process to release memory it accumulated."""
+import sys
+
+from twisted.internet import defer, reactor
+
+from . import log
+from .admission import CrawlRejected
+from .conf import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# seconds between response of last crawl is finished and process exit,
+# so that buffered response data can be sent to client
+EXIT_DELAY = 1.0
+
+
+def get_rss():
+    """Return resident set size of current process in bytes or None if it
+    can't be determined."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # peak RSS, in kilobytes on Linux and in bytes on OS X
+    size = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        size *= 1024
+    return size
+
+
+class Recycler(object):
+    """Stops process after RECYCLE_AFTER_CRAWLS crawls or when its memory
+    usage goes over RECYCLE_MEMORY_LIMIT megabytes.
+
+    Process stops accepting connections and rejects new crawls, waits for
+    running crawls to finish and their responses to be written and stops
+    reactor. Supervisor or master process in pre-fork mode is expected to
+    start new process.
+
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or reactor
+        self.max_crawls = int(settings.RECYCLE_AFTER_CRAWLS)
+        self.max_memory = int(settings.RECYCLE_MEMORY_LIMIT) * 1024 * 1024
+        self.retry_after = int(settings.CRAWL_QUEUE_RETRY_AFTER)
+        self.crawls = 0
+        self.active = 0
+        # API requests whose responses aren't finished yet
+        self.requests = 0
+        self.reason = None
+        # listening server, stopped when process is recycled
+        self.server = None
+        self.exit_call = None
+
+    @property
+    def enabled(self):
+        return bool(self.max_crawls or self.max_memory)
+
+    @property
+    def recycling(self):
+        return self.reason is not None
+
+    def run(self, func, *args, **kwargs):
+        """Call func returning Deferred unless process is being recycled.
+
+        func may not start crawl, e.g. admission control can reject it,
+        so only crawls started by function wrapped with count_crawl are
+        counted.
+        """
+        if self.recycling:
+            return defer.fail(CrawlRejected(
+                "Server is restarting, try again later", self.retry_after))
+        self.active += 1
+        dfd = defer.maybeDeferred(func, *args, **kwargs)
+        return dfd.addBoth(self._finished)
+
+    def count_crawl(self, func):
+        """Wrap function starting crawl, crawl is counted when it's
+        finished."""
+        def crawl(*args, **kwargs):
+            dfd = defer.maybeDeferred(func, *args, **kwargs)
+            return dfd.addBoth(self._crawl_finished)
+        return crawl
+
+    def _crawl_finished(self, result):
+        self.crawls += 1
+        return result
+
+    def _finished(self, result):
+        self.active -= 1
+        if not self.recycling:
+            self.check()
+        self._exit_if_idle()
+        return result
+
+    def track_request(self, request):
+        """Keep process running until response to API request is finished,
+        crawl is finished before its response is encoded and written."""
+        self.requests += 1
+        request.notifyFinish().addBoth(self._request_finished)
+
+    def _request_finished(self, _):
+        # lost connection is handled by resource
+        self.requests -= 1
+        self._exit_if_idle()
+
+    def check(self):
+        if not self.enabled:
+            return
+        if self.max_crawls and self.crawls >= self.max_crawls:
+            self.recycle("{} crawls finished".format(self.crawls))
+            return
+        if self.max_memory:
+            rss = get_rss()
+            if rss is not None and rss >= self.max_memory:
+                self.recycle("memory usage {}M over limit {}M".format(
+                    rss // (1024 * 1024), self.max_memory // (1024 * 1024)))
+
+    def recycle(self, reason):
+        if self.recycling:
+            return
+        self.reason = reason
+        log.msg("Recycling process: {}, waiting for {} crawls to "
+                "finish".format(reason, self.active))
+        if self.server is not None:
+            self.server.stopService()
+        self._exit_if_idle()
+
+    def _exit_if_idle(self):
+        if self.recycling and not self.active and not self.requests:
+            self._schedule_exit()
+
+    def _schedule_exit(self):
+        if self.exit_call is None:
+            self.exit_call = self.clock.callLater(EXIT_DELAY, self._exit)
+
+    def _exit(self):
+        log.msg("Stopping recycled process: {}".format(self.reason))
+        reactor.stop()
+
+    def get_stats(self):
+        return {
+            'crawls': self.crawls,
+            'active': self.active,
+            'requests': self.requests,
+            'recycling': self.recycling,
+            'recycle_reason': self.reason,
+        }
@@ -1,25 +1,49 @@
 # -*- coding: utf-8 -*-
+from functools import partial
+import time
+
 import demjson
+import six
 from scrapy.utils.misc import load_object
-from scrapy.utils.serialize import ScrapyJSONEncoder
-from twisted.internet.defer import Deferred
+from twisted.internet import threads
+from twisted.internet.defer import CancelledError, Deferred, succeed
 from twisted.python.failure import Failure
 from twisted.web import resource, server
 from twisted.web.error import Error, UnsupportedMethod
 
 from . import log
+from .admission import AdmissionControl, CrawlRejected
+from .compression import compress_chunks, select_encoding, StreamCompressor
 from .conf import settings
-from .utils import extract_scrapy_request_args, to_bytes
+from .conf.spider_settings import project_settings_cache
+from .core import BatchCrawlManager
+from .jobs import Job, JobStore
+from .logqueue import log_writer
+from .offload import callback_pool
+from .recycle import Recycler
+from .serialize import get_json_backend
+from .utils import (
+    build_fields_tree, count_items, extract_scrapy_request_args,
+    filter_stats, get_crawl_fingerprint, select_fields, SingleFlight, to_bytes
+)
 
 
 # XXX super() calls won't work wihout object mixin in Python 2
 # maybe this can be removed at some point?
 class ServiceResource(resource.Resource, object):
-    json_encoder = ScrapyJSONEncoder()
+    # JSON response is written in chunks of about that many bytes
+    json_chunk_size = 64 * 1024
 
     def __init__(self, root=None):
         resource.Resource.__init__(self)
         self.root = root
+        self.json_backend = get_json_backend()
+        self.json_encode_stats = {
+            'count': 0,
+            'in_thread': 0,
+            'total_time': 0.0,
+            'max_time': 0.0,
+        }
 
     def render(self, request):
         try:
@@ -31,15 +55,64 @@ class ServiceResource(resource.Resource, object):
             return self.render_object(result, request)
 
         # deferred result - add appropriate callbacks and errbacks
-        result.addErrback(self.handle_error, request)
+        disconnected = []
+
+        def connection_lost(failure):
+            disconnected.append(True)
+            self.client_disconnected(request, result)
+
+        request.notifyFinish().addErrback(connection_lost)
+
+        def handle_error(failure):
+            if disconnected:
+                # nobody to send error to
+                return None
+            return self.handle_error(failure, request)
+
+        result.addErrback(handle_error)
 
         def finish_request(obj):
+            if obj is server.NOT_DONE_YET or disconnected:
+                # response was already written by resource
+                # or client is gone
+                return
+            if self.encode_in_thread(obj):
+                encoding = self.get_content_encoding(request)
+                dfd = threads.deferToThread(self.encode_object, obj, encoding)
+                dfd.addCallbacks(write_encoded, encode_failed)
+                return dfd
             request.write(self.render_object(obj, request))
             request.finish()
 
+        def write_encoded(encoded):
+            chunks, encoding, encode_time = encoded
+            self.record_encode_time(encode_time, in_thread=True)
+            if disconnected:
+                return
+            self.set_json_headers(request, chunks, encoding)
+            for chunk in chunks:
+                request.write(chunk)
+            request.finish()
+
+        def encode_failed(failure):
+            if disconnected:
+                return
+            error = self.handle_error(failure, request)
+            request.write(self.render_object(error, request))
+            request.finish()
+
         result.addCallback(finish_request)
         return server.NOT_DONE_YET
 
+    def client_disconnected(self, request, result):
+        """Called when client disconnected before response was sent.
+
+        :param request: twisted.web.server.Request
+        :param result: Deferred returned by render method, it's cancelled
+            so that resources can stop work result was needed for.
+        """
+        result.cancel()
+
     def handle_error(self, exception_or_failure, request):
         """Override this method to add custom exception handling.
 
@@ -86,30 +159,248 @@ class ServiceResource(resource.Resource, object):
         }
 
     def render_object(self, obj, request):
-        r = self.json_encoder.encode(obj) + "\n"
+        encoding = self.get_content_encoding(request)
+        chunks, encoding, encode_time = self.encode_object(obj, encoding)
+        self.record_encode_time(encode_time)
+        self.set_json_headers(request, chunks, encoding)
+        return b''.join(chunks)
+
+    def get_content_encoding(self, request):
+        """Return encoding response can be compressed with or None."""
+        if not settings.RESPONSE_COMPRESSION:
+            return None
+        return select_encoding(request.getHeader('Accept-Encoding'))
+
+    def encode_in_thread(self, obj):
+        """Return True if obj is big enough to be encoded in thread pool
+        instead of blocking reactor."""
+        min_items = int(settings.JSON_ENCODE_THREAD_MIN_ITEMS)
+        return bool(min_items) and count_items(obj) >= min_items
+
+    def encode_object(self, obj, encoding=None):
+        """Encode obj to JSON and compress it if it's big enough,
+        can be called in thread.
+
+        :param encoding: content coding to compress JSON with
+        :return: tuple of list of bytes chunks, content coding of chunks
+            or None if they aren't compressed and encode time
+        """
+        started = time.time()
+        chunks = self.json_backend.dumps_chunks(obj, self.json_chunk_size)
+        chunks.append(b'\n')
+        min_size = int(settings.RESPONSE_COMPRESSION_MIN_SIZE)
+        if encoding and sum(len(c) for c in chunks) >= min_size:
+            chunks = compress_chunks(
+                chunks, encoding, int(settings.RESPONSE_COMPRESSION_LEVEL))
+        else:
+            encoding = None
+        return chunks, encoding, time.time() - started
+
+    def record_encode_time(self, encode_time, in_thread=False):
+        stats = self.json_encode_stats
+        stats['count'] += 1
+        if in_thread:
+            stats['in_thread'] += 1
+        stats['total_time'] += encode_time
+        stats['max_time'] = max(stats['max_time'], encode_time)
+
+    def get_encode_stats(self):
+        stats = dict(self.json_encode_stats)
+        total_time = stats.pop('total_time')
+        count = stats['count']
+        stats['avg_time'] = total_time / count if count else 0.0
+        return stats
+
+    def set_json_headers(self, request, chunks, encoding=None):
         request.setHeader('Content-Type', 'application/json')
+        self.set_access_control_headers(request)
+        self.set_vary_header(request)
+        if encoding:
+            request.setHeader('Content-Encoding', encoding)
+        request.setHeader('Content-Length', sum(len(c) for c in chunks))
+
+    def set_vary_header(self, request):
+        # response depends on Accept-Encoding even if it isn't compressed,
+        # e.g. it's too small or client doesn't accept gzip or deflate
+        if settings.RESPONSE_COMPRESSION:
+            request.setHeader('Vary', 'Accept-Encoding')
+
+    def set_access_control_headers(self, request):
         request.setHeader('Access-Control-Allow-Origin', '*')
         request.setHeader('Access-Control-Allow-Methods',
                           ', '.join(getattr(self, 'allowedMethods', [])))
         request.setHeader('Access-Control-Allow-Headers', 'X-Requested-With')
-        request.setHeader('Content-Length', len(r))
-        return r.encode("utf8")
+
+
+class ItemStream(object):
+    """Writes items to client as newline delimited JSON as soon as they
+    are scraped.
+
+    Response is sent with chunked transfer encoding, last line of it is
+    a trailer record with crawl status, stats and dropped items. Response
+    is compressed if client accepts it, every line is flushed.
+
+    """
+    content_type = 'application/x-ndjson'
+
+    def __init__(self, resource, request, fields=None):
+        self.resource = resource
+        self.request = request
+        self.fields_tree = build_fields_tree(fields) if fields else None
+        self.items_count = 0
+        self.disconnected = False
+        self.compressor = None
+        request.notifyFinish().addErrback(self._connection_lost)
+
+    def _connection_lost(self, failure):
+        self.disconnected = True
+
+    @property
+    def started(self):
+        return bool(self.request.startedWriting)
+
+    def write_record(self, obj):
+        if self.disconnected:
+            return
+        if not self.started:
+            self.start()
+        data = self.resource.json_backend.dumps(obj) + b"\n"
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.request.write(data)
+
+    def start(self):
+        self.request.setHeader('Content-Type', self.content_type)
+        self.resource.set_access_control_headers(self.request)
+        self.resource.set_vary_header(self.request)
+        encoding = self.resource.get_content_encoding(self.request)
+        if encoding:
+            self.compressor = StreamCompressor(
+                encoding, int(settings.RESPONSE_COMPRESSION_LEVEL))
+            self.request.setHeader('Content-Encoding', encoding)
+
+    def write_item(self, item):
+        self.items_count += 1
+        if self.fields_tree is not None:
+            item = select_fields(item, self.fields_tree)
+        self.write_record(item)
+
+    def finish(self, trailer):
+        if not self.disconnected:
+            self.write_record(trailer)
+            if self.compressor is not None:
+                self.request.write(self.compressor.flush())
+            self.request.finish()
+        return server.NOT_DONE_YET
+
+    def fail(self, failure):
+        """Write error trailer if some items were sent already, otherwise
+        error is returned as usual JSON response."""
+        if not self.started or self.disconnected:
+            return failure
+        # response code is already sent
+        log.err(failure)
+        self.finish({
+            "status": "error",
+            "message": failure.getErrorMessage(),
+            "code": 500,
+        })
+        return server.NOT_DONE_YET
 
 
 class RealtimeApi(ServiceResource):
 
     def __init__(self, **kwargs):
         super(RealtimeApi, self).__init__(self)
+        # shared by all resources that start crawls
+        self.admission = AdmissionControl()
+        self.recycler = Recycler()
         for route, resource_path in settings.RESOURCES.items():
             resource_cls = load_object(resource_path)
             route = to_bytes(route)
             self.putChild(route, resource_cls(self, **kwargs))
 
 
+class MetricsResource(ServiceResource):
+    """Metrics of server, e.g. crawl queue depth and wait time.
+
+    Metrics of other resources are collected from their get_stats method.
+    """
+
+    isLeaf = True
+    allowedMethods = ['GET']
+
+    def render_GET(self, request, **kwargs):
+        metrics = {
+            'status': 'ok',
+            'settings_cache': project_settings_cache.get_stats(),
+        }
+        admission = getattr(self.root, 'admission', None)
+        if admission is not None:
+            metrics['crawls'] = admission.get_stats()
+        if callback_pool.enabled:
+            metrics['callback_pool'] = callback_pool.get_stats()
+        if log_writer.enabled:
+            metrics['log_writer'] = log_writer.get_stats()
+        recycler = getattr(self.root, 'recycler', None)
+        if recycler is not None and recycler.enabled:
+            metrics['recycle'] = recycler.get_stats()
+        children = self.root.children if self.root is not None else {}
+        for route, child in sorted(children.items()):
+            get_stats = getattr(child, 'get_stats', None)
+            if callable(get_stats):
+                metrics[route.decode('utf-8')] = get_stats()
+        return metrics
+
+
 class CrawlResource(ServiceResource):
 
     isLeaf = True
     allowedMethods = ['GET', 'POST']
+    # keys of response that can be left out with omit argument
+    omittable_keys = ('items_dropped', 'errors', 'stats')
+
+    def __init__(self, *args, **kwargs):
+        super(CrawlResource, self).__init__(*args, **kwargs)
+        self.crawls_in_flight = SingleFlight()
+        # crawls cancelled because client disconnected
+        self.crawls_abandoned = 0
+        self.admission = getattr(self.root, 'admission', None)
+        if self.admission is None:
+            self.admission = AdmissionControl()
+        self.recycler = getattr(self.root, 'recycler', None)
+        if self.recycler is None:
+            self.recycler = Recycler()
+        if settings.RESULT_CACHE:
+            self.result_cache = load_object(settings.RESULT_CACHE)()
+        else:
+            self.result_cache = None
+
+    def get_stats(self):
+        stats = {
+            'crawls_in_flight': len(self.crawls_in_flight.in_flight),
+            'crawls_abandoned': self.crawls_abandoned,
+            'json_encode': self.get_encode_stats(),
+        }
+        if self.result_cache is not None:
+            stats['result_cache_size'] = len(self.result_cache)
+        return stats
+
+    def render(self, request):
+        self.recycler.track_request(request)
+        return super(CrawlResource, self).render(request)
+
+    def client_disconnected(self, request, result):
+        log.msg("Client disconnected, cancelling its crawl call")
+        super(CrawlResource, self).client_disconnected(request, result)
+
+    def handle_error(self, exception_or_failure, request):
+        exception = getattr(
+            exception_or_failure, 'value', exception_or_failure)
+        if isinstance(exception, CrawlRejected):
+            request.setHeader('Retry-After', str(exception.retry_after))
+        return super(CrawlResource, self).handle_error(
+            exception_or_failure, request)
 
     def render_GET(self, request, **kwargs):
         """Request querysting must contain following keys: url, spider_name.
@@ -124,7 +415,8 @@ class CrawlResource(ServiceResource):
         scrapy_request_args = extract_scrapy_request_args(api_params,
                                                           raise_error=False)
         self.validate_options(scrapy_request_args, api_params)
-        return self.prepare_crawl(api_params, scrapy_request_args, **kwargs)
+        return self.prepare_crawl(api_params, scrapy_request_args,
+                                  http_request=request, **kwargs)
 
     def render_POST(self, request, **kwargs):
         """
@@ -144,13 +436,20 @@ class CrawlResource(ServiceResource):
         """
         request_body = request.content.getvalue()
         try:
-            api_params = demjson.decode(request_body)
-        except demjson.JSONDecodeError as e:
-            message = "Invalid JSON in POST body. {}"
-            message = message.format(e.pretty_description())
-            raise Error('400', message=message)
+            api_params = self.json_backend.loads(request_body)
+        except ValueError:
+            # demjson accepts some invalid JSON, e.g. single quoted strings,
+            # and its error messages are returned for invalid body
+            try:
+                api_params = demjson.decode(request_body)
+            except demjson.JSONDecodeError as e:
+                message = "Invalid JSON in POST body. {}"
+                message = message.format(e.pretty_description())
+                raise Error('400', message=message)
 
         log.msg("{}".format(api_params))
+        if "requests" in api_params:
+            return self.prepare_batch_crawl(api_params, http_request=request)
         if api_params.get("start_requests"):
             # start requests passed so 'request' argument is optional
             _request = api_params.get("request", {})
@@ -165,7 +464,8 @@ class CrawlResource(ServiceResource):
             raise Error('400', str(e))
 
         self.validate_options(scrapy_request_args, api_params)
-        return self.prepare_crawl(api_params, scrapy_request_args, **kwargs)
+        return self.prepare_crawl(api_params, scrapy_request_args,
+                                  http_request=request, **kwargs)
 
     def validate_options(self, scrapy_request_args, api_params):
         url = scrapy_request_args.get("url")
@@ -173,6 +473,35 @@ class CrawlResource(ServiceResource):
         if not url and not start_requests:
             raise Error('400',
                         "'url' is required if start_requests are disabled")
+        self.get_response_filters(api_params)
+
+    def get_list_argument(self, api_params, name):
+        """Return list of strings passed as list or as comma separated
+        string, or None if argument isn't passed."""
+        value = api_params.get(name)
+        if value is None:
+            return None
+        if isinstance(value, six.string_types):
+            value = value.split(',')
+        if (not isinstance(value, list) or
+                not all(isinstance(v, six.string_types) for v in value)):
+            message = "{!r} must be list of strings or comma separated " \
+                      "string".format(name)
+            raise Error('400', message=message)
+        return [v.strip() for v in value if v.strip()]
+
+    def get_response_filters(self, api_params):
+        """Return item fields, stats keys and response keys to omit,
+        selected with fields, stats and omit API arguments."""
+        fields = self.get_list_argument(api_params, 'fields')
+        stats = self.get_list_argument(api_params, 'stats')
+        omit = self.get_list_argument(api_params, 'omit') or []
+        unknown = set(omit) - set(self.omittable_keys)
+        if unknown:
+            message = "Can't omit {}, only {} can be omitted".format(
+                ', '.join(sorted(unknown)), ', '.join(self.omittable_keys))
+            raise Error('400', message=message)
+        return fields, stats, omit
 
     def get_required_argument(self, api_params, name, error_msg=None):
         """Get required API key from dict-like object.
@@ -205,27 +534,297 @@ class CrawlResource(ServiceResource):
         :param dict scrapy_request_args:
             should contain positional and keyword arguments for Scrapy
             Request object that will be created
+
+        :param http_request: twisted.web.server.Request API call came with,
+            passed as keyword argument
         """
+        http_request = kwargs.pop('http_request', None)
         spider_name = self.get_required_argument(api_params, 'spider_name')
         start_requests = api_params.get("start_requests", False)
         try:
             max_requests = api_params['max_requests']
         except (KeyError, IndexError):
             max_requests = None
-        dfd = self.run_crawl(
-            spider_name, scrapy_request_args, max_requests,
-            start_requests=start_requests, *args, **kwargs)
+        deadline_ms = self.get_deadline_ms(api_params)
+        deadline = None
+        if deadline_ms is not None:
+            deadline = time.time() + deadline_ms / 1000.0
+        max_items = self.get_max_items(api_params)
+        include_log = self.get_include_log(api_params)
+        debug_log = self.get_bool_argument(api_params, 'debug')
+        if self.get_stream_format(api_params, http_request):
+            # streamed crawls are never shared, each client gets items
+            # of its own crawl
+            fields, _, _ = self.get_response_filters(api_params)
+            stream = ItemStream(self, http_request, fields)
+            dfd = self.run_crawl(
+                spider_name, scrapy_request_args, max_requests,
+                start_requests=start_requests, stream=stream,
+                deadline=deadline, max_items=max_items,
+                include_log=include_log, debug_log=debug_log, *args, **kwargs)
+            dfd.addCallback(
+                self.prepare_response, request_data=api_params, *args, **kwargs)
+            dfd.addCallback(self.prepare_trailer, stream)
+            dfd.addCallbacks(stream.finish, stream.fail)
+            return dfd
+        crawl = partial(
+            self.run_crawl, spider_name, scrapy_request_args, max_requests,
+            start_requests=start_requests, deadline=deadline,
+            max_items=max_items, include_log=include_log,
+            debug_log=debug_log, *args, **kwargs)
+        fingerprint = get_crawl_fingerprint(
+            spider_name, scrapy_request_args, max_requests=max_requests,
+            start_requests=start_requests, deadline_ms=deadline_ms,
+            max_items=max_items, include_log=include_log,
+            debug_log=debug_log, args=args, kwargs=kwargs)
+        if self.result_cache is not None:
+            dfd = self.run_cached_crawl(
+                fingerprint, spider_name, crawl, http_request)
+        else:
+            dfd = self.run_coalesced_crawl(fingerprint, crawl, http_request)
         dfd.addCallback(
             self.prepare_response, request_data=api_params, *args, **kwargs)
         return dfd
 
+    def run_coalesced_crawl(self, fingerprint, crawl, http_request=None):
+        """Run crawl unless identical crawl is running already.
+
+        :param fingerprint: crawl fingerprint, the same for identical crawls
+        :param crawl: function that starts crawl and returns Deferred
+        """
+        if not settings.COALESCE_CRAWLS:
+            return crawl()
+        dfd, coalesced = self.crawls_in_flight.run(fingerprint, crawl)
+        if http_request is not None:
+            http_request.setHeader(
+                'X-Scrapyrt-Coalesced', 'true' if coalesced else 'false')
+        return dfd
+
+    def run_cached_crawl(self, fingerprint, spider_name, crawl,
+                         http_request=None):
+        """Get crawl result from cache, or run crawl and cache its result.
+
+        Expired result is returned while crawl refreshing it is running
+        in the background if RESULT_CACHE_STALE_WHILE_REVALIDATE allows it,
+        and it's returned if crawl failed if RESULT_CACHE_STALE_IF_ERROR
+        allows it.
+        """
+        def crawl_and_cache():
+            dfd = crawl()
+            dfd.addCallback(self.cache_result, fingerprint, spider_name)
+            return dfd
+
+        entry = self.result_cache.get(fingerprint)
+        if entry is not None and entry.is_fresh():
+            status = 'HIT'
+            dfd = succeed(entry.result)
+        elif entry is not None and entry.can_revalidate():
+            status = 'STALE'
+            refresh_dfd, _ = self.crawls_in_flight.run(
+                fingerprint, crawl_and_cache)
+            refresh_dfd.addErrback(
+                log.err, "Error while refreshing cached crawl result")
+            dfd = succeed(entry.result)
+        else:
+            status = 'MISS'
+            dfd = self.run_coalesced_crawl(
+                fingerprint, crawl_and_cache, http_request)
+            if entry is not None:
+                dfd.addErrback(self.serve_stale_on_error, entry, http_request)
+        if http_request is not None:
+            http_request.setHeader('X-Scrapyrt-Cache', status)
+        return dfd
+
+    def cache_result(self, result, fingerprint, spider_name):
+        # don't cache results of crawls that were stopped
+        # (e.g. because of timeout)
+        stats = result.get('stats') or {}
+        if stats.get('finish_reason') in ('finished', 'max_items_reached'):
+            self.result_cache.set(fingerprint, spider_name, result)
+        return result
+
+    def serve_stale_on_error(self, failure, entry, http_request=None):
+        if not entry.can_serve_on_error():
+            return failure
+        log.err(failure, "Crawl failed, serving expired result from cache")
+        if http_request is not None:
+            http_request.setHeader('X-Scrapyrt-Cache', 'STALE-IF-ERROR')
+        return entry.result
+
+    def prepare_batch_crawl(self, api_params, http_request=None):
+        """Crawl many requests of one spider in single crawler.
+
+        :param dict api_params: POST body, ``requests`` key has list of
+            request objects, every one of them is validated like
+            ``request`` of usual crawl.
+        """
+        spider_name = self.get_required_argument(api_params, 'spider_name')
+        requests = self.get_required_argument(api_params, 'requests')
+        if not isinstance(requests, list):
+            raise Error('400', message="'requests' must be a list")
+        max_batch_size = int(settings.BATCH_MAX_REQUESTS)
+        if len(requests) > max_batch_size:
+            message = "Too many requests in batch, only {} allowed".format(
+                max_batch_size)
+            raise Error('400', message=message)
+        if self.get_stream_format(api_params, http_request):
+            raise Error('400', message="Batch crawls can't be streamed")
+        if self.get_bool_argument(api_params, 'include_log'):
+            raise Error('400', message="Batch crawls can't include log")
+        self.get_response_filters(api_params)
+        requests_args = []
+        for index, _request in enumerate(requests):
+            try:
+                scrapy_request_args = extract_scrapy_request_args(
+                    _request, raise_error=True)
+            except (ValueError, AttributeError) as e:
+                raise Error('400', "requests[{}]: {}".format(index, e))
+            if not scrapy_request_args.get("url"):
+                message = "requests[{}]: 'url' is required".format(index)
+                raise Error('400', message=message)
+            requests_args.append(scrapy_request_args)
+        max_requests = api_params.get('max_requests')
+        max_items = self.get_max_items(api_params)
+        manager = BatchCrawlManager(
+            spider_name, requests_args, max_requests, max_items)
+        dfd = self.admit_crawl(spider_name, manager.crawl)
+        dfd.addCallback(self.prepare_batch_response, spider_name, api_params)
+        return dfd
+
+    def prepare_batch_response(self, results, spider_name, api_params):
+        response_results = []
+        for success, result in results:
+            if success:
+                response_results.append(
+                    self.prepare_response(result, request_data=api_params))
+                continue
+            exception = result.value
+            if isinstance(exception, Error):
+                code = int(exception.status)
+                message = exception.message
+            else:
+                log.err(result)
+                code = 500
+                message = str(exception)
+            response_results.append({
+                "status": "error",
+                "message": message,
+                "code": code,
+            })
+        return {
+            "status": "ok",
+            "spider_name": spider_name,
+            "results": response_results,
+        }
+
+    def get_stream_format(self, api_params, http_request=None):
+        """Return format of streamed response or None if items should be
+        returned in single JSON response.
+
+        Streaming is requested with ``stream`` API parameter or with
+        Accept header of request.
+        """
+        stream_format = api_params.get('stream')
+        if not stream_format and http_request is not None:
+            accept = http_request.getHeader('Accept') or ''
+            if ItemStream.content_type in accept:
+                stream_format = 'ndjson'
+        if not stream_format:
+            return None
+        if stream_format != 'ndjson':
+            message = "Unsupported stream format: {!r}".format(stream_format)
+            raise Error('400', message=message)
+        if http_request is None:
+            raise Error('400', message="Streaming is not supported")
+        return stream_format
+
+    def get_deadline_ms(self, api_params):
+        """Return number of milliseconds crawl can take, partial results
+        are returned when they pass."""
+        deadline_ms = api_params.get('deadline_ms')
+        if deadline_ms is None or deadline_ms == '':
+            return None
+        try:
+            deadline_ms = int(deadline_ms)
+        except (TypeError, ValueError):
+            deadline_ms = 0
+        if deadline_ms <= 0:
+            raise Error('400', message="'deadline_ms' must be positive integer")
+        return deadline_ms
+
+    def get_bool_argument(self, api_params, name):
+        """Return boolean argument passed as JSON boolean or as string,
+        e.g. 'true' or '1'."""
+        value = api_params.get(name)
+        if isinstance(value, six.string_types):
+            return value.strip().lower() not in ('', '0', 'false', 'no')
+        return bool(value)
+
+    def get_include_log(self, api_params):
+        """Return whether log of crawl should be included in response,
+        it's possible only if logs are kept in memory."""
+        include_log = self.get_bool_argument(api_params, 'include_log')
+        if include_log and settings.SPIDER_LOG_LAYOUT != 'memory':
+            message = "'include_log' requires SPIDER_LOG_LAYOUT = 'memory'"
+            raise Error('400', message=message)
+        return include_log
+
+    def get_max_items(self, api_params):
+        """Return number of items after which crawl is stopped, first_item
+        is the same as max_items=1."""
+        if self.get_bool_argument(api_params, 'first_item'):
+            return 1
+        max_items = api_params.get('max_items')
+        if max_items is None or max_items == '':
+            return None
+        try:
+            max_items = int(max_items)
+        except (TypeError, ValueError):
+            max_items = 0
+        if max_items <= 0:
+            raise Error('400', message="'max_items' must be positive integer")
+        return max_items
+
     def run_crawl(self, spider_name, scrapy_request_args,
                   max_requests=None, start_requests=False, *args, **kwargs):
-        crawl_manager_cls = load_object(settings.CRAWL_MANAGER)
-        manager = crawl_manager_cls(spider_name, scrapy_request_args, max_requests, start_requests=start_requests)
-        dfd = manager.crawl(*args, **kwargs)
+        stream = kwargs.pop('stream', None)
+        deadline = kwargs.pop('deadline', None)
+        max_items = kwargs.pop('max_items', None)
+        include_log = kwargs.pop('include_log', False)
+        debug_log = kwargs.pop('debug_log', False)
+        manager = self.create_crawl_manager(
+            spider_name, scrapy_request_args, max_requests, start_requests)
+        # items are written to stream instead of being collected
+        manager.stream = stream
+        manager.deadline = deadline
+        manager.max_items = max_items
+        manager.include_log = include_log
+        manager.debug_log = debug_log
+        dfd = self.admit_crawl(
+            spider_name, manager.crawl, *args, **kwargs)
         return dfd
 
+    def admit_crawl(self, spider_name, func, *args, **kwargs):
+        """Call func starting crawl when it's allowed by admission control,
+        crawls are rejected while process is being recycled."""
+        dfd = self.recycler.run(
+            self.admission.run, spider_name, self.recycler.count_crawl(func),
+            *args, **kwargs)
+        return dfd.addErrback(self.crawl_cancelled)
+
+    def crawl_cancelled(self, failure):
+        # crawl shared by coalesced calls is cancelled only when
+        # clients of all of them disconnected
+        if failure.check(CancelledError):
+            log.msg("Crawl cancelled, no client waits for its result")
+            self.crawls_abandoned += 1
+        return failure
+
+    def create_crawl_manager(self, spider_name, scrapy_request_args,
+                             max_requests=None, start_requests=False):
+        crawl_manager_cls = load_object(settings.CRAWL_MANAGER)
+        return crawl_manager_cls(spider_name, scrapy_request_args, max_requests, start_requests=start_requests)
+
     def prepare_response(self, result, *args, **kwargs):
         items = result.get("items")
         response = {
@@ -235,7 +834,134 @@ class CrawlResource(ServiceResource):
             "stats": result.get("stats"),
             "spider_name": result.get("spider_name"),
         }
+        if result.get("partial"):
+            response["partial"] = True
+            response["partial_reason"] = result.get("partial_reason")
         errors = result.get("errors")
         if errors:
             response["errors"] = errors
+        crawl_log = result.get("log")
+        if crawl_log is not None:
+            response["log"] = crawl_log
+        request_data = kwargs.get("request_data")
+        if request_data:
+            self.filter_response(response, request_data)
+        return response
+
+    def filter_response(self, response, api_params):
+        """Leave out parts of response client doesn't need before it's
+        serialized."""
+        fields, stats, omit = self.get_response_filters(api_params)
+        for key in omit:
+            response.pop(key, None)
+        if fields and response.get("items") is not None:
+            fields_tree = build_fields_tree(fields)
+            response["items"] = [select_fields(item, fields_tree)
+                                 for item in response["items"]]
+        if stats is not None and response.get("stats") is not None:
+            response["stats"] = filter_stats(response["stats"], stats)
+
+    def prepare_trailer(self, response, stream):
+        """Last record of streamed response, items were already sent."""
+        response.pop("items", None)
+        response["items_count"] = stream.items_count
+        return response
+
+
+class JobResource(CrawlResource):
+    """Runs crawls in background.
+
+    POST takes the same arguments as POST to crawl.json, starts crawl and
+    returns job id right away. GET returns status of job with results
+    scraped so far, DELETE cancels job.
+
+    """
+
+    allowedMethods = ['GET', 'POST', 'DELETE']
+
+    def __init__(self, *args, **kwargs):
+        super(JobResource, self).__init__(*args, **kwargs)
+        self.jobs = JobStore()
+
+    def get_stats(self):
+        stats = super(JobResource, self).get_stats()
+        stats['jobs'] = self.jobs.get_stats()
+        return stats
+
+    def render_GET(self, request, **kwargs):
+        job = self.get_job(request)
+        return self.format_job(job)
+
+    def render_DELETE(self, request, **kwargs):
+        job = self.get_job(request)
+        job.cancel()
+        return self.format_job(job)
+
+    def get_job(self, request):
+        api_params = dict(
+            (name.decode('utf-8'), value[0].decode('utf-8'))
+            for name, value in request.args.items()
+        )
+        job_id = self.get_required_argument(api_params, 'job_id')
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise Error('404', message="Job not found: {}".format(job_id))
+        return job
+
+    def prepare_crawl(self, api_params, scrapy_request_args, *args, **kwargs):
+        """Start crawl in background and return job id."""
+        http_request = kwargs.pop('http_request', None)
+        spider_name = self.get_required_argument(api_params, 'spider_name')
+        start_requests = api_params.get("start_requests", False)
+        max_requests = api_params.get('max_requests')
+        deadline_ms = self.get_deadline_ms(api_params)
+        manager = self.create_crawl_manager(
+            spider_name, scrapy_request_args, max_requests, start_requests)
+        if deadline_ms is not None:
+            manager.deadline = time.time() + deadline_ms / 1000.0
+        manager.max_items = self.get_max_items(api_params)
+        manager.include_log = self.get_include_log(api_params)
+        manager.debug_log = self.get_bool_argument(api_params, 'debug')
+        job = Job(manager)
+        self.jobs.add(job)
+        dfd = job.crawl_dfd = self.admit_crawl(
+            spider_name, job.start, *args, **kwargs)
+        dfd.addCallback(self.prepare_job_result, api_params)
+        dfd.addCallbacks(job.set_result, job.set_error)
+        if http_request is not None:
+            http_request.setResponseCode(202)
+        return {
+            "status": "ok",
+            "job_id": job.id,
+            "job_status": job.status,
+        }
+
+    def prepare_batch_crawl(self, api_params, http_request=None):
+        raise Error('400', message="Batch crawls can't be run as jobs")
+
+    def crawl_cancelled(self, failure):
+        # jobs don't wait for client, they are cancelled only by DELETE
+        return failure
+
+    def prepare_job_result(self, result, api_params):
+        if result is None:
+            # cancelled before crawl was started
+            return None
+        return self.prepare_response(result, request_data=api_params)
+
+    def format_job(self, job):
+        response = {
+            "status": "ok",
+            "job_id": job.id,
+            "job_status": job.status,
+            "spider_name": job.spider_name,
+        }
+        if job.error is not None:
+            response["error"] = job.error
+        elif job.result is not None:
+            response.update(job.result)
+        elif job.manager is not None and job.manager.crawler is not None:
+            # results scraped so far
+            partial_result = job.manager.return_items(None)
+            response.update(self.prepare_response(partial_result))
         return response
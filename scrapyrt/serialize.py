@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""JSON backends used to decode API requests and encode responses.
+
+All backends encode objects the same way as ScrapyJSONEncoder, e.g. items
+are encoded as objects, dates with DATE_FORMAT and decimals as strings.
+
+"""
+from collections import OrderedDict
+import json
+
+from scrapy.utils.misc import load_object
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+from .conf import settings
+from .utils import to_unicode
+
+
+JSON_BACKENDS = OrderedDict([
+    ('orjson', 'scrapyrt.serialize.OrjsonBackend'),
+    ('simplejson', 'scrapyrt.serialize.SimplejsonBackend'),
+    ('json', 'scrapyrt.serialize.JSONBackend'),
+])
+
+
+class JSONBackend(object):
+    """Backend using json module from standard library."""
+
+    name = 'json'
+
+    def __init__(self):
+        self.encoder = ScrapyJSONEncoder()
+
+    def dumps(self, obj):
+        """Encode obj to UTF-8 encoded JSON."""
+        return self.encoder.encode(obj).encode('utf8')
+
+    def dumps_chunks(self, obj, chunk_size):
+        """Encode obj to list of UTF-8 encoded chunks of JSON of about
+        chunk_size bytes, so that whole JSON isn't copied when encoded."""
+        # iterencode of json module doesn't use C speedups, so JSON is
+        # encoded at once and split
+        encoded = self.encoder.encode(obj)
+        return [encoded[i:i + chunk_size].encode('utf8')
+                for i in range(0, len(encoded), chunk_size)]
+
+    def loads(self, data):
+        """Decode JSON, raises ValueError if data isn't valid JSON."""
+        return json.loads(to_unicode(data))
+
+
+class SimplejsonBackend(JSONBackend):
+    """Backend using C speedups of simplejson."""
+
+    name = 'simplejson'
+
+    def __init__(self):
+        import simplejson
+        self.simplejson = simplejson
+        # options make simplejson encode objects like json module,
+        # decimals are encoded as strings by ScrapyJSONEncoder.default
+        self.encoder = simplejson.JSONEncoder(
+            default=ScrapyJSONEncoder().default,
+            use_decimal=False,
+            namedtuple_as_object=False,
+            allow_nan=True,
+        )
+
+    def dumps_chunks(self, obj, chunk_size):
+        chunks = []
+        buffered = []
+        buffered_size = 0
+        for part in self.encoder.iterencode(obj):
+            buffered.append(part)
+            buffered_size += len(part)
+            if buffered_size >= chunk_size:
+                chunks.append(''.join(buffered).encode('utf8'))
+                buffered = []
+                buffered_size = 0
+        if buffered:
+            chunks.append(''.join(buffered).encode('utf8'))
+        return chunks
+
+    def loads(self, data):
+        return self.simplejson.loads(data)
+
+
+class OrjsonBackend(JSONBackend):
+    """Backend using orjson, the fastest one.
+
+    JSON is encoded at once, not in chunks. Objects orjson can't encode,
+    e.g. integers over 64 bits, are encoded with json module.
+
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        super(OrjsonBackend, self).__init__()
+        import orjson
+        if not hasattr(orjson, 'OPT_PASSTHROUGH_DATETIME'):
+            # dates would be encoded in ISO format
+            raise ImportError("orjson>=3.3.0 is required")
+        self.orjson = orjson
+        self.default = self.encoder.default
+
+    def dumps(self, obj):
+        try:
+            return self.orjson.dumps(
+                obj, default=self.default,
+                option=self.orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super(OrjsonBackend, self).dumps(obj)
+
+    def dumps_chunks(self, obj, chunk_size):
+        return [self.dumps(obj)]
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+
+def get_json_backend(name=None):
+    """Return instance of JSON backend selected by JSON_BACKEND setting.
+
+    :param name: 'auto', name of backend or path to backend class. 'auto'
+        selects the fastest of installed backends.
+    """
+    if name is None:
+        name = settings.JSON_BACKEND
+    if name == 'auto':
+        for backend_path in JSON_BACKENDS.values():
+            try:
+                return load_object(backend_path)()
+            except ImportError:
+                continue
+    return load_object(JSON_BACKENDS.get(name, name))()
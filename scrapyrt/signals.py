@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Scrapyrt signals, sent with Scrapy signal manager of the crawler."""
+
+# Sent when request was downloaded (or failed) and its output was processed
+# by spider and item pipelines.
+# Arguments: request, spider
+request_processed = object()
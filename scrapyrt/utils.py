@@ -1,9 +1,15 @@
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+import hashlib
 import inspect
+import json
 
 import sys
 
 import six
 from scrapy import Request
+from scrapy.utils.url import canonicalize_url
+from twisted.internet.defer import Deferred
 
 
 def extract_scrapy_request_args(dictionary, raise_error=False):
@@ -39,3 +45,158 @@ except ImportError:
         if encoding is None:
             encoding = 'utf-8'
         return text.encode(encoding, errors)
+
+
+try:
+    from scrapy.utils.python import to_unicode
+except ImportError:
+    def to_unicode(text, encoding=None, errors='strict'):
+        """Return the unicode representation of a bytes object `text`. If
+        `text` is already an unicode object, return it as-is."""
+        if isinstance(text, six.text_type):
+            return text
+        if not isinstance(text, (bytes, six.text_type)):
+            raise TypeError('to_unicode must receive a bytes, str or unicode '
+                            'object, got %s' % type(text).__name__)
+        if encoding is None:
+            encoding = 'utf-8'
+        return text.decode(encoding, errors)
+
+
+def count_items(obj):
+    """Return number of scraped items in API response, including items of
+    batch crawl results and job results."""
+    if isinstance(obj, dict):
+        items = obj.get('items')
+        count = len(items) if isinstance(items, list) else 0
+        for key in ('result', 'results'):
+            count += count_items(obj.get(key))
+        return count
+    if isinstance(obj, list):
+        return sum(count_items(value) for value in obj)
+    return 0
+
+
+def build_fields_tree(fields):
+    """Convert list of dotted field paths to tree of dicts, None value
+    in tree means that whole value of field is selected."""
+    tree = {}
+    for field in fields:
+        node = tree
+        keys = field.split('.')
+        for key in keys[:-1]:
+            if key in node and node[key] is None:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = None
+    return tree
+
+
+def select_fields(value, tree):
+    """Return copy of item with fields selected by tree built with
+    build_fields_tree. Paths go through lists, e.g. 'offers.price'
+    selects price of every offer."""
+    if tree is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [select_fields(element, tree) for element in value]
+    if not hasattr(value, 'keys'):
+        return value
+    return dict((key, select_fields(value[key], subtree))
+                for key, subtree in tree.items() if key in value)
+
+
+def filter_stats(stats, patterns):
+    """Return stats with keys matching any of shell-style patterns,
+    e.g. 'finish_reason' or 'downloader/*'."""
+    return OrderedDict(
+        (key, value) for key, value in stats.items()
+        if any(fnmatchcase(key, pattern) for pattern in patterns))
+
+
+def get_failure_signature(failure):
+    """Return signature of failure, failures with the same exception type
+    raised at the same place have the same signature, even if their
+    messages differ."""
+    frames = tuple((filename, line, function)
+                   for function, filename, line, _, _ in failure.frames)
+    return failure.type, frames
+
+
+def get_crawl_fingerprint(spider_name, scrapy_request_args, **api_params):
+    """Return fingerprint of crawl with given spider and request arguments.
+
+    Fingerprint doesn't depend on keys order and order of url query
+    arguments, values of api params are compared as strings.
+
+    """
+    request_args = dict(scrapy_request_args)
+    url = request_args.get('url')
+    if url:
+        request_args['url'] = canonicalize_url(url)
+    data = {
+        'spider_name': spider_name,
+        'request': request_args,
+        'api_params': dict(
+            (key, six.text_type(value)) for key, value in api_params.items()),
+    }
+    data = json.dumps(data, sort_keys=True, default=repr)
+    return hashlib.sha1(to_bytes(data)).hexdigest()
+
+
+class SingleFlight(object):
+    """Run only one call with the same key at a time.
+
+    Calls made while call with the same key is running get its result
+    instead of starting new one. Every caller gets its own Deferred,
+    running call is cancelled only when all callers cancelled their
+    Deferreds.
+
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.calls = {}
+
+    def run(self, key, func, *args, **kwargs):
+        """Call func unless call with the same key is running.
+
+        :param func: function returning Deferred
+        :return: tuple (deferred, coalesced), coalesced is True if
+            deferred fires with result of call that was already running.
+
+        """
+        if key in self.in_flight:
+            return self._wait(key), True
+        self.in_flight[key] = []
+        try:
+            dfd = func(*args, **kwargs)
+        except Exception:
+            del self.in_flight[key]
+            raise
+        waiter = self._wait(key)
+        self.calls[key] = dfd
+        dfd.addBoth(self._finished, key)
+        return waiter, False
+
+    def _wait(self, key):
+        waiter = Deferred(lambda waiter: self._cancel(key, waiter))
+        self.in_flight[key].append(waiter)
+        return waiter
+
+    def _cancel(self, key, waiter):
+        waiters = self.in_flight.get(key)
+        if not waiters or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            # nobody waits for result anymore
+            self.calls[key].cancel()
+
+    def _finished(self, result, key):
+        self.calls.pop(key, None)
+        for dfd in self.in_flight.pop(key, []):
+            dfd.callback(result)
+        # result is passed to callers
+        return None
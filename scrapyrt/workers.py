@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Pre-fork mode: many worker processes serving API on shared socket.
+
+Master process imports project and spiders once, opens listening socket
+and forks workers, which inherit both. Every worker runs its own reactor
+and adopts inherited socket, master only restarts workers that exit.
+
+Twisted reactor can't be used in forked process if it was installed
+before fork, so master must not import twisted.internet.reactor.
+
+"""
+import errno
+import os
+import signal
+import socket
+import sys
+import time
+
+from . import log
+
+
+# worker that exits sooner than that after start is restarted with delay,
+# so that crashing worker doesn't make master spin
+MIN_WORKER_UPTIME = 1.0
+RESTART_DELAY = 1.0
+
+
+def create_listening_socket(port, interface, backlog=50):
+    family = socket.AF_INET6 if ':' in interface else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((interface, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class WorkerMaster(object):
+    """Forks workers and restarts them when they exit."""
+
+    def __init__(self, num_workers, run_worker, sock):
+        """
+        :param num_workers: number of worker processes
+        :param run_worker: function called in worker process with
+            listening socket, process exits when it returns
+        :param sock: listening socket shared by workers
+        """
+        self.num_workers = num_workers
+        self.run_worker = run_worker
+        self.sock = sock
+        # pid -> start time
+        self.workers = {}
+        self.stopping = False
+        self.restarts = 0
+
+    def run(self):
+        handlers = dict(
+            (signum, signal.signal(signum, self.stop))
+            for signum in (signal.SIGTERM, signal.SIGINT))
+        try:
+            self.supervise()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        log.msg("All workers stopped")
+
+    def supervise(self):
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    break
+                raise
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            if self.stopping:
+                continue
+            log.msg("Worker {} exited with status {}, restarting".format(
+                pid, status))
+            if time.time() - started < MIN_WORKER_UPTIME:
+                time.sleep(RESTART_DELAY)
+            if not self.stopping:
+                self.restarts += 1
+                self.spawn_worker()
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.time()
+            log.msg("Started worker {}".format(pid))
+            return pid
+        # worker process
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            self.run_worker(self.sock)
+        except Exception:
+            log.err(None, "Worker {} failed".format(os.getpid()))
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def stop(self, signum=None, frame=None):
+        if self.stopping:
+            return
+        self.stopping = True
+        log.msg("Stopping workers")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+
+def stop_with_master(interval=1.0):
+    """Stop reactor of worker process when master process is gone,
+    e.g. when it was killed and couldn't stop workers."""
+    from twisted.internet import reactor, task
+    master_pid = os.getppid()
+
+    def check_master():
+        if os.getppid() != master_pid:
+            log.msg("Master process {} exited, stopping worker".format(
+                master_pid))
+            reactor.stop()
+
+    loop = task.LoopingCall(check_master)
+    loop.start(interval, now=False)
+    return loop
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import scrapy
+from scrapyrt.offload import cpu_bound
 
 from ..items import TestprojectItem
 
@@ -11,3 +12,9 @@ class TestSpider(scrapy.Spider):
     def parse(self, response):
         name = response.xpath('//h1/text()').extract()
         return TestprojectItem(name=name)
+
+    @cpu_bound
+    def parse_cpu_bound(self, response):
+        yield self.parse(response)
+        for href in response.xpath('//a/@href').extract():
+            yield scrapy.Request(response.urljoin(href))
@@ -63,7 +63,10 @@ class BaseTestServer(object):
     def stop(self):
         if self.proc is None:
             raise RuntimeError("Server wasn't started")
-        self.proc.kill()
+        # test could stop server already, Python 2 fails to kill
+        # process that is reaped
+        if self.proc.poll() is None:
+            self.proc.kill()
         self.proc.wait()
         self.proc = None
 
@@ -127,3 +130,22 @@ class MockServer(BaseTestServer):
     def __init__(self, *args, **kwargs):
         super(MockServer, self).__init__(*args, **kwargs)
         self.cwd = os.path.join(SAMPLE_DATA, 'testsite')
+
+
+def make_server(request, *extra_args):
+    """Start Scrapyrt server with its target site for pytest fixture,
+    extra_args are added to Scrapyrt command line, e.g.
+    ``'-s', 'NAME=value'``. Both are stopped when test is finished."""
+    target_site = MockServer()
+    target_site.start()
+    server = ScrapyrtTestServer(site=target_site)
+    server.arguments.extend(extra_args)
+
+    def close():
+        server.stop()
+        target_site.stop()
+
+    request.addfinalizer(close)
+    server.target_site = target_site
+    server.start()
+    return server
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from copy import deepcopy
+
+from mock import patch
+from twisted.internet.defer import CancelledError, Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from scrapyrt.admission import AdmissionControl, CrawlRejected
+from scrapyrt.conf import settings
+
+
+class TestAdmissionControl(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = deepcopy(settings)
+        self.settings.CONCURRENT_CRAWLS = 2
+        self.settings.CONCURRENT_CRAWLS_PER_SPIDER = 1
+        self.settings.CRAWL_QUEUE_SIZE = 2
+        self.settings.CRAWL_QUEUE_TIMEOUT = 10
+        self.settings.CRAWL_QUEUE_RETRY_AFTER = 3
+        self.clock = Clock()
+        with patch('scrapyrt.admission.settings', self.settings):
+            self.admission = AdmissionControl(clock=self.clock)
+        self.crawls = []
+
+    def crawl(self, spider_name):
+        crawl_dfd = Deferred()
+        results = []
+        dfd = self.admission.run(spider_name, lambda: crawl_dfd)
+        dfd.addBoth(results.append)
+        self.crawls.append(crawl_dfd)
+        return crawl_dfd, results
+
+    def test_disabled(self):
+        self.settings.CONCURRENT_CRAWLS = 0
+        self.settings.CONCURRENT_CRAWLS_PER_SPIDER = 0
+        with patch('scrapyrt.admission.settings', self.settings):
+            admission = AdmissionControl(clock=self.clock)
+        results = []
+        admission.run('spider', succeed, 'result').addCallback(
+            results.append)
+        self.assertEqual(results, ['result'])
+        self.assertEqual(admission.get_stats()['admitted'], 0)
+
+    def test_run(self):
+        crawl_dfd, results = self.crawl('spider')
+        self.assertEqual(self.admission.active, 1)
+        crawl_dfd.callback('result')
+        self.assertEqual(results, ['result'])
+        self.assertEqual(self.admission.active, 0)
+        self.assertEqual(self.admission.get_stats()['admitted'], 1)
+
+    def test_spider_limit(self):
+        first_dfd, _ = self.crawl('spider')
+        second_dfd, second_results = self.crawl('spider')
+        other_dfd, _ = self.crawl('other')
+        stats = self.admission.get_stats()
+        self.assertEqual(stats['active'], 2)
+        self.assertEqual(stats['queued'], 1)
+        self.clock.advance(4)
+        first_dfd.callback('first')
+        stats = self.admission.get_stats()
+        self.assertEqual(stats['active'], 2)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['max_wait_time'], 4)
+        second_dfd.callback('second')
+        self.assertEqual(second_results, ['second'])
+
+    def test_global_limit_is_fifo(self):
+        self.crawl('a')
+        self.crawl('b')
+        self.crawl('c')
+        self.crawl('d')
+        self.assertEqual(self.admission.get_stats()['queued'], 2)
+        self.crawls[0].callback(None)
+        self.assertEqual(
+            [queued.spider_name for queued in self.admission.queue], ['d'])
+        self.assertIn('c', self.admission.active_spiders)
+
+    def test_queue_full(self):
+        for spider_name in ['a', 'b', 'c', 'd']:
+            self.crawl(spider_name)
+        _, results = self.crawl('e')
+        failure = results[0]
+        failure.trap(CrawlRejected)
+        self.assertEqual(int(failure.value.status), 503)
+        self.assertEqual(failure.value.retry_after, 3)
+        self.assertEqual(self.admission.get_stats()['rejected'], 1)
+
+    def test_queue_timeout(self):
+        self.crawl('spider')
+        _, results = self.crawl('spider')
+        self.clock.advance(10)
+        results[0].trap(CrawlRejected)
+        stats = self.admission.get_stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['timed_out'], 1)
+
+    def test_failed_crawl_is_released(self):
+        crawl_dfd, results = self.crawl('spider')
+        crawl_dfd.errback(Exception('boom'))
+        results[0].trap(Exception)
+        self.assertEqual(self.admission.active, 0)
+        self.assertEqual(dict(self.admission.active_spiders), {})
+
+    def test_cancel_queued(self):
+        self.crawl('spider')
+        _, results = self.crawl('spider')
+        dfd = self.admission.queue[0].dfd
+        dfd.cancel()
+        results[0].trap(CancelledError)
+        self.assertEqual(self.admission.get_stats()['queued'], 0)
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_cancel_running(self):
+        cancelled = []
+        crawl_dfd = Deferred(cancelled.append)
+        dfd = self.admission.run('spider', lambda: crawl_dfd)
+        dfd.addErrback(lambda failure: failure.trap(CancelledError))
+        dfd.cancel()
+        self.assertEqual(cancelled, [crawl_dfd])
+        self.assertEqual(self.admission.active, 0)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from copy import deepcopy
+
+from mock import patch
+from twisted.trial import unittest
+
+from scrapyrt.cache import MemoryResultCache
+from scrapyrt.conf import settings
+
+
+class TestMemoryResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = deepcopy(settings)
+        self.settings.RESULT_CACHE_TTL = 10
+        self.settings.RESULT_CACHE_SPIDER_TTL = {'no_cache': 0, 'long': 100}
+        self.settings.RESULT_CACHE_MAX_ITEMS = 3
+        self.settings.RESULT_CACHE_STALE_WHILE_REVALIDATE = 5
+        self.settings.RESULT_CACHE_STALE_IF_ERROR = 20
+        with patch('scrapyrt.cache.settings', self.settings):
+            self.cache = MemoryResultCache()
+        self.result = {'items': [1]}
+        self.now = 1000.0
+        time_patch = patch('scrapyrt.cache.time.time',
+                           side_effect=lambda: self.now)
+        time_patch.start()
+        self.addCleanup(time_patch.stop)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'spider', self.result)
+        entry = self.cache.get('key')
+        self.assertIs(entry.result, self.result)
+        self.assertTrue(entry.is_fresh())
+
+    def test_spider_ttl(self):
+        self.cache.set('key', 'no_cache', self.result)
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 'long', self.result)
+        self.now += 50
+        self.assertTrue(self.cache.get('key').is_fresh())
+
+    def test_spider_ttl_from_command_line(self):
+        self.settings.RESULT_CACHE_SPIDER_TTL = 'no_cache:0,long:100'
+        with patch('scrapyrt.cache.settings', self.settings):
+            cache = MemoryResultCache()
+        self.assertEqual(cache.get_ttl('no_cache'), 0)
+        self.assertEqual(cache.get_ttl('long'), 100)
+        self.assertEqual(cache.get_ttl('other'), 10)
+
+    def test_expiration(self):
+        self.cache.set('key', 'spider', self.result)
+        self.now += 12
+        entry = self.cache.get('key')
+        self.assertFalse(entry.is_fresh())
+        self.assertTrue(entry.can_revalidate())
+        self.assertTrue(entry.can_serve_on_error())
+        self.now += 10
+        entry = self.cache.get('key')
+        self.assertFalse(entry.can_revalidate())
+        self.assertTrue(entry.can_serve_on_error())
+        self.now += 10
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 'spider', {'items': [1]})
+        self.cache.set('b', 'spider', {'items': []})
+        self.cache.set('c', 'spider', {'items': [1]})
+        self.assertEqual(self.cache.size, 3)
+        # 'a' is used recently, so 'b' is evicted
+        self.cache.get('a')
+        self.cache.set('d', 'spider', {'items': [1]})
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
+        self.assertIsNotNone(self.cache.get('d'))
+        self.cache.set('e', 'spider', {'items': [1, 2, 3]})
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.size, 3)
+
+    def test_set_replaces_entry(self):
+        self.cache.set('key', 'spider', {'items': [1, 2]})
+        self.cache.set('key', 'spider', self.result)
+        self.assertEqual(self.cache.size, 1)
+        self.assertIs(self.cache.get('key').result, self.result)
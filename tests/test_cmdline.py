@@ -4,9 +4,13 @@ import tempfile
 from collections import namedtuple
 from os import path, chdir
 from scrapy.utils.conf import closest_scrapy_cfg
+from twisted.application.service import IServiceCollection
 from twisted.python.components import Componentized
 
-from scrapyrt.cmdline import find_scrapy_project, get_application
+from scrapyrt.cmdline import (
+    AdoptedPortServer, find_scrapy_project, get_application
+)
+from scrapyrt.workers import create_listening_socket
 from tests.utils import generate_project
 
 
@@ -53,3 +57,13 @@ class TestCmdLine(object):
     def test_get_application(self):
         app = get_application(make_fake_args())
         assert isinstance(app, Componentized)
+
+    def test_get_application_with_socket(self):
+        sock = create_listening_socket(0, '127.0.0.1')
+        try:
+            app = get_application(make_fake_args(), sock)
+            server = list(IServiceCollection(app))[0]
+            assert isinstance(server, AdoptedPortServer)
+            assert server.sock is sock
+        finally:
+            sock.close()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import zlib
+
+import pytest
+
+from scrapyrt.compression import (
+    compress_chunks, parse_accept_encoding, select_encoding, StreamCompressor
+)
+
+
+@pytest.mark.parametrize('accept_encoding,expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('deflate, gzip', 'gzip'),
+    ('GZIP;q=0.5, deflate', 'deflate'),
+    ('gzip;q=0, deflate;q=0', None),
+    ('br, *', 'gzip'),
+    ('*;q=0.1, deflate;q=0.8', 'deflate'),
+    ('gzip;q=foo', None),
+])
+def test_select_encoding(accept_encoding, expected):
+    assert select_encoding(accept_encoding) == expected
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip;q=0.5, br') == {
+        'gzip': 0.5, 'br': 1.0}
+
+
+@pytest.mark.parametrize('encoding,wbits', [
+    ('gzip', 16 + zlib.MAX_WBITS),
+    ('deflate', zlib.MAX_WBITS),
+])
+def test_compress_chunks(encoding, wbits):
+    chunks = [b'{"items": [', b'"x", ' * 100, b'"y"]}']
+    compressed = compress_chunks(chunks, encoding, 6)
+    assert zlib.decompress(b''.join(compressed), wbits) == b''.join(chunks)
+
+
+def test_stream_compressor():
+    compressor = StreamCompressor('gzip', 1)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for line in [b'{"a": 1}\n', b'{"b": 2}\n']:
+        assert decompressor.decompress(compressor.compress(line)) == line
+    assert decompressor.decompress(compressor.flush()) == b''
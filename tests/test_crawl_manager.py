@@ -7,15 +7,18 @@ import pytest
 from mock import patch, MagicMock
 from scrapy import Item
 from scrapy.exceptions import DontCloseSpider
-from scrapy.http import Response
+from scrapy.http import Request, Response
 from scrapy.settings import Settings
 from scrapy.utils.test import get_crawler
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import CancelledError, Deferred
+from twisted.internet.task import Clock
 from twisted.python.failure import Failure
 from twisted.trial import unittest
 from twisted.web.error import Error
 
-from scrapyrt.core import CrawlManager
+from scrapyrt.core import (
+    CRAWL_ID_META_KEY, CrawlDupeFilter, CrawlManager, DownloadTracker
+)
 from scrapyrt.conf import settings
 
 from .spiders import MetaSpider
@@ -44,12 +47,20 @@ class TestCrawlManager(unittest.TestCase):
 @patch('scrapyrt.core.ScrapyrtCrawlerProcess.crawl', return_value=Deferred())
 class TestCrawl(TestCrawlManager):
 
+    def setUp(self):
+        super(TestCrawl, self).setUp()
+        self.clock = Clock()
+        reactor_patch = patch('scrapyrt.core.reactor', self.clock)
+        reactor_patch.start()
+        self.addCleanup(reactor_patch.stop)
+
     def test_crawl(self, crawler_process_mock):
         result = self.crawl_manager.crawl()
         self.assertIsInstance(result, Deferred)
-        self.assertGreater(len(result.callbacks), 0)
+        crawl_dfd = crawler_process_mock.return_value
+        self.assertGreater(len(crawl_dfd.callbacks), 0)
         self.assertEqual(
-            result.callbacks[0][0][0], self.crawl_manager.return_items)
+            crawl_dfd.callbacks[0][0][0], self.crawl_manager.return_items)
 
     def test_no_spider(self, crawler_process_mock):
         # spider wasn't found
@@ -62,7 +73,7 @@ class TestCrawl(TestCrawlManager):
     def test_spider_exists(self, crawler_process_mock):
         result = self.crawl_manager.crawl()
         self.assertTrue(crawler_process_mock.called)
-        self.assertIs(result, crawler_process_mock.return_value)
+        self.assertIsInstance(result, Deferred)
 
     def test_spider_arguments_are_passed(self, crawler_process_mock):
         spider_args = ['a', 'b']
@@ -81,6 +92,225 @@ class TestGetProjectSettings(TestCrawlManager):
         result = self.crawl_manager.get_project_settings()
         self.assertIsInstance(result, Settings)
 
+    def test_log_file_per_crawl(self):
+        first = self.crawl_manager.get_project_settings()
+        self.assertFalse(first.frozen)
+        self.assertTrue(first.get('LOG_FILE'))
+        self.assertTrue(first.getbool('LOG_ENABLED'))
+        sleep(0.001)
+        second = self._create_crawl_manager().get_project_settings()
+        self.assertNotEqual(first.get('LOG_FILE'), second.get('LOG_FILE'))
+
+    def test_log_stream(self):
+        layout = settings.SPIDER_LOG_LAYOUT
+        settings.SPIDER_LOG_LAYOUT = 'spider'
+        try:
+            first = self.crawl_manager.get_project_settings()
+            second = self._create_crawl_manager().get_project_settings()
+        finally:
+            settings.SPIDER_LOG_LAYOUT = layout
+        self.assertIsNone(first.get('LOG_FILE'))
+        self.assertEqual(first.get('SCRAPYRT_CRAWL_ID'),
+                         self.crawl_manager.log_id)
+        self.assertNotEqual(first.get('SCRAPYRT_CRAWL_ID'),
+                            second.get('SCRAPYRT_CRAWL_ID'))
+
+
+@patch.object(settings, 'SPIDER_LOG_LEVEL', 'INFO')
+class TestLogLevel(TestCrawlManager):
+
+    def get_log_level(self, **kwargs):
+        return self.crawl_manager.get_project_settings(**kwargs).get(
+            'LOG_LEVEL')
+
+    def test_spider_log_level(self):
+        self.assertEqual(self.get_log_level(), 'INFO')
+        with patch.object(settings, 'SPIDER_LOG_LEVELS',
+                          {self.spider.name: 'WARNING'}):
+            self.assertEqual(self.get_log_level(), 'WARNING')
+
+    def test_debug_log(self):
+        self.crawl_manager.debug_log = True
+        self.assertEqual(self.get_log_level(), 'DEBUG')
+        # shared crawler isn't affected by debug of one crawl
+        self.assertEqual(self.get_log_level(shared=True), 'INFO')
+
+    @patch('scrapyrt.core.sample_debug_log', return_value=True)
+    def test_sampled_debug_log(self, sample_mock):
+        self.assertEqual(self.get_log_level(), 'DEBUG')
+
+
+@patch.object(settings, 'SPIDER_LOG_LAYOUT', 'memory')
+class TestLogBuffer(TestCrawlManager):
+
+    def test_get_project_settings(self):
+        crawl_settings = self.crawl_manager.get_project_settings()
+        self.assertIsNone(crawl_settings.get('LOG_FILE'))
+        self.assertIsNotNone(self.crawl_manager.log_buffer)
+        # log of shared crawler is written to file
+        shared_settings = self._create_crawl_manager().get_project_settings(
+            shared=True)
+        self.assertTrue(shared_settings.get('LOG_FILE'))
+
+    def test_include_log(self):
+        self.crawl_manager.get_project_settings()
+        self.crawl_manager.log_buffer.lines.append('line')
+        self.assertNotIn('log', self.crawl_manager.return_items(None))
+        self.crawl_manager.include_log = True
+        self.assertEqual(
+            self.crawl_manager.return_items(None)['log'], ['line'])
+
+    @patch('scrapyrt.log.LogBuffer.save')
+    def test_save_log(self, save_mock):
+        self.crawl_manager.get_project_settings()
+        self.assertEqual(self.crawl_manager.save_log('result'), 'result')
+        self.assertFalse(save_mock.called)
+        failure = Failure(Exception())
+        self.assertIs(self.crawl_manager.save_log(failure), failure)
+        self.assertEqual(save_mock.call_count, 1)
+        self.crawl_manager.log_buffer.errors = 1
+        self.crawl_manager.save_log('result')
+        self.assertEqual(save_mock.call_count, 2)
+
+
+class TestLimitTime(TestCrawlManager):
+
+    def setUp(self):
+        super(TestLimitTime, self).setUp()
+        self.clock = Clock()
+        reactor_patch = patch('scrapyrt.core.reactor', self.clock)
+        reactor_patch.start()
+        self.addCleanup(reactor_patch.stop)
+        self.crawler.stats.get_stats.return_value = {}
+        self.crawl_dfd = Deferred()
+        self.results = []
+
+    def limit_time(self):
+        self.crawl_dfd.addCallback(self.crawl_manager.return_items)
+        dfd = self.crawl_manager.limit_time(self.crawl_dfd)
+        dfd.addBoth(self.results.append)
+
+    def test_finished_in_time(self):
+        self.crawl_manager.timeout_limit = 10
+        self.limit_time()
+        self.crawl_manager.get_item(self.item, self.response, self.spider)
+        self.crawl_dfd.callback(None)
+        self.assertEqual(self.results[0]['items'], [self.item])
+        self.assertNotIn('partial', self.results[0])
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_timeout(self):
+        self.crawl_manager.timeout_limit = 10
+        self.limit_time()
+        self.crawl_manager.get_item(self.item, self.response, self.spider)
+        self.clock.advance(10)
+        self.crawler.engine.close_spider.assert_called_once_with(
+            self.spider, reason='timeout')
+        result = self.results[0]
+        self.assertEqual(result['items'], [self.item])
+        self.assertTrue(result['partial'])
+        self.assertEqual(result['partial_reason'], 'timeout')
+        # items scraped after results were returned are ignored
+        self.crawl_manager.get_item(Item(), self.response, self.spider)
+        self.crawl_dfd.callback(None)
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(self.crawl_manager.items, [self.item])
+
+    @patch('scrapyrt.core.time.time', return_value=1000.0)
+    def test_deadline(self, time_mock):
+        self.crawl_manager.deadline = 1000.25
+        self.assertEqual(self.crawl_manager.get_time_limit(),
+                         (0.25, 'deadline_exceeded'))
+        self.limit_time()
+        self.clock.advance(0.25)
+        self.assertEqual(self.results[0]['partial_reason'],
+                         'deadline_exceeded')
+
+    @patch('scrapyrt.core.time.time', return_value=1000.0)
+    def test_deadline_later_than_timeout(self, time_mock):
+        self.crawl_manager.timeout_limit = 10
+        self.crawl_manager.deadline = 1100
+        self.assertEqual(self.crawl_manager.get_time_limit(), (10, 'timeout'))
+
+    def test_cancel(self):
+        self.crawl_manager.timeout_limit = 10
+        self.crawl_dfd.addCallback(self.crawl_manager.return_items)
+        dfd = self.crawl_manager.limit_time(self.crawl_dfd)
+        self.crawl_manager.get_item(self.item, self.response, self.spider)
+        dfd.addErrback(lambda failure: failure.trap(CancelledError))
+        dfd.cancel()
+        self.crawler.engine.close_spider.assert_called_once_with(
+            self.spider, reason='client_disconnected')
+        self.assertEqual(self.crawl_manager.items, [])
+        self.assertFalse(self.clock.getDelayedCalls())
+        self.crawl_dfd.callback(None)
+
+    def test_max_items(self):
+        self.crawl_manager.timeout_limit = 10
+        self.crawl_manager.max_items = 2
+        self.limit_time()
+        self.crawl_manager.get_item(self.item, self.response, self.spider)
+        self.assertFalse(self.results)
+        self.crawl_manager.get_item(self.item, self.response, self.spider)
+        # results are returned without waiting for spider to close
+        self.crawler.engine.close_spider.assert_called_once_with(
+            self.spider, reason='max_items_reached')
+        result = self.results[0]
+        self.assertEqual(result['items'], [self.item, self.item])
+        self.assertEqual(result['stats']['finish_reason'],
+                         'max_items_reached')
+        self.assertNotIn('partial', result)
+        self.crawl_manager.get_item(Item(), self.response, self.spider)
+        self.assertEqual(len(self.crawl_manager.items), 2)
+        self.crawl_dfd.callback(None)
+        self.assertEqual(len(self.results), 1)
+
+    @patch('scrapyrt.core.log.err')
+    def test_failure_after_timeout(self, log_err_mock):
+        self.crawl_manager.timeout_limit = 10
+        self.limit_time()
+        self.clock.advance(10)
+        self.crawl_dfd.errback(Exception('boom'))
+        self.assertTrue(log_err_mock.called)
+
+
+class TestDownloadTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.handlers = MagicMock()
+        self.downloads = []
+
+        def download_request(request, spider):
+            dfd = Deferred()
+            self.downloads.append(dfd)
+            return dfd
+
+        self.handlers.download_request.side_effect = download_request
+        self.tracker = DownloadTracker(self.handlers)
+
+    def test_download_finished(self):
+        request = Request('http://localhost')
+        dfd = self.tracker.download_request(request, None)
+        self.assertIn(request, self.tracker.downloads)
+        self.downloads[0].callback('response')
+        self.assertEqual(self.tracker.downloads, {})
+        self.assertEqual(self.successResultOf(dfd), 'response')
+
+    def test_cancel(self):
+        first = Request('http://localhost/1')
+        second = Request('http://localhost/2')
+        first_dfd = self.tracker.download_request(first, None)
+        second_dfd = self.tracker.download_request(second, None)
+        self.tracker.cancel(lambda request: request is first)
+        self.failureResultOf(first_dfd, CancelledError)
+        self.assertNoResult(second_dfd)
+        self.tracker.cancel()
+        self.failureResultOf(second_dfd, CancelledError)
+        self.assertEqual(self.tracker.downloads, {})
+
+    def test_handlers_attributes(self):
+        self.assertIs(self.tracker._handlers, self.handlers._handlers)
+
 
 class TestSpiderIdle(TestCrawlManager):
 
@@ -205,10 +435,36 @@ class TestHandleSpiderError(TestCrawlManager):
         self.assertEqual(len(self.crawl_manager.errors), 0)
         self.crawl_manager.handle_spider_error(self.failure, self.spider)
         self.assertEqual(len(self.crawl_manager.errors), 1)
-        self.assertIn('Traceback', self.crawl_manager.errors[0])
-        self.assertIn(self.exception.__class__.__name__,
-                      self.crawl_manager.errors[0])
-        self.assertIn(self.exception_message, self.crawl_manager.errors[0])
+        error = self.crawl_manager.errors[0]
+        self.assertEqual(error['count'], 1)
+        self.assertIn('Traceback', error['traceback'])
+        self.assertIn(self.exception.__class__.__name__, error['traceback'])
+        self.assertIn(self.exception_message, error['traceback'])
+
+    def _raise(self, message):
+        try:
+            raise ValueError(message)
+        except ValueError:
+            return Failure()
+
+    def test_errors_grouped(self):
+        for i in range(3):
+            self.crawl_manager.handle_spider_error(
+                self._raise('error {}'.format(i)), self.spider)
+        self.crawl_manager.handle_spider_error(self.failure, self.spider)
+        errors = self.crawl_manager.errors
+        self.assertEqual([error['count'] for error in errors], [3, 1])
+        # traceback of first failure is kept
+        self.assertIn('error 0', errors[0]['traceback'])
+
+    def test_max_error_tracebacks(self):
+        self.crawl_manager.max_errors = 1
+        self.crawl_manager.handle_spider_error(self.failure, self.spider)
+        self.crawl_manager.handle_spider_error(
+            self._raise('error'), self.spider)
+        self.crawl_manager.handle_spider_error(self.failure, self.spider)
+        self.assertEqual(len(self.crawl_manager.errors), 1)
+        self.assertEqual(self.crawl_manager.errors[0]['count'], 2)
 
     def test_handle_spider_error_debug_false(self):
         self.crawl_manager.debug = False
@@ -257,6 +513,13 @@ class TestGetItem(TestCrawlManager):
             self.item, self.response, self.another_spider)
         self.assertEqual(len(self.crawl_manager.items), 0)
 
+    def test_get_item_stream(self):
+        self.crawl_manager.stream = MagicMock()
+        self.crawl_manager.get_item(self.item, self.response, self.spider)
+        self.crawl_manager.stream.write_item.assert_called_once_with(
+            self.item)
+        self.assertEqual(len(self.crawl_manager.items), 0)
+
 
 class TestCollectDropped(TestCrawlManager):
 
@@ -265,7 +528,7 @@ class TestCollectDropped(TestCrawlManager):
         self.exception = Exception('foo')
         self.expected_result = {
             'item': self.item,
-            'response': self.response,
+            'response': {'url': 'http://localhost', 'status': 200},
             'exception': str(self.exception)
         }
 
@@ -278,6 +541,13 @@ class TestCollectDropped(TestCrawlManager):
         self.assertEqual(
             self.crawl_manager.items_dropped[0], self.expected_result)
 
+    def test_max_dropped_items(self):
+        self.crawl_manager.max_dropped_items = 2
+        for _ in range(3):
+            self.crawl_manager.collect_dropped(
+                self.item, self.response, self.exception, self.spider)
+        self.assertEqual(len(self.crawl_manager.items_dropped), 2)
+
     def test_collect_dropped_another_spider(self):
         self.assertEqual(len(self.crawl_manager.items_dropped), 0)
         self.crawl_manager.collect_dropped(
@@ -382,6 +652,69 @@ class TestStartRequests(unittest.TestCase):
         self.assertEqual(self.start_requests_mock.call_count, 0)
 
 
+class TestWarmCrawler(TestCrawlManager):
+
+    def setUp(self):
+        super(TestWarmCrawler, self).setUp()
+        self._warm_spiders = settings.WARM_SPIDERS
+        settings.WARM_SPIDERS = [self.spider.name]
+
+    def tearDown(self):
+        settings.WARM_SPIDERS = self._warm_spiders
+
+    def test_use_warm_crawler(self):
+        self.assertTrue(self.crawl_manager.use_warm_crawler())
+        self.assertFalse(self.crawl_manager.use_warm_crawler('arg'))
+        self.crawl_manager.start_requests = True
+        self.assertFalse(self.crawl_manager.use_warm_crawler())
+
+    def test_use_warm_crawler_string_setting(self):
+        settings.WARM_SPIDERS = 'foo,{}'.format(self.spider.name)
+        self.assertTrue(self.crawl_manager.use_warm_crawler())
+        settings.WARM_SPIDERS = 'foo'
+        self.assertFalse(self.crawl_manager.use_warm_crawler())
+
+    def test_other_spider(self):
+        settings.WARM_SPIDERS = ['foo']
+        self.assertFalse(self.crawl_manager.use_warm_crawler())
+
+    def test_close_spider(self):
+        self.crawl_manager.warm_crawler = MagicMock()
+        self.crawl_manager.crawl_id = 1
+        self.crawl_manager.close_spider(self.spider, 'timeout')
+        self.crawl_manager.warm_crawler.finish.assert_called_once_with(
+            1, 'timeout')
+        self.assertFalse(self.crawler.engine.close_spider.called)
+
+
+class TestCrawlDupeFilter(unittest.TestCase):
+
+    def request(self, crawl_id=None):
+        meta = {} if crawl_id is None else {CRAWL_ID_META_KEY: crawl_id}
+        return Request('http://example.com', meta=meta)
+
+    def test_request_seen(self):
+        dupefilter = CrawlDupeFilter()
+        dupefilter.open_crawl(1)
+        dupefilter.open_crawl(2)
+        self.assertFalse(dupefilter.request_seen(self.request(1)))
+        self.assertTrue(dupefilter.request_seen(self.request(1)))
+        self.assertFalse(dupefilter.request_seen(self.request(2)))
+        # requests without crawl id are filtered as usual
+        self.assertFalse(dupefilter.request_seen(self.request()))
+        self.assertTrue(dupefilter.request_seen(self.request()))
+
+    def test_close_crawl(self):
+        dupefilter = CrawlDupeFilter()
+        dupefilter.open_crawl(1)
+        dupefilter.request_seen(self.request(1))
+        dupefilter.close_crawl(1)
+        self.assertEqual(dupefilter.crawl_fingerprints, {})
+        # late requests of finished crawl are dropped
+        self.assertTrue(dupefilter.request_seen(self.request(1)))
+        self.assertEqual(dupefilter.crawl_fingerprints, {})
+
+
 class TestCreateProperLogFile(TestCrawlManager):
     def test_filename(self):
         logdir = "some_dir_name"
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from mock import MagicMock
 from scrapy import signals
+from scrapy.crawler import CrawlerRunner
 from twisted.internet.defer import Deferred
 from twisted.trial import unittest
 
@@ -44,3 +45,22 @@ class CralwerProcessTestCase(unittest.TestCase):
                 signal=getattr(signals, signal), spider=crawler.spider)
             handler_mock = getattr(crawl_manager, handler)
             self.assertEquals(handler_mock.call_count, 1)
+
+    def test_spider_loader_is_shared(self):
+        settings = get_settings()
+        crawl_manager = CrawlManager('test', {'url': 'http://localhost'})
+        first = ScrapyrtCrawlerProcess(settings, crawl_manager)
+        second = ScrapyrtCrawlerProcess(settings, crawl_manager)
+        self.assertIs(first.spider_loader, second.spider_loader)
+
+    def test_runner_attributes(self):
+        settings = get_settings()
+        crawl_manager = CrawlManager('test', {'url': 'http://localhost'})
+        crawler_process = ScrapyrtCrawlerProcess(settings, crawl_manager)
+        runner = CrawlerRunner(settings)
+        # e.g. bootstrap_failed of Scrapy>=1.6 used when crawl is finished
+        self.assertEqual(set(vars(runner)) - set(vars(crawler_process)),
+                         set())
+        self.assertIs(crawler_process.settings, settings)
+        self.assertEqual(settings.getlist('SPIDER_MODULES'),
+                         runner.settings.getlist('SPIDER_MODULES'))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from copy import deepcopy
+
+from mock import MagicMock, patch
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+from twisted.web.error import Error
+
+from scrapyrt.admission import AdmissionControl
+from scrapyrt.conf import settings
+from scrapyrt.jobs import Job, JobStore
+
+
+class TestJob(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = MagicMock()
+        self.manager.spider_name = 'test'
+        self.job = Job(self.manager)
+
+    def test_start(self):
+        self.assertEqual(self.job.status, Job.PENDING)
+        self.job.start('arg', key='value')
+        self.manager.crawl.assert_called_once_with('arg', key='value')
+        self.assertEqual(self.job.status, Job.RUNNING)
+
+    def test_set_result(self):
+        self.job.start()
+        self.job.set_result({'items': []})
+        self.assertEqual(self.job.status, Job.FINISHED)
+        self.assertEqual(self.job.result, {'items': []})
+        self.assertTrue(self.job.done)
+        self.assertIsNone(self.job.manager)
+
+    def test_set_error(self):
+        self.job.set_error(Failure(Error('404', message='Spider not found')))
+        self.assertEqual(self.job.status, Job.FAILED)
+        self.assertEqual(self.job.error,
+                         {'code': 404, 'message': 'Spider not found'})
+
+    @patch('scrapyrt.jobs.log.err')
+    def test_set_unexpected_error(self, log_err_mock):
+        self.job.set_error(Failure(Exception('boom')))
+        self.assertTrue(log_err_mock.called)
+        self.assertEqual(self.job.error, {'code': 500, 'message': 'boom'})
+
+    def test_cancel_pending(self):
+        self.job.cancel()
+        self.assertEqual(self.job.status, Job.CANCELLED)
+        self.assertIsNone(self.job.start())
+        self.assertFalse(self.manager.crawl.called)
+
+    def test_cancel_running(self):
+        self.job.start()
+        self.job.cancel()
+        self.manager.close_spider.assert_called_once_with(
+            self.manager.crawler.spider, reason='cancelled')
+        self.job.set_result({'items': []})
+        self.assertEqual(self.job.status, Job.CANCELLED)
+
+    @patch('scrapyrt.jobs.log.err')
+    def test_cancel_running_then_error(self, log_err_mock):
+        self.job.start()
+        self.job.cancel()
+        self.job.set_error(Failure(Exception('boom')))
+        self.assertEqual(self.job.status, Job.CANCELLED)
+        self.assertEqual(self.job.error, {'code': 500, 'message': 'boom'})
+        self.assertTrue(self.job.done)
+
+    def test_cancel_queued(self):
+        admission_settings = deepcopy(settings)
+        admission_settings.CONCURRENT_CRAWLS = 1
+        admission_settings.CRAWL_QUEUE_SIZE = 1
+        with patch('scrapyrt.admission.settings', admission_settings):
+            admission = AdmissionControl(clock=Clock())
+        running = Deferred()
+        admission.run('other', lambda: running)
+        self.manager.crawl.return_value = Deferred()
+        dfd = self.job.crawl_dfd = admission.run('test', self.job.start)
+        dfd.addCallbacks(self.job.set_result, self.job.set_error)
+        self.assertEqual(len(admission.queue), 1)
+        self.job.cancel()
+        # job doesn't wait in queue until it's admitted
+        self.assertEqual(len(admission.queue), 0)
+        self.assertEqual(self.job.status, Job.CANCELLED)
+        self.assertTrue(self.job.done)
+        self.assertIsNone(self.job.error)
+        running.callback(None)
+        self.assertEqual(admission.active, 0)
+        self.assertFalse(self.manager.crawl.called)
+
+
+class TestJobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = deepcopy(settings)
+        self.settings.JOB_STORE_SIZE = 2
+        self.settings.JOB_RESULT_TTL = 10
+        with patch('scrapyrt.jobs.settings', self.settings):
+            self.store = JobStore()
+        self.now = 1000.0
+        time_patch = patch('scrapyrt.jobs.time.time',
+                           side_effect=lambda: self.now)
+        time_patch.start()
+        self.addCleanup(time_patch.stop)
+
+    def create_job(self):
+        job = Job(MagicMock())
+        self.store.add(job)
+        return job
+
+    def test_add_get(self):
+        job = self.create_job()
+        self.assertIs(self.store.get(job.id), job)
+        self.assertIsNone(self.store.get('unknown'))
+        self.assertEqual(self.store.get_stats()['pending'], 1)
+
+    def test_expiration(self):
+        job = self.create_job()
+        job.set_result({})
+        self.now += 5
+        self.assertIs(self.store.get(job.id), job)
+        self.now += 5
+        self.assertIsNone(self.store.get(job.id))
+        self.assertEqual(len(self.store), 0)
+
+    def test_evict_finished(self):
+        finished_job = self.create_job()
+        finished_job.set_result({})
+        running_job = self.create_job()
+        new_job = self.create_job()
+        self.assertIsNone(self.store.get(finished_job.id))
+        self.assertIs(self.store.get(running_job.id), running_job)
+        self.assertIs(self.store.get(new_job.id), new_job)
+
+    def test_store_full(self):
+        self.create_job()
+        self.create_job()
+        exception = self.assertRaises(Error, self.create_job)
+        self.assertEqual(int(exception.status), 503)
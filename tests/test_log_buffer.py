@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import tempfile
+
+from twisted.trial import unittest
+
+from scrapyrt.log import LogBuffer
+
+
+class TestLogBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = LogBuffer(2)
+        self.buffer.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+
+    def emit(self, message, level=logging.INFO):
+        self.buffer.emit(logging.LogRecord(
+            'scrapy', level, __file__, 1, message, (), None))
+
+    def test_emit(self):
+        self.emit('first')
+        self.emit('failed', logging.ERROR)
+        self.assertEqual(self.buffer.get_lines(),
+                         ['INFO: first', 'ERROR: failed'])
+        self.assertEqual(self.buffer.errors, 1)
+
+    def test_oldest_records_dropped(self):
+        for message in ('first', 'second', 'third'):
+            self.emit(message)
+        self.assertEqual(self.buffer.get_lines(), [
+            '[1 earlier log records dropped]', 'INFO: second', 'INFO: third'
+        ])
+
+    def test_save(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'spider', 'crawl.log')
+        self.emit(u'ünicode')
+        self.buffer.save(path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), u'INFO: ünicode\n'.encode('utf-8'))
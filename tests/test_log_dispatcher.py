@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from mock import MagicMock, patch
+from scrapy.utils.log import LogCounterHandler
+from scrapy.utils.test import get_crawler
+from twisted.trial import unittest
+
+from scrapyrt.core import ScrapyrtCrawler
+from scrapyrt import log
+from scrapyrt.log import (
+    remove_log_counter_handler, setup_spider_logging, spider_log_dispatcher,
+    SpiderLogDispatcher
+)
+
+from .spiders import MetaSpider
+
+
+class TestSpiderLogDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = SpiderLogDispatcher()
+        self.spider = MetaSpider()
+        self.spider.crawler = get_crawler(MetaSpider)
+        self.handler = MagicMock(level=logging.INFO)
+        self.dispatcher.register(self.spider, self.handler)
+
+    def make_record(self, level=logging.INFO, **extra):
+        record = logging.LogRecord(
+            'scrapy.core', level, __file__, 1, 'message', (), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_dispatch(self):
+        record = self.make_record(spider=self.spider)
+        self.dispatcher.handle(record)
+        self.handler.handle.assert_called_once_with(record)
+
+    def test_log_count(self):
+        self.dispatcher.handle(self.make_record(spider=self.spider))
+        self.dispatcher.handle(
+            self.make_record(logging.ERROR, spider=self.spider))
+        self.dispatcher.handle(
+            self.make_record(logging.DEBUG, spider=self.spider))
+        stats = self.spider.crawler.stats
+        self.assertEqual(stats.get_value('log_count/INFO'), 1)
+        self.assertEqual(stats.get_value('log_count/ERROR'), 1)
+        self.assertIsNone(stats.get_value('log_count/DEBUG'))
+
+    def test_other_records_ignored(self):
+        self.dispatcher.handle(self.make_record())
+        self.dispatcher.handle(self.make_record(spider=object()))
+        self.dispatcher.handle(
+            self.make_record(logging.DEBUG, spider=self.spider))
+        self.assertFalse(self.handler.handle.called)
+
+    def test_unregister(self):
+        other_handler = MagicMock()
+        # only handler that is registered is removed
+        self.dispatcher.unregister(self.spider, other_handler)
+        self.assertIs(self.dispatcher.handlers[self.spider], self.handler)
+        self.dispatcher.unregister(self.spider, self.handler)
+        self.assertEqual(self.dispatcher.handlers, {})
+
+
+class TestLogCounterHandler(unittest.TestCase):
+
+    def count_handlers(self):
+        return len([handler for handler in logging.root.handlers
+                    if isinstance(handler, LogCounterHandler)])
+
+    def test_removed(self):
+        handlers_count = self.count_handlers()
+        ScrapyrtCrawler(MetaSpider, {})
+        self.assertEqual(self.count_handlers(), handlers_count)
+
+    def test_other_crawler_handler_kept(self):
+        crawler = get_crawler(MetaSpider)
+        handler = LogCounterHandler(crawler)
+        logging.root.addHandler(handler)
+        self.addCleanup(logging.root.removeHandler, handler)
+        remove_log_counter_handler(MagicMock())
+        self.assertIn(handler, logging.root.handlers)
+        remove_log_counter_handler(crawler)
+        self.assertNotIn(handler, logging.root.handlers)
+
+    @patch.object(log, '_log_counter_handler_missing', False)
+    @patch('scrapyrt.log.msg')
+    def test_handler_not_found(self, msg_mock):
+        remove_log_counter_handler(MagicMock())
+        remove_log_counter_handler(MagicMock())
+        # warning is logged once
+        self.assertEqual(msg_mock.call_count, 1)
+        self.assertEqual(msg_mock.call_args[1]['level'], logging.WARNING)
+
+
+class TestSetupSpiderLogging(unittest.TestCase):
+
+    def test_single_root_handler(self):
+        spiders = [MagicMock(), MagicMock()]
+        handlers_count = len(logging.root.handlers)
+        cleanups = [
+            setup_spider_logging(spider, {'LOG_ENABLED': False})
+            for spider in spiders
+        ]
+        self.assertIn(spider_log_dispatcher, logging.root.handlers)
+        self.assertLessEqual(len(logging.root.handlers), handlers_count + 1)
+        for spider in spiders:
+            self.assertIn(spider, spider_log_dispatcher.handlers)
+        for cleanup in cleanups:
+            cleanup()
+        for spider in spiders:
+            self.assertNotIn(spider, spider_log_dispatcher.handlers)
+
+    def test_log_count_of_spider_records_only(self):
+        crawler = ScrapyrtCrawler(MetaSpider, {})
+        spider = crawler.spidercls.from_crawler(crawler)
+        crawler.stats.open_spider(spider)
+        cleanup = setup_spider_logging(
+            spider, {'LOG_ENABLED': False, 'LOG_LEVEL': 'INFO'})
+        self.addCleanup(cleanup)
+        for logger in (spider.logger.logger, logging.getLogger('scrapy'),
+                       logging.getLogger('twisted')):
+            self.addCleanup(logger.setLevel, logger.level)
+            logger.setLevel(logging.DEBUG)
+        spider.logger.info('counted')
+        spider.logger.debug('below log level')
+        logging.getLogger('scrapy.core.engine').warning(
+            'counted', extra={'spider': spider})
+        # records not bound to spider can't be told apart between
+        # concurrent crawls, they aren't counted in stats of any of them
+        logging.getLogger('twisted').error('not counted')
+        logging.getLogger('scrapy.core.engine').warning('not counted')
+        stats = crawler.stats.get_stats(spider)
+        self.assertEqual(stats.get('log_count/INFO'), 1)
+        self.assertEqual(stats.get('log_count/WARNING'), 1)
+        self.assertNotIn('log_count/ERROR', stats)
+        self.assertNotIn('log_count/DEBUG', stats)
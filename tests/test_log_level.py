@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from mock import patch
+from twisted.trial import unittest
+
+from scrapyrt.conf import settings
+from scrapyrt.log import get_spider_log_level, sample_debug_log
+
+
+class TestSpiderLogLevel(unittest.TestCase):
+
+    @patch.object(settings, 'SPIDER_LOG_LEVELS', {'quiet': 'WARNING'})
+    @patch.object(settings, 'SPIDER_LOG_LEVEL', 'INFO')
+    def test_get_spider_log_level(self):
+        self.assertEqual(get_spider_log_level('quiet'), 'WARNING')
+        self.assertEqual(get_spider_log_level('other'), 'INFO')
+
+    @patch.object(settings, 'SPIDER_LOG_LEVELS', 'quiet:WARNING,loud:DEBUG')
+    def test_levels_from_command_line(self):
+        self.assertEqual(get_spider_log_level('quiet'), 'WARNING')
+        self.assertEqual(get_spider_log_level('loud'), 'DEBUG')
+
+    @patch.object(settings, 'SPIDER_LOG_DEBUG_SAMPLING', 0)
+    def test_sampling_disabled(self):
+        self.assertFalse(any(sample_debug_log() for _ in range(10)))
+
+    @patch.object(settings, 'SPIDER_LOG_DEBUG_SAMPLING', '4')
+    def test_sample_debug_log(self):
+        samples = [sample_debug_log() for _ in range(20)]
+        self.assertEqual(samples.count(True), 5)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import tempfile
+
+from mock import MagicMock, patch
+from twisted.trial import unittest
+
+from scrapyrt.conf import settings
+from scrapy.http import Request, Response
+
+from scrapyrt.log import (
+    CRAWL_ID_META_KEY, get_log_id, get_log_stream, iter_crawl_log,
+    log_streams, LogStream, mark_log_stream, setup_spider_logging
+)
+
+
+class TestLogStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.stream = LogStream(self.tmp_dir, 'test')
+        self.addCleanup(self.stream.close)
+
+    def read_crawl_log(self, crawl_id, name='test'):
+        return list(iter_crawl_log(self.tmp_dir, name, crawl_id))
+
+    def test_write(self):
+        self.stream.mark('1', 'start')
+        self.stream.write('1', u'first\nsecond')
+        self.stream.mark('2', 'start')
+        self.stream.write('2', u'other crawl')
+        self.stream.mark('1', 'finish')
+        self.stream.write('2', u'after')
+        self.stream.mark('2', 'finish')
+        with open(os.path.join(self.tmp_dir, 'test.1.log'), 'rb') as f:
+            self.assertEqual(f.read().splitlines(), [
+                b'[1] first', b'[1] second', b'[2] other crawl', b'[2] after'
+            ])
+        self.assertEqual(self.read_crawl_log('1'), [b'first', b'second'])
+        self.assertEqual(self.read_crawl_log('2'),
+                         [b'other crawl', b'after'])
+        self.assertEqual(self.read_crawl_log('3'), [])
+
+    def test_crawl_not_finished(self):
+        self.stream.mark('1', 'start')
+        self.stream.write('1', u'running')
+        self.assertEqual(self.read_crawl_log('1'), [b'running'])
+
+    def test_rotate(self):
+        self.stream.max_bytes = 20
+        self.stream.backup_count = 1
+        self.stream.mark('1', 'start')
+        for i in range(4):
+            self.stream.write('1', u'line {}'.format(i))
+        self.assertEqual(self.stream.number, 3)
+        self.assertEqual(self.read_crawl_log('1'), [])
+        self.stream.mark('1', 'finish')
+        # only one rotated file is kept
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), [
+            'test.2.index', 'test.2.log', 'test.3.index', 'test.3.log'])
+        self.stream.mark('2', 'start')
+        self.stream.write('2', u'x')
+        self.stream.mark('2', 'finish')
+        self.assertEqual(self.read_crawl_log('2'), [b'x'])
+
+    def test_two_writers(self):
+        # e.g. two worker processes writing logs of the same spider
+        other = LogStream(self.tmp_dir, 'test')
+        self.addCleanup(other.close)
+        self.stream.mark('1', 'start')
+        other.mark('2', 'start')
+        self.stream.write('1', u'buffered', flush=False)
+        other.write('2', u'other process line')
+        self.stream.write('1', u'last', flush=False)
+        self.stream.mark('1', 'finish')
+        other.write('2', u'after')
+        other.mark('2', 'finish')
+        self.assertEqual(self.read_crawl_log('1'), [b'buffered', b'last'])
+        self.assertEqual(self.read_crawl_log('2'),
+                         [b'other process line', b'after'])
+        with open(os.path.join(self.tmp_dir, 'test.1.index'), 'rb') as f:
+            offsets = [int(line.split(b'\t')[2]) for line in f]
+        size = os.path.getsize(os.path.join(self.tmp_dir, 'test.1.log'))
+        self.assertEqual(offsets[2], size - len(b'[2] after\n'))
+        self.assertEqual(offsets[3], size)
+
+    def test_continue_existing_stream(self):
+        self.stream.max_bytes = 10
+        self.stream.backup_count = 1
+        self.stream.write('1', u'first line')
+        self.stream.write('1', u'second line')
+        self.stream.close()
+        stream = LogStream(self.tmp_dir, 'test')
+        self.assertEqual(stream.number, 2)
+
+
+class TestSetupSpiderLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.spider = MagicMock()
+        self.spider.name = 'test'
+        self.logger = logging.getLogger('scrapy.test')
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        for stream in log_streams.values():
+            stream.close()
+        log_streams.clear()
+
+    @patch.object(settings, 'SPIDER_LOG_LAYOUT', 'spider', create=True)
+    def test_log_stream(self):
+        with patch.object(settings, 'LOG_DIR', self.tmp_dir):
+            stream = get_log_stream('spider', 'test')
+            for crawl_id in ('1', '2'):
+                cleanup = setup_spider_logging(self.spider, {
+                    'SCRAPYRT_CRAWL_ID': crawl_id,
+                    'LOG_FORMAT': '%(levelname)s: %(message)s',
+                })
+                self.logger.info('crawl %s', crawl_id,
+                                 extra={'spider': self.spider})
+                cleanup()
+        # the same stream is used by all crawls of spider
+        self.assertEqual(list(log_streams.values()), [stream])
+        directory = os.path.join(self.tmp_dir, 'test')
+        self.assertEqual(list(iter_crawl_log(directory, 'test', '2')),
+                         [b'INFO: crawl 2'])
+
+    @patch.object(settings, 'SPIDER_LOG_LAYOUT', 'spider', create=True)
+    def test_log_stream_shared_crawler(self):
+        # crawls of warm crawler are indexed by their own log ids
+        with patch.object(settings, 'LOG_DIR', self.tmp_dir):
+            cleanup = setup_spider_logging(self.spider, {
+                'SCRAPYRT_CRAWL_ID': 'warm',
+                'LOG_FORMAT': '%(levelname)s: %(message)s',
+            })
+            for crawl_id in (1, 2):
+                mark_log_stream('test', get_log_id(crawl_id), 'start')
+            extra = {'spider': self.spider}
+            for crawl_id in (1, 2):
+                request = Request('http://example.com/{}'.format(crawl_id),
+                                  meta={CRAWL_ID_META_KEY: crawl_id})
+                response = Response(request.url, request=request)
+                self.logger.info('Crawled %(request)s',
+                                 {'request': request}, extra=extra)
+                self.logger.info('Scraped from %s', response, extra=extra)
+            self.logger.info('Spider idle', extra=extra)
+            for crawl_id in (1, 2):
+                mark_log_stream('test', get_log_id(crawl_id), 'finish')
+            cleanup()
+        directory = os.path.join(self.tmp_dir, 'test')
+        self.assertEqual(
+            list(iter_crawl_log(directory, 'test', get_log_id(1))), [
+                b'INFO: Crawled <GET http://example.com/1>',
+                b'INFO: Scraped from <200 http://example.com/1>',
+            ])
+        self.assertEqual(
+            list(iter_crawl_log(directory, 'test', get_log_id(2))), [
+                b'INFO: Crawled <GET http://example.com/2>',
+                b'INFO: Scraped from <200 http://example.com/2>',
+            ])
+        # records without request of crawl go to log of crawler
+        self.assertEqual(list(iter_crawl_log(directory, 'test', 'warm')),
+                         [b'INFO: Spider idle'])
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from mock import MagicMock, patch
+from twisted.trial import unittest
+
+from scrapyrt.conf import settings
+from scrapyrt.logqueue import LogWriter, QueuedFile
+
+
+class TestLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.writer = LogWriter()
+        self.addCleanup(self.writer.stop)
+        self.calls = []
+
+    def test_disabled(self):
+        f = MagicMock()
+        self.writer.write(self.calls.append, ('record',), f)
+        self.assertEqual(self.calls, ['record'])
+        self.assertTrue(f.flush.called)
+        self.assertIsNone(self.writer.thread)
+
+    @patch.object(settings, 'LOG_QUEUE_SIZE', 10)
+    def test_write_in_thread(self):
+        threads = []
+        f = MagicMock()
+
+        def write(record):
+            threads.append(threading.current_thread())
+            self.calls.append(record)
+
+        for i in range(3):
+            self.writer.write(write, (i,), f)
+        self.writer.stop()
+        self.assertEqual(self.calls, [0, 1, 2])
+        self.assertNotIn(threading.current_thread(), threads)
+        # file is flushed after batch, not after every write
+        self.assertGreaterEqual(f.flush.call_count, 1)
+        self.assertLessEqual(f.flush.call_count, 3)
+        self.assertEqual(self.writer.get_stats(),
+                         {'queued': 0, 'written': 3, 'dropped': 0})
+
+    @patch.object(settings, 'LOG_QUEUE_SIZE', 1)
+    def test_drop_when_full(self):
+        blocked = threading.Event()
+        release = threading.Event()
+
+        def block(record):
+            blocked.set()
+            release.wait(5)
+            self.calls.append(record)
+
+        self.writer.write(block, ('first',))
+        blocked.wait(5)
+        self.writer.write(self.calls.append, ('second',))
+        self.writer.write(self.calls.append, ('third',))
+        self.assertEqual(self.writer.dropped, 1)
+        release.set()
+        self.writer.stop()
+        self.assertEqual(self.calls, ['first', 'second'])
+
+    @patch.object(settings, 'LOG_QUEUE_SIZE', 1)
+    def test_not_droppable_when_full(self):
+        blocked = threading.Event()
+        release = threading.Event()
+
+        def block(record):
+            blocked.set()
+            release.wait(5)
+            self.calls.append(record)
+
+        self.writer.write(block, ('first',))
+        blocked.wait(5)
+        self.writer.write(self.calls.append, ('second',))
+        # queue is full, writer thread is released while close waits
+        threading.Timer(0.1, release.set).start()
+        f = MagicMock()
+        QueuedFile(f, self.writer).close()
+        self.writer.stop()
+        self.assertEqual(self.writer.dropped, 0)
+        self.assertEqual(self.calls, ['first', 'second'])
+        self.assertTrue(f.close.called)
+
+    @patch.object(settings, 'LOG_QUEUE_FULL_POLICY', 'foo')
+    @patch.object(settings, 'LOG_QUEUE_SIZE', 1)
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, self.writer.write, self.calls.append)
+
+    @patch.object(settings, 'LOG_QUEUE_SIZE', 10)
+    def test_queued_file(self):
+        f = MagicMock()
+        queued_file = QueuedFile(f, self.writer)
+        queued_file.write('line\n')
+        queued_file.flush()
+        queued_file.close()
+        self.writer.stop()
+        f.write.assert_called_once_with('line\n')
+        self.assertTrue(f.close.called)
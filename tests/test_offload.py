@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+import requests
+from mock import MagicMock, patch
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from six.moves import cPickle as pickle
+from twisted.trial import unittest
+
+from scrapyrt.conf import settings
+from scrapyrt.offload import (
+    _call_callback, _get_spider, CallbackPool, cpu_bound,
+    get_cpu_bound_callbacks, OffloadedCallbackError, response_from_dict,
+    response_to_dict
+)
+from .servers import make_server
+
+
+class OffloadSpider(Spider):
+
+    name = 'offload'
+    cpu_bound_callbacks = ['parse_listed']
+
+    def parse(self, response):
+        pass
+
+    @cpu_bound
+    def parse_marked(self, response):
+        yield {'title': response.xpath('//h1/text()').extract_first()}
+        yield Request(response.urljoin('next.html'), callback=self.parse,
+                      meta={'depth': 1})
+
+    def parse_listed(self, response):
+        raise ValueError('boom')
+
+
+class TestOffload(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = OffloadSpider()
+        self.response = HtmlResponse(
+            'http://example.com/page.html', body=b'<h1>Title</h1>',
+            request=Request('http://example.com/page.html',
+                            callback=self.spider.parse_marked))
+        spider_patch = patch('scrapyrt.offload._get_spider',
+                             return_value=OffloadSpider())
+        spider_patch.start()
+        self.addCleanup(spider_patch.stop)
+
+    def call_callback(self, callback_name):
+        task = pickle.dumps((
+            self.spider.name, callback_name,
+            response_to_dict(self.response, self.spider), ((), {})))
+        return pickle.loads(_call_callback(task))
+
+    def test_get_cpu_bound_callbacks(self):
+        self.assertEqual(get_cpu_bound_callbacks(self.spider),
+                         ['parse_listed', 'parse_marked'])
+
+    def test_response_from_dict(self):
+        response = response_from_dict(
+            response_to_dict(self.response, self.spider), self.spider)
+        self.assertIsInstance(response, HtmlResponse)
+        self.assertEqual(response.url, self.response.url)
+        self.assertEqual(response.body, self.response.body)
+        self.assertEqual(response.request.callback, self.spider.parse_marked)
+
+    def test_call_callback(self):
+        success, output = self.call_callback('parse_marked')
+        self.assertTrue(success)
+        self.assertEqual(output[0], (False, {'title': 'Title'}))
+        is_request, request = output[1]
+        self.assertTrue(is_request)
+        self.assertEqual(request['url'], 'http://example.com/next.html')
+        self.assertEqual(request['callback'], 'parse')
+
+    def test_call_failing_callback(self):
+        success, output = self.call_callback('parse_listed')
+        self.assertFalse(success)
+        self.assertIn('ValueError: boom', output)
+
+    def test_offload_callbacks(self):
+        pool = CallbackPool()
+        pool_mock = MagicMock()
+        pool_mock.apply_async.side_effect = (
+            lambda func, args, callback: callback(func(*args)))
+        pool.start = MagicMock(return_value=pool_mock)
+        pool.offload_callbacks(self.spider)
+        # offloaded callbacks can still be serialized with requests
+        self.assertEqual(
+            Request('http://example.com', callback=self.spider.parse_marked
+                    ).callback.__name__, 'parse_marked')
+        dfd = self.spider.parse_marked(self.response)
+        self.assertEqual(pool.pending, 1)
+
+        def check_results(results):
+            item, request = results
+            self.assertEqual(item, {'title': 'Title'})
+            self.assertEqual(request.callback, self.spider.parse)
+            self.assertEqual(request.meta, {'depth': 1})
+            self.assertEqual(pool.get_stats()['completed'], 1)
+
+        return dfd.addCallback(check_results)
+
+    def test_offloaded_callback_error(self):
+        pool = CallbackPool()
+        pool.start = MagicMock()
+        pool.start.return_value.apply_async.side_effect = (
+            lambda func, args, callback: callback(func(*args)))
+        pool.offload_callbacks(self.spider)
+        dfd = self.spider.parse_listed(self.response)
+        dfd = self.assertFailure(dfd, OffloadedCallbackError)
+        return dfd.addCallback(
+            lambda _: self.assertEqual(pool.get_stats()['failed'], 1))
+
+    def test_pickling_error(self):
+        pool = CallbackPool()
+        pool.start = MagicMock()
+        # spider argument can't be sent to pool process
+        pool.offload_callbacks(self.spider, kwargs={'lock': threading.Lock()})
+        dfd = self.spider.parse_marked(self.response)
+        dfd = self.assertFailure(dfd, OffloadedCallbackError)
+
+        def check_stats(exc):
+            self.assertIn("pickle", str(exc))
+            self.assertFalse(pool.start.return_value.apply_async.called)
+            self.assertEqual(pool.get_stats()['pending'], 0)
+            self.assertEqual(pool.get_stats()['failed'], 1)
+
+        return dfd.addCallback(check_stats)
+
+    @patch.object(settings, 'CALLBACK_POOL_TIMEOUT', 0)
+    def test_failing_callback_without_timeout(self):
+        # errors are returned by pool process as result, so that crawl
+        # doesn't wait for timeout or hang without it
+        pool = CallbackPool()
+        pool_mock = MagicMock()
+        pool_mock.apply_async.side_effect = (
+            lambda func, args, callback: callback(func(*args)))
+        pool.start = MagicMock(return_value=pool_mock)
+        pool.offload_callbacks(self.spider)
+        dfd = self.spider.parse_listed(self.response)
+        dfd = self.assertFailure(dfd, OffloadedCallbackError)
+        return dfd.addCallback(
+            lambda exc: self.assertIn('ValueError: boom', str(exc)))
+
+    @patch.object(settings, 'CALLBACK_POOL_TIMEOUT', 0.01)
+    def test_timeout(self):
+        pool = CallbackPool()
+        # result never comes, e.g. pool process was killed
+        pool.start = MagicMock()
+        pool.offload_callbacks(self.spider)
+        dfd = self.spider.parse_marked(self.response)
+        dfd = self.assertFailure(dfd, OffloadedCallbackError)
+        return dfd.addCallback(
+            lambda _: self.assertEqual(pool.get_stats()['pending'], 0))
+
+
+class TestGetSpider(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler = get_crawler(OffloadSpider)
+        crawler_patch = patch('scrapyrt.offload._get_crawler',
+                              return_value=self.crawler)
+        crawler_patch.start()
+        self.addCleanup(crawler_patch.stop)
+
+    def test_get_spider(self):
+        spider = _get_spider('offload', ((), {'category': 'books'}))
+        self.assertIs(spider.crawler, self.crawler)
+        self.assertIs(spider.settings, self.crawler.settings)
+        self.assertEqual(spider.category, 'books')
+        self.assertIs(_get_spider('offload', ((), {'category': 'books'})),
+                      spider)
+        other = _get_spider('offload', ((), {'category': 'games'}))
+        self.assertEqual(other.category, 'games')
+
+
+@pytest.fixture()
+def server(request):
+    return make_server(request, '-s', 'CALLBACK_POOL_SIZE=2')
+
+
+class TestCallbackPoolIntegration(object):
+
+    def test_crawl(self, server):
+        res = requests.get(server.url('crawl.json'), params={
+            'spider_name': 'test',
+            'url': server.target_site.url('index.html'),
+            'callback': 'parse_cpu_bound',
+            'max_requests': 3,
+        })
+        assert res.status_code == 200
+        names = sorted(item['name'][0] for item in res.json()['items'])
+        assert names == ['Page 1', 'Page 2', 'Test site']
+        metrics = requests.get(server.url('metrics.json')).json()
+        assert metrics['callback_pool']['completed'] == 1
+        assert metrics['callback_pool']['pending'] == 0
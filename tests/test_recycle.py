@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from copy import deepcopy
+
+from mock import MagicMock, patch
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from scrapyrt import recycle
+from scrapyrt.admission import CrawlRejected
+from scrapyrt.conf import settings
+from scrapyrt.recycle import get_rss, Recycler
+
+
+class TestRecycler(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = deepcopy(settings)
+        self.settings.RECYCLE_AFTER_CRAWLS = 2
+        self.settings.RECYCLE_MEMORY_LIMIT = 0
+        self.clock = Clock()
+        self.recycler = self.create_recycler()
+        reactor_patch = patch('scrapyrt.recycle.reactor')
+        self.reactor = reactor_patch.start()
+        self.addCleanup(reactor_patch.stop)
+
+    def create_recycler(self):
+        with patch('scrapyrt.recycle.settings', self.settings):
+            recycler = Recycler(clock=self.clock)
+        recycler.server = MagicMock()
+        return recycler
+
+    def crawl(self):
+        crawl_dfd = Deferred()
+        results = []
+        self.recycler.run(
+            self.recycler.count_crawl(lambda: crawl_dfd)
+        ).addBoth(results.append)
+        return crawl_dfd, results
+
+    def test_disabled(self):
+        self.settings.RECYCLE_AFTER_CRAWLS = 0
+        self.recycler = self.create_recycler()
+        self.assertFalse(self.recycler.enabled)
+        for _ in range(3):
+            self.crawl()[0].callback(None)
+        self.assertFalse(self.recycler.recycling)
+        self.assertEqual(self.recycler.get_stats()['crawls'], 3)
+
+    def test_recycle_after_crawls(self):
+        first_dfd, first_results = self.crawl()
+        second_dfd, _ = self.crawl()
+        first_dfd.callback('first')
+        self.assertEqual(first_results, ['first'])
+        self.assertFalse(self.recycler.recycling)
+        third_dfd, _ = self.crawl()
+        second_dfd.callback('second')
+        self.assertEqual(self.recycler.reason, '2 crawls finished')
+        self.assertTrue(self.recycler.server.stopService.called)
+        # running crawl is drained
+        self.clock.advance(recycle.EXIT_DELAY)
+        self.assertFalse(self.reactor.stop.called)
+        _, rejected = self.crawl()
+        rejected[0].trap(CrawlRejected)
+        third_dfd.callback('third')
+        self.clock.advance(recycle.EXIT_DELAY)
+        self.assertTrue(self.reactor.stop.called)
+
+    def test_failed_crawl_is_counted(self):
+        for _ in range(2):
+            crawl_dfd, results = self.crawl()
+            crawl_dfd.errback(Exception('boom'))
+            results[0].trap(Exception)
+        self.assertTrue(self.recycler.recycling)
+        self.assertEqual(self.recycler.active, 0)
+        self.clock.advance(recycle.EXIT_DELAY)
+        self.assertEqual(self.reactor.stop.call_count, 1)
+
+    def test_rejected_crawl_is_not_counted(self):
+        crawl = self.recycler.count_crawl(lambda: Deferred())
+        for _ in range(3):
+            # e.g. admission control rejects crawl without calling it
+            dfd = self.recycler.run(
+                lambda func: fail(CrawlRejected('Too many crawls', 5)),
+                crawl)
+            self.failureResultOf(dfd, CrawlRejected)
+        self.assertFalse(self.recycler.recycling)
+        self.assertEqual(self.recycler.get_stats()['crawls'], 0)
+        self.assertEqual(self.recycler.active, 0)
+
+    def test_wait_for_response(self):
+        request = MagicMock()
+        request_finished = Deferred()
+        request.notifyFinish.return_value = request_finished
+        self.recycler.track_request(request)
+        self.crawl()[0].callback(None)
+        crawl_dfd, _ = self.crawl()
+        crawl_dfd.callback(None)
+        self.assertTrue(self.recycler.recycling)
+        # response of crawl isn't written yet
+        self.clock.advance(recycle.EXIT_DELAY)
+        self.assertFalse(self.reactor.stop.called)
+        self.assertEqual(self.recycler.get_stats()['requests'], 1)
+        request_finished.callback(None)
+        self.clock.advance(recycle.EXIT_DELAY)
+        self.assertTrue(self.reactor.stop.called)
+
+    @patch('scrapyrt.recycle.get_rss', return_value=300 * 1024 * 1024)
+    def test_recycle_memory_limit(self, get_rss_mock):
+        self.settings.RECYCLE_AFTER_CRAWLS = 0
+        self.settings.RECYCLE_MEMORY_LIMIT = 256
+        self.recycler = self.create_recycler()
+        self.crawl()[0].callback(None)
+        self.assertEqual(self.recycler.reason,
+                         'memory usage 300M over limit 256M')
+        self.clock.advance(recycle.EXIT_DELAY)
+        self.assertTrue(self.reactor.stop.called)
+
+
+def test_get_rss():
+    assert get_rss() > 0
@@ -1,33 +1,58 @@
 # -*- coding: utf-8 -*-
 import json
+import os
+import threading
+import zlib
 
 import pytest
 import re
 from mock import MagicMock, patch, Mock
+from twisted.internet.defer import CancelledError, Deferred
+from twisted.python.failure import Failure
 from twisted.trial import unittest
 from twisted.web.error import Error
 import requests
 from twisted.web.server import Request
 
-from scrapyrt.resources import CrawlResource
+from scrapyrt.admission import CrawlRejected
+from scrapyrt.log import iter_crawl_log
+from scrapyrt.resources import (
+    CrawlResource, ItemStream, MetricsResource, RealtimeApi
+)
 
-from .servers import ScrapyrtTestServer, MockServer
+from .servers import make_server
 
 
 @pytest.fixture()
 def server(request):
-    target_site = MockServer()
-    target_site.start()
-    server = ScrapyrtTestServer(site=target_site)
+    return make_server(request)
 
-    def close():
-        server.stop()
-        target_site.stop()
 
-    request.addfinalizer(close)
-    server.target_site = target_site
-    server.start()
-    return server
+@pytest.fixture()
+def warm_server(request):
+    return make_server(request, '-s', 'WARM_SPIDERS=test')
+
+
+@pytest.fixture()
+def log_stream_server(request):
+    return make_server(request, '-s', 'SPIDER_LOG_LAYOUT=spider')
+
+
+@pytest.fixture()
+def warm_log_stream_server(request):
+    return make_server(request, '-s', 'WARM_SPIDERS=test',
+                       '-s', 'SPIDER_LOG_LAYOUT=spider')
+
+
+@pytest.fixture()
+def memory_log_server(request):
+    return make_server(request, '-s', 'SPIDER_LOG_LAYOUT=memory',
+                       '-s', 'SPIDER_LOG_LEVEL=INFO')
+
+
+@pytest.fixture()
+def thread_encode_server(request):
+    return make_server(request, '-s', 'JSON_ENCODE_THREAD_MIN_ITEMS=1')
 
 
 @pytest.fixture()
@@ -84,6 +109,66 @@ class TestCrawlResource(object):
             scrapy_params, api_params
         )
 
+    @patch('scrapyrt.resources.settings.COALESCE_CRAWLS', True)
+    def test_coalesce_identical_crawls(self, t_req, resource):
+        t_req.args = {
+            b'url': [b'http://foo'],
+            b'spider_name': [b'test']
+        }
+        headers = []
+        t_req.setHeader.side_effect = lambda *args: headers.append(args)
+        with patch('scrapyrt.core.CrawlManager', spec=True) as manager:
+            crawl_dfd = Deferred()
+            manager.return_value.crawl.return_value = crawl_dfd
+            first = resource.render_GET(t_req)
+            second = resource.render_GET(t_req)
+        assert manager.return_value.crawl.call_count == 1
+        assert headers == [('X-Scrapyrt-Coalesced', 'false'),
+                           ('X-Scrapyrt-Coalesced', 'true')]
+        results = []
+        first.addCallback(results.append)
+        second.addCallback(results.append)
+        crawl_dfd.callback({'items': [1], 'spider_name': 'test'})
+        assert len(results) == 2
+        assert results[0] == results[1]
+        assert results[0]['items'] == [1]
+
+    def test_identical_crawls_not_coalesced_by_default(self, t_req, resource):
+        t_req.args = {
+            b'url': [b'http://foo'],
+            b'spider_name': [b'test']
+        }
+        with patch('scrapyrt.core.CrawlManager', spec=True) as manager:
+            manager.return_value.crawl.return_value = Deferred()
+            resource.render_GET(t_req)
+            resource.render_GET(t_req)
+        assert manager.return_value.crawl.call_count == 2
+        assert not t_req.setHeader.called
+
+    @patch('scrapyrt.resources.time.time', return_value=1000.0)
+    def test_deadline(self, time_mock, t_req, resource):
+        t_req.args = {
+            b'url': [b'http://foo'],
+            b'spider_name': [b'test'],
+            b'deadline_ms': [b'250'],
+        }
+        with patch('scrapyrt.core.CrawlManager', spec=True) as manager:
+            manager.return_value.crawl.return_value = Deferred()
+            resource.render_GET(t_req)
+        assert manager.return_value.deadline == 1000.25
+
+    @pytest.mark.parametrize("value,expected", [
+        (None, None), ('', None), ('100', 100), (1500, 1500),
+    ])
+    def test_get_deadline_ms(self, resource, value, expected):
+        assert resource.get_deadline_ms({'deadline_ms': value}) == expected
+
+    @pytest.mark.parametrize("value", ['foo', '0', -5])
+    def test_invalid_deadline_ms(self, resource, value):
+        with pytest.raises(Error) as e:
+            resource.get_deadline_ms({'deadline_ms': value})
+        assert e.value.status == '400'
+
     def test_render_POST_invalid_json(self, t_req, resource):
         t_req.content.getvalue.return_value = b'{{{{{'
         with patch('scrapyrt.core.CrawlManager', spec=True) as manager:
@@ -93,6 +178,14 @@ class TestCrawlResource(object):
         assert re.search('Invalid JSON in POST', e.value.message)
         assert not manager.return_value.crawl.called
 
+    def test_render_POST_lenient_json(self, t_req, resource):
+        t_req.content.getvalue.return_value = (
+            b"{'spider_name': 'test', 'request': {'url': 'http://a.com'}}")
+        with patch.object(resource, 'prepare_crawl') as prepare_crawl:
+            resource.render_POST(t_req)
+        api_params = prepare_crawl.call_args[0][0]
+        assert api_params['spider_name'] == 'test'
+
     def test_render_POST_invalid_options(self, t_req, resource):
         t_req.content.getvalue.return_value = json.dumps({
             'spider_name': 'tests',
@@ -123,6 +216,17 @@ class TestCrawlResource(object):
             result = resource.validate_options(scrapy_args, api_args)
             assert result is None
 
+    def test_prepare_partial_response(self, resource):
+        result = {
+            'items': [1],
+            'stats': {},
+            'partial': True,
+            'partial_reason': 'deadline_exceeded',
+        }
+        response = resource.prepare_response(result)
+        assert response['partial'] is True
+        assert response['partial_reason'] == 'deadline_exceeded'
+
     def test_prepare_response(self, resource):
         result = {
             'items': [1, 2],
@@ -141,6 +245,258 @@ class TestCrawlResource(object):
             assert prepared_res[key] == value
 
 
+class TestCrawlResourceResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = CrawlResource()
+        self.resource.result_cache = MagicMock()
+        self.entry = MagicMock()
+        self.entry.result = {'items': ['cached']}
+        self.resource.result_cache.get.return_value = self.entry
+        self.crawl_dfd = Deferred()
+        self.crawl = Mock(return_value=self.crawl_dfd)
+        self.http_request = MagicMock(spec=Request)
+        self.results = []
+
+    def run_cached(self):
+        dfd = self.resource.run_cached_crawl(
+            'fingerprint', 'test', self.crawl, self.http_request)
+        dfd.addBoth(self.results.append)
+        return dfd
+
+    def test_fresh(self):
+        self.entry.is_fresh.return_value = True
+        self.run_cached()
+        self.assertFalse(self.crawl.called)
+        self.assertEqual(self.results, [self.entry.result])
+        self.http_request.setHeader.assert_called_with(
+            'X-Scrapyrt-Cache', 'HIT')
+
+    def test_miss(self):
+        self.resource.result_cache.get.return_value = None
+        self.run_cached()
+        self.assertTrue(self.crawl.called)
+        self.assertEqual(self.results, [])
+        result = {'items': [1], 'stats': {'finish_reason': 'finished'}}
+        self.crawl_dfd.callback(result)
+        self.assertEqual(self.results, [result])
+        self.resource.result_cache.set.assert_called_once_with(
+            'fingerprint', 'test', result)
+        self.http_request.setHeader.assert_any_call(
+            'X-Scrapyrt-Cache', 'MISS')
+
+    def test_dont_cache_unfinished(self):
+        self.resource.result_cache.get.return_value = None
+        self.run_cached()
+        self.crawl_dfd.callback(
+            {'items': [1], 'stats': {'finish_reason': 'timeout'}})
+        self.assertFalse(self.resource.result_cache.set.called)
+
+    def test_stale_while_revalidate(self):
+        self.entry.is_fresh.return_value = False
+        self.entry.can_revalidate.return_value = True
+        self.run_cached()
+        self.run_cached()
+        self.assertEqual(self.crawl.call_count, 1)
+        self.assertEqual(self.results, [self.entry.result] * 2)
+        self.http_request.setHeader.assert_called_with(
+            'X-Scrapyrt-Cache', 'STALE')
+        result = {'items': [1], 'stats': {'finish_reason': 'finished'}}
+        self.crawl_dfd.callback(result)
+        self.resource.result_cache.set.assert_called_once_with(
+            'fingerprint', 'test', result)
+
+    @patch('scrapyrt.resources.log.err')
+    def test_stale_if_error(self, log_err_mock):
+        self.entry.is_fresh.return_value = False
+        self.entry.can_revalidate.return_value = False
+        self.entry.can_serve_on_error.return_value = True
+        self.run_cached()
+        self.crawl_dfd.errback(Exception('boom'))
+        self.assertEqual(self.results, [self.entry.result])
+        self.http_request.setHeader.assert_called_with(
+            'X-Scrapyrt-Cache', 'STALE-IF-ERROR')
+
+    @patch('scrapyrt.resources.log.err')
+    def test_error_without_stale_entry(self, log_err_mock):
+        self.entry.is_fresh.return_value = False
+        self.entry.can_revalidate.return_value = False
+        self.entry.can_serve_on_error.return_value = False
+        self.run_cached()
+        self.crawl_dfd.errback(Exception('boom'))
+        self.assertIsInstance(self.results[0], Failure)
+
+
+class TestItemStream(unittest.TestCase):
+
+    def setUp(self):
+        self.request = MagicMock(spec=Request)
+        self.request.startedWriting = 0
+        self.written = []
+
+        def write(data):
+            self.request.startedWriting = 1
+            self.written.append(json.loads(data.decode('utf8')))
+
+        self.request.write.side_effect = write
+        self.stream = ItemStream(CrawlResource(), self.request)
+
+    def test_write_items(self):
+        self.stream.write_item({'name': 'a'})
+        self.request.setHeader.assert_any_call(
+            'Content-Type', 'application/x-ndjson')
+        self.request.setHeader.assert_any_call('Vary', 'Accept-Encoding')
+        self.stream.write_item({'name': 'b'})
+        self.stream.finish({'status': 'ok', 'items_count': 2})
+        self.assertEqual(self.written, [
+            {'name': 'a'}, {'name': 'b'}, {'status': 'ok', 'items_count': 2}
+        ])
+        self.assertTrue(self.request.finish.called)
+        self.assertEqual(self.stream.items_count, 2)
+
+    def test_fail_before_items(self):
+        failure = Failure(Exception('boom'))
+        self.assertIs(self.stream.fail(failure), failure)
+        self.assertFalse(self.request.finish.called)
+
+    @patch('scrapyrt.resources.log.err')
+    def test_fail_after_items(self, log_err_mock):
+        self.stream.write_item({'name': 'a'})
+        self.stream.fail(Failure(Exception('boom')))
+        self.assertTrue(log_err_mock.called)
+        self.assertEqual(self.written[-1], {
+            'status': 'error', 'message': 'boom', 'code': 500})
+        self.assertTrue(self.request.finish.called)
+
+    def test_write_item_fields(self):
+        stream = ItemStream(CrawlResource(), self.request, ['name'])
+        stream.write_item({'name': 'a', 'price': 1})
+        self.assertEqual(self.written, [{'name': 'a'}])
+
+    def test_compressed_stream(self):
+        self.request.getHeader.return_value = 'gzip'
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        written = []
+
+        def write(data):
+            self.request.startedWriting = 1
+            written.append(decompressor.decompress(data))
+
+        self.request.write.side_effect = write
+        self.stream.write_item({'name': 'a'})
+        self.request.setHeader.assert_any_call('Content-Encoding', 'gzip')
+        self.request.setHeader.assert_any_call('Vary', 'Accept-Encoding')
+        # every item can be decompressed as soon as it's received
+        self.assertEqual(json.loads(written[0].decode('utf8')),
+                         {'name': 'a'})
+        self.stream.finish({'status': 'ok'})
+        self.assertEqual(
+            json.loads(b''.join(written).splitlines()[-1].decode('utf8')),
+            {'status': 'ok'})
+
+
+class TestCrawlResourceGetStreamFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = CrawlResource()
+        self.request = MagicMock(spec=Request)
+        self.request.getHeader.return_value = None
+
+    def test_no_stream(self):
+        self.assertIsNone(self.resource.get_stream_format({}, self.request))
+
+    def test_stream_parameter(self):
+        self.assertEqual(self.resource.get_stream_format(
+            {'stream': 'ndjson'}, self.request), 'ndjson')
+
+    def test_accept_header(self):
+        self.request.getHeader.return_value = 'application/x-ndjson'
+        self.assertEqual(
+            self.resource.get_stream_format({}, self.request), 'ndjson')
+
+    def test_unsupported_format(self):
+        exception = self.assertRaises(
+            Error, self.resource.get_stream_format,
+            {'stream': 'xml'}, self.request)
+        self.assertEqual(exception.status, '400')
+
+
+class TestCrawlResourceAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = CrawlResource()
+        self.request = MagicMock(spec=Request)
+        self.request.code = 200
+
+        def set_code(code):
+            self.request.code = code
+
+        self.request.setResponseCode.side_effect = set_code
+
+    def test_rejected_crawl(self):
+        failure = Failure(CrawlRejected('Too many crawls', 7))
+        result = self.resource.handle_error(failure, self.request)
+        self.request.setHeader.assert_called_once_with('Retry-After', '7')
+        self.assertEqual(result['code'], 503)
+
+    def test_get_stats(self):
+        stats = self.resource.get_stats()
+        self.assertEqual(stats['crawls_in_flight'], 0)
+
+    def test_client_disconnected(self):
+        result = Mock()
+        self.resource.client_disconnected(self.request, result)
+        self.assertTrue(result.cancel.called)
+
+    def test_abandoned_crawl(self):
+        dfd = self.resource.admit_crawl('test', Deferred)
+        self.resource.client_disconnected(self.request, dfd)
+        self.failureResultOf(dfd, CancelledError)
+        self.assertEqual(self.resource.get_stats()['crawls_abandoned'], 1)
+
+    @patch('scrapyrt.resources.settings.COALESCE_CRAWLS', True)
+    def test_abandoned_coalesced_crawl(self):
+        crawl_dfd = Deferred()
+
+        def crawl():
+            return self.resource.admit_crawl('test', lambda: crawl_dfd)
+
+        first = self.resource.run_coalesced_crawl('key', crawl)
+        second = self.resource.run_coalesced_crawl('key', crawl)
+        self.resource.client_disconnected(self.request, first)
+        self.failureResultOf(first, CancelledError)
+        # crawl keeps running for second call
+        self.assertEqual(self.resource.get_stats()['crawls_abandoned'], 0)
+        self.resource.client_disconnected(self.request, second)
+        self.failureResultOf(second, CancelledError)
+        self.assertEqual(self.resource.get_stats()['crawls_abandoned'], 1)
+
+    def test_admission_is_shared(self):
+        root = RealtimeApi()
+        self.assertIs(root.children[b'crawl.json'].admission, root.admission)
+
+    def test_metrics(self):
+        root = MagicMock()
+        root.admission = self.resource.admission
+        root.recycler = self.resource.recycler
+        root.children = {b'crawl.json': self.resource, b'other': object()}
+        metrics = MetricsResource(root).render_GET(self.request)
+        self.assertEqual(metrics['crawl.json'], self.resource.get_stats())
+        self.assertEqual(metrics['crawls']['active'], 0)
+        self.assertEqual(metrics['crawls']['queued'], 0)
+        self.assertIn('settings_cache', metrics)
+        self.assertNotIn('other', metrics)
+        self.assertNotIn('recycle', metrics)
+
+    def test_recycling_rejects_crawl(self):
+        self.resource.recycler.reason = '100 crawls finished'
+        manager = Mock()
+        dfd = self.resource.admit_crawl('test', manager.crawl)
+        failure = self.failureResultOf(dfd, CrawlRejected)
+        self.assertEqual(int(failure.value.status), 503)
+        self.assertFalse(manager.crawl.called)
+
+
 class TestCrawlResourceGetRequiredArgument(unittest.TestCase):
 
     def setUp(self):
@@ -164,6 +520,102 @@ class TestCrawlResourceGetRequiredArgument(unittest.TestCase):
         self.assertEqual(exception.status, '400')
 
 
+class TestCrawlResourceGetMaxItems(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = CrawlResource()
+
+    def test_get_max_items(self):
+        self.assertIsNone(self.resource.get_max_items({}))
+        self.assertEqual(self.resource.get_max_items({'max_items': '3'}), 3)
+        self.assertEqual(self.resource.get_max_items({'first_item': '1'}), 1)
+
+    def test_invalid_max_items(self):
+        for value in ('0', 'a', -1):
+            exception = self.assertRaises(
+                Error, self.resource.get_max_items, {'max_items': value})
+            self.assertEqual(exception.status, '400')
+
+
+class TestCrawlResourceIncludeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = CrawlResource()
+
+    def test_get_bool_argument(self):
+        for value in ('true', '1', 'yes', True, 1):
+            self.assertTrue(self.resource.get_bool_argument(
+                {'include_log': value}, 'include_log'))
+        for value in ('false', '0', '', False, None):
+            self.assertFalse(self.resource.get_bool_argument(
+                {'include_log': value}, 'include_log'))
+
+    def test_include_log_requires_memory_layout(self):
+        exception = self.assertRaises(
+            Error, self.resource.get_include_log, {'include_log': 'true'})
+        self.assertEqual(exception.status, '400')
+        with patch('scrapyrt.resources.settings.SPIDER_LOG_LAYOUT', 'memory'):
+            self.assertTrue(
+                self.resource.get_include_log({'include_log': 'true'}))
+
+
+class TestCrawlResourceResponseFilters(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = CrawlResource()
+        self.result = {
+            'items': [{'name': 'a', 'price': 1}, {'name': 'b', 'price': 2}],
+            'items_dropped': [],
+            'stats': {'finish_reason': 'finished',
+                      'downloader/request_count': 1},
+            'spider_name': 'test',
+        }
+
+    def test_get_list_argument(self):
+        get_list_argument = self.resource.get_list_argument
+        self.assertIsNone(get_list_argument({}, 'fields'))
+        self.assertEqual(get_list_argument(
+            {'fields': 'name, price,'}, 'fields'), ['name', 'price'])
+        self.assertEqual(get_list_argument(
+            {'fields': ['name', 'price']}, 'fields'), ['name', 'price'])
+        for value in (1, {'name': 1}, ['name', 1]):
+            exception = self.assertRaises(
+                Error, get_list_argument, {'fields': value}, 'fields')
+            self.assertEqual(exception.status, '400')
+
+    def test_unknown_omit_key(self):
+        exception = self.assertRaises(
+            Error, self.resource.validate_options,
+            {'url': 'http://localhost'}, {'omit': 'items'})
+        self.assertEqual(exception.status, '400')
+
+    def test_no_filters(self):
+        response = self.resource.prepare_response(
+            self.result, request_data={'spider_name': 'test'})
+        self.assertEqual(response['items'], self.result['items'])
+        self.assertEqual(response['stats'], self.result['stats'])
+
+    def test_filter_response(self):
+        api_params = {
+            'fields': 'name',
+            'stats': 'finish_reason',
+            'omit': 'items_dropped',
+        }
+        response = self.resource.prepare_response(
+            self.result, request_data=api_params)
+        self.assertEqual(response['items'], [{'name': 'a'}, {'name': 'b'}])
+        self.assertEqual(response['stats'], {'finish_reason': 'finished'})
+        self.assertNotIn('items_dropped', response)
+        # result can be shared by coalesced crawls and isn't changed
+        self.assertEqual(self.result['items'][0], {'name': 'a', 'price': 1})
+        self.assertIn('downloader/request_count', self.result['stats'])
+
+    def test_omit_stats(self):
+        response = self.resource.prepare_response(
+            self.result, request_data={'omit': ['stats', 'errors']})
+        self.assertNotIn('stats', response)
+
+
 def perform_get(url, api_params, spider_data):
     api_params.update(spider_data)
     return requests.get(url, params=api_params)
@@ -366,6 +818,34 @@ class TestCrawlResourceIntegration(object):
         assert len(res_json['items']) == len(expected_items)
         assert res_json["items"] == expected_items
 
+    @pytest.mark.parametrize("method", [
+        perform_get, perform_post
+    ])
+    def test_crawl_response_filters(self, server, method):
+        url = server.url("crawl.json")
+        res = method(url,
+                     {"spider_name": "test", "fields": "nothing",
+                      "stats": "finish_reason", "omit": "items_dropped"},
+                     {"url": server.target_site.url("page1.html")})
+        res_json = res.json()
+        assert res_json["status"] == "ok"
+        assert res_json["items"] == [{}]
+        assert res_json["stats"] == {"finish_reason": "finished"}
+        assert "items_dropped" not in res_json
+
+    @pytest.mark.parametrize("method", [
+        perform_get, perform_post
+    ])
+    def test_crawl_first_item(self, server, method):
+        url = server.url("crawl.json")
+        res = method(url,
+                     {"spider_name": "test", "first_item": True},
+                     {"url": server.target_site.url("page1.html")})
+        res_json = res.json()
+        assert res_json["status"] == "ok"
+        assert res_json["items"] == [{u'name': ['Page 1']}]
+        assert res_json["stats"]["finish_reason"] == "max_items_reached"
+
     def test_invalid_json_in_post(self, server):
         res = requests.post(server.url("crawl.json"), data="ads")
         assert res.status_code == 400
@@ -378,3 +858,204 @@ class TestCrawlResourceIntegration(object):
             assert res_json[k] == v
         msg = "Invalid JSON in POST body"
         assert msg in res_json['message']
+
+    @pytest.mark.parametrize("method", [
+        perform_get, perform_post
+    ])
+    def test_crawl_warm_spider(self, warm_server, method):
+        url = warm_server.url("crawl.json")
+        for page, name in [('page1.html', 'Page 1'), ('page2.html', 'Page 2')]:
+            res = method(url,
+                         {"spider_name": "test"},
+                         {"url": warm_server.target_site.url(page)})
+            res_json = res.json()
+            assert res_json["status"] == "ok"
+            assert res_json["items"] == [{u'name': [name]}]
+            assert res_json["stats"]["finish_reason"] == "finished"
+            assert res_json["stats"]["scheduler/enqueued"] == 1
+
+    def test_crawl_warm_spider_repeated(self, warm_server):
+        # follow-up requests of previous crawl aren't filtered as duplicates
+        for _ in range(2):
+            res = perform_get(warm_server.url("crawl.json"),
+                              {"spider_name": "test"},
+                              {"url": warm_server.target_site.url(
+                                  "index.html"),
+                               "callback": "parse_cpu_bound"})
+            res_json = res.json()
+            assert res_json["status"] == "ok"
+            assert len(res_json["items"]) == 3
+
+    @pytest.mark.parametrize("method", [
+        perform_get, perform_post
+    ])
+    def test_crawl_stream(self, server, method):
+        url = server.url("crawl.json")
+        res = method(url,
+                     {"spider_name": "test", "stream": "ndjson"},
+                     {"url": server.target_site.url("page1.html")})
+        assert res.status_code == 200
+        assert res.headers['Content-Type'] == 'application/x-ndjson'
+        assert res.headers['Transfer-Encoding'] == 'chunked'
+        # requests accepts gzip by default
+        assert res.headers['Content-Encoding'] == 'gzip'
+        records = [json.loads(line) for line in res.text.splitlines()]
+        assert records[:-1] == [{u'name': [u'Page 1']}]
+        trailer = records[-1]
+        assert trailer["status"] == "ok"
+        assert "items" not in trailer
+        assert trailer["items_count"] == 1
+        assert trailer["items_dropped"] == []
+        assert trailer["stats"]["finish_reason"] == "finished"
+
+    def test_crawl_stream_spider_not_found(self, server):
+        res = perform_get(server.url("crawl.json"),
+                          {"spider_name": "unknown", "stream": "ndjson"},
+                          {"url": server.target_site.url("page1.html")})
+        assert res.status_code == 404
+        assert res.json()["status"] == "error"
+
+    def test_metrics(self, server):
+        res = requests.get(server.url("metrics.json"))
+        assert res.status_code == 200
+        res_json = res.json()
+        assert res_json["status"] == "ok"
+        assert res_json["crawls"]["queued"] == 0
+
+    def test_crawl_log_stream(self, log_stream_server):
+        server = log_stream_server
+        for _ in range(2):
+            res = perform_get(server.url("crawl.json"),
+                              {"spider_name": "test"},
+                              {"url": server.target_site.url("page1.html")})
+            assert res.json()["status"] == "ok"
+        log_dir = os.path.join(server.cwd, 'logs', 'test')
+        assert sorted(os.listdir(log_dir)) == ['test.1.index', 'test.1.log']
+        with open(os.path.join(log_dir, 'test.1.index')) as f:
+            crawl_ids = [line.split('\t')[0] for line in f]
+        assert len(set(crawl_ids)) == 2
+        lines = list(iter_crawl_log(log_dir, 'test', crawl_ids[-1]))
+        assert any(b'Spider closed (finished)' in line for line in lines)
+
+    def test_crawl_log_stream_warm_spider(self, warm_log_stream_server):
+        server = warm_log_stream_server
+        pages = ['page1.html', 'page2.html']
+        results = {}
+
+        def crawl(page):
+            results[page] = perform_get(
+                server.url("crawl.json"), {"spider_name": "test"},
+                {"url": server.target_site.url(page)}).json()
+
+        threads = [threading.Thread(target=crawl, args=(page,))
+                   for page in pages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [results[page]["status"] for page in pages] == ['ok', 'ok']
+        log_dir = os.path.join(server.cwd, 'logs', 'test')
+        with open(os.path.join(log_dir, 'test.1.index')) as f:
+            crawl_ids = sorted(set(line.split('\t')[0] for line in f))
+        # warm crawler and both crawls have their own ids
+        assert len(crawl_ids) == 3
+        crawled = {}
+        for crawl_id in crawl_ids:
+            lines = list(iter_crawl_log(log_dir, 'test', crawl_id))
+            for page in pages:
+                if any(page.encode('ascii') in line for line in lines):
+                    crawled.setdefault(page, []).append(crawl_id)
+        # lines of every crawl are found only in its own log
+        assert sorted(crawled) == pages
+        assert all(len(ids) == 1 for ids in crawled.values())
+
+    @pytest.mark.parametrize("method", [
+        perform_get, perform_post
+    ])
+    def test_crawl_include_log(self, memory_log_server, method):
+        server = memory_log_server
+        res = method(server.url("crawl.json"),
+                     {"spider_name": "test", "include_log": "true"},
+                     {"url": server.target_site.url("page1.html")})
+        res_json = res.json()
+        assert res_json["status"] == "ok"
+        assert any('Spider closed' in line for line in res_json["log"])
+        assert not any('DEBUG' in line for line in res_json["log"])
+        # crawl didn't fail, log isn't written to file
+        assert not os.path.exists(os.path.join(server.cwd, 'logs', 'test'))
+
+    def test_crawl_debug_log(self, memory_log_server):
+        server = memory_log_server
+        res = perform_get(server.url("crawl.json"),
+                          {"spider_name": "test", "include_log": "true",
+                           "debug": "true"},
+                          {"url": server.target_site.url("page1.html")})
+        res_json = res.json()
+        assert any('DEBUG: Crawled (200)' in line
+                   for line in res_json["log"])
+
+    def test_crawl_encoded_in_thread(self, thread_encode_server):
+        server = thread_encode_server
+        res = perform_get(server.url("crawl.json"),
+                          {"spider_name": "test"},
+                          {"url": server.target_site.url("page1.html")})
+        assert res.status_code == 200
+        assert res.json()["items"] == [{"name": ["Page 1"]}]
+        assert int(res.headers["Content-Length"]) == len(res.content)
+        stats = requests.get(server.url("metrics.json")).json()
+        assert stats["crawl.json"]["json_encode"]["in_thread"] == 1
+
+    def test_batch_crawl(self, server):
+        res = requests.post(server.url("crawl.json"), json={
+            "spider_name": "test",
+            "requests": [
+                {"url": server.target_site.url("page1.html")},
+                {"url": server.target_site.url("page2.html")},
+                {"url": server.target_site.url("page3.html"),
+                 "callback": "unknown"},
+            ]
+        })
+        assert res.status_code == 200
+        res_json = res.json()
+        assert res_json["status"] == "ok"
+        assert res_json["spider_name"] == "test"
+        first, second, third = res_json["results"]
+        assert first["status"] == "ok"
+        assert first["items"] == [{u'name': [u'Page 1']}]
+        assert first["stats"]["finish_reason"] == "finished"
+        assert first["stats"]["scheduler/enqueued"] == 1
+        assert second["items"] == [{u'name': [u'Page 2']}]
+        assert third["status"] == "error"
+        assert third["code"] == 500
+
+    def test_batch_crawl_same_requests(self, server):
+        request = {"url": server.target_site.url("index.html"),
+                   "callback": "parse_cpu_bound"}
+        res = requests.post(server.url("crawl.json"), json={
+            "spider_name": "test",
+            "requests": [request, request],
+        })
+        results = res.json()["results"]
+        assert [len(result["items"]) for result in results] == [3, 3]
+
+    @pytest.mark.parametrize("requests_param,message", [
+        ("foo", "'requests' must be a list"),
+        ([], "Missing required parameter: 'requests'"),
+        ([{"url": "http://example.com", "foo": "bar"}],
+         "requests[0]: 'foo' is not a valid argument"),
+        ([{"method": "POST"}], "requests[0]: 'url' is required"),
+    ])
+    def test_invalid_batch_crawl(self, server, requests_param, message):
+        res = requests.post(server.url("crawl.json"), json={
+            "spider_name": "test",
+            "requests": requests_param,
+        })
+        assert res.status_code == 400
+        assert message in res.json()["message"]
+
+    def test_batch_crawl_spider_not_found(self, server):
+        res = requests.post(server.url("crawl.json"), json={
+            "spider_name": "unknown",
+            "requests": [{"url": server.target_site.url("page1.html")}],
+        })
+        assert res.status_code == 404
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+import requests
+
+from .servers import make_server
+
+
+@pytest.fixture()
+def server(request):
+    return make_server(request)
+
+
+def wait_for_job(server, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        res = requests.get(server.url("jobs.json"), params={"job_id": job_id})
+        res_json = res.json()
+        if res_json["job_status"] not in ("pending", "running"):
+            return res_json
+        time.sleep(0.1)
+    raise AssertionError("Job {} didn't finish".format(job_id))
+
+
+class TestJobResourceIntegration(object):
+
+    def test_job(self, server):
+        res = requests.post(server.url("jobs.json"), json={
+            "spider_name": "test",
+            "request": {"url": server.target_site.url("page1.html")},
+        })
+        assert res.status_code == 202
+        res_json = res.json()
+        assert res_json["status"] == "ok"
+        job_id = res_json["job_id"]
+        res_json = wait_for_job(server, job_id)
+        assert res_json["job_status"] == "finished"
+        assert res_json["items"] == [{u'name': [u'Page 1']}]
+        assert res_json["stats"]["finish_reason"] == "finished"
+
+    def test_job_spider_not_found(self, server):
+        res = requests.post(server.url("jobs.json"), json={
+            "spider_name": "unknown",
+            "request": {"url": server.target_site.url("page1.html")},
+        })
+        res_json = wait_for_job(server, res.json()["job_id"])
+        assert res_json["job_status"] == "failed"
+        assert res_json["error"]["code"] == 404
+
+    def test_job_not_found(self, server):
+        for method in (requests.get, requests.delete):
+            res = method(server.url("jobs.json"), params={"job_id": "foo"})
+            assert res.status_code == 404
+            assert res.json()["status"] == "error"
+
+    def test_no_job_id(self, server):
+        res = requests.get(server.url("jobs.json"))
+        assert res.status_code == 400
+        assert "job_id" in res.json()["message"]
+
+    def test_batch_job(self, server):
+        res = requests.post(server.url("jobs.json"), json={
+            "spider_name": "test",
+            "requests": [{"url": server.target_site.url("page1.html")}],
+        })
+        assert res.status_code == 400
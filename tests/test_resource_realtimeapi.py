@@ -6,7 +6,9 @@ from mock import patch
 from twisted.trial import unittest
 
 from scrapyrt.conf import settings
-from scrapyrt.resources import RealtimeApi, ServiceResource, CrawlResource
+from scrapyrt.resources import (
+    RealtimeApi, ServiceResource, CrawlResource, JobResource, MetricsResource
+)
 
 
 class TestResource(ServiceResource):
@@ -25,7 +27,11 @@ class TestRealtimeApi(unittest.TestCase):
         return '{}.{}.{}'.format(__package__, module_name, clsname)
 
     def test_realtimeapi_with_default_settings(self):
-        expected_entities = {b'crawl.json': CrawlResource}
+        expected_entities = {
+            b'crawl.json': CrawlResource,
+            b'jobs.json': JobResource,
+            b'metrics.json': MetricsResource,
+        }
         service_root = RealtimeApi()
         self._check_entities(service_root, expected_entities)
 
@@ -38,6 +44,8 @@ class TestRealtimeApi(unittest.TestCase):
         settings.RESOURCES[b'test.json'] = self._get_class_path('TestResource')
         expected_entities = {
             b'crawl.json': CrawlResource,
+            b'jobs.json': JobResource,
+            b'metrics.json': MetricsResource,
             b'test.json': TestResource
         }
         service_root = RealtimeApi()
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 import json
+import zlib
 
 from mock import MagicMock, patch
-from twisted.internet.defer import succeed, fail
+from twisted.internet.defer import Deferred, fail, maybeDeferred, succeed
+from twisted.internet.error import ConnectionDone
 from twisted.python.failure import Failure
 from twisted.web import server
 from twisted.web.error import Error, UnsupportedMethod
@@ -82,6 +84,54 @@ class TestRender(TestServiceResource):
         self.assertEqual(obj['code'], 500)
         self.assertTrue(log_err_mock.called)
 
+    def test_render_deferred_client_disconnected(self, render_mock,
+                                                 log_err_mock):
+        notify_finish = Deferred()
+        self.request.notifyFinish.return_value = notify_finish
+        cancelled = []
+        render_mock.return_value = Deferred(cancelled.append)
+        result = self.resource.render(self.request)
+        self.assertEqual(result, server.NOT_DONE_YET)
+        notify_finish.errback(Failure(ConnectionDone()))
+        self.assertEqual(len(cancelled), 1)
+        self.assertFalse(self.request.write.called)
+        self.assertFalse(self.request.finish.called)
+        self.assertFalse(log_err_mock.called)
+
+    @patch('scrapyrt.resources.settings.JSON_ENCODE_THREAD_MIN_ITEMS', 3)
+    @patch('scrapyrt.resources.threads.deferToThread')
+    def test_render_deferred_in_thread(self, defer_to_thread_mock,
+                                       render_mock, log_err_mock):
+        defer_to_thread_mock.side_effect = (
+            lambda func, *args: succeed(func(*args)))
+        self.resource.json_chunk_size = 10
+        obj = {'status': 'ok', 'items': [{'name': 'x' * 20}] * 3}
+        render_mock.return_value = succeed(obj)
+        self.resource.render(self.request)
+        self.assertTrue(defer_to_thread_mock.called)
+        self.assertGreater(len(self.request_write_values), 1)
+        body = b''.join(self.request_write_values)
+        self.assertEqual(json.loads(body.decode('utf8')), obj)
+        self.request.setHeader.assert_any_call('Content-Length', len(body))
+        self.assertTrue(self.request.finish.called)
+        stats = self.resource.get_encode_stats()
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['in_thread'], 1)
+
+    @patch('scrapyrt.resources.settings.JSON_ENCODE_THREAD_MIN_ITEMS', 3)
+    @patch('scrapyrt.resources.threads.deferToThread')
+    def test_render_deferred_in_thread_error(self, defer_to_thread_mock,
+                                             render_mock, log_err_mock):
+        defer_to_thread_mock.side_effect = (
+            lambda func, *args: maybeDeferred(func, *args))
+        render_mock.return_value = succeed({'items': [object()] * 3})
+        self.resource.render(self.request)
+        self.assertEqual(len(self.request_write_values), 1)
+        obj = json.loads(self.request_write_values[0].decode("utf8"))
+        self.assertEqual(obj['status'], 'error')
+        self.assertEqual(obj['code'], 500)
+        self.assertTrue(log_err_mock.called)
+        self.assertTrue(self.request.finish.called)
 
 @patch('twisted.python.log.msg')
 class TestHandleErrors(TestServiceResource):
@@ -167,8 +217,9 @@ class TestRenderObject(TestServiceResource):
     def test_render_object(self):
         result = self.resource.render_object(self.obj, self.request)
         set_header_mock = self.request.setHeader
-        self.assertEqual(set_header_mock.call_count, 5)
+        self.assertEqual(set_header_mock.call_count, 6)
         set_header_mock.assert_any_call('Content-Type', 'application/json')
+        set_header_mock.assert_any_call('Vary', 'Accept-Encoding')
         set_header_mock.assert_any_call('Access-Control-Allow-Origin', '*')
         set_header_mock.assert_any_call('Access-Control-Allow-Headers',
                                         'X-Requested-With')
@@ -182,6 +233,41 @@ class TestRenderObject(TestServiceResource):
             self.assertIn(key.encode("utf8"), result)
             self.assertIn(value.encode("utf8"), result)
 
+    def test_render_object_compressed(self):
+        self.request.getHeader.return_value = 'gzip;q=0.5, deflate'
+        obj = {'items': ['x' * 100] * 20}
+        with patch('scrapyrt.resources.settings.RESPONSE_COMPRESSION_MIN_SIZE',
+                   1000):
+            result = self.resource.render_object(obj, self.request)
+            headers = dict(self.headers)
+            self.assertEqual(headers['Content-Encoding'], 'deflate')
+            self.assertEqual(headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(headers['Content-Length'], len(result))
+            self.assertEqual(
+                json.loads(zlib.decompress(result).decode('utf8')), obj)
+            # small responses aren't compressed
+            self.headers[:] = []
+            result = self.resource.render_object(self.obj, self.request)
+            headers = dict(self.headers)
+            self.assertNotIn('Content-Encoding', headers)
+            self.assertEqual(headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(json.loads(result.decode('utf8')), self.obj)
+
+    def test_render_object_not_accepted_encoding(self):
+        self.request.getHeader.return_value = 'br'
+        self.resource.render_object({'items': ['x' * 2000]}, self.request)
+        headers = dict(self.headers)
+        self.assertNotIn('Content-Encoding', headers)
+        # caches must not reuse this response for clients accepting gzip
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+    @patch('scrapyrt.resources.settings.RESPONSE_COMPRESSION', False)
+    def test_render_object_compression_disabled(self):
+        self.request.getHeader.return_value = 'gzip'
+        self.resource.render_object({'items': ['x' * 2000]}, self.request)
+        self.assertNotIn('Content-Encoding', dict(self.headers))
+        self.assertNotIn('Vary', dict(self.headers))
+
     def _test_access_control_allow_methods_header(self):
         headers = dict(self.headers)
         self.assertIn('Access-Control-Allow-Methods', headers)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import datetime
+import decimal
+import json
+
+import pytest
+import scrapy
+from scrapy import Item, Field
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+from scrapyrt.serialize import (
+    get_json_backend, JSONBackend, JSON_BACKENDS, OrjsonBackend,
+    SimplejsonBackend
+)
+
+
+class SampleItem(Item):
+    name = Field()
+
+
+OBJ = {
+    'items': [SampleItem(name=u'caf\xe9')],
+    'datetime': datetime.datetime(2017, 1, 2, 3, 4, 5, 600),
+    'date': datetime.date(2017, 1, 2),
+    'time': datetime.time(3, 4, 5, 600),
+    'decimal': decimal.Decimal('1.10'),
+    'tuple': (1, 2),
+    'big': 2 ** 70,
+}
+if scrapy.version_info >= (1, 1):
+    # ScrapyJSONEncoder of Scrapy 1.0 can't encode sets
+    OBJ['items'].append({'set': set([1])})
+
+
+def load_backend(name):
+    try:
+        return get_json_backend(name)
+    except ImportError as e:
+        pytest.skip(str(e))
+
+
+@pytest.fixture(params=list(JSON_BACKENDS))
+def backend(request):
+    return load_backend(request.param)
+
+
+class TestJSONBackend(object):
+
+    def test_dumps_like_scrapy_encoder(self, backend):
+        expected = json.loads(ScrapyJSONEncoder().encode(OBJ))
+        assert json.loads(backend.dumps(OBJ).decode('utf8')) == expected
+
+    def test_dumps_chunks(self, backend):
+        chunks = backend.dumps_chunks(OBJ, 16)
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+        assert b''.join(chunks) == backend.dumps(OBJ)
+
+    def test_loads(self, backend):
+        data = u'{"spider_name": "caf\xe9", "n": [1, 2.5, null]}'
+        expected = {u'spider_name': u'caf\xe9', u'n': [1, 2.5, None]}
+        assert backend.loads(data.encode('utf8')) == expected
+        with pytest.raises(ValueError):
+            backend.loads(b"{'spider_name': 'test'}")
+
+    def test_get_json_backend(self):
+        assert isinstance(get_json_backend('json'), JSONBackend)
+        backend = get_json_backend('scrapyrt.serialize.JSONBackend')
+        assert type(backend) is JSONBackend
+        assert isinstance(get_json_backend('auto'), JSONBackend)
+
+    def test_stdlib_chunks_split_encoded_json(self):
+        chunks = JSONBackend().dumps_chunks({'key': 'x' * 20}, 10)
+        assert [len(chunk) for chunk in chunks] == [10, 10, 10, 1]
+
+
+class TestFastBackends(object):
+
+    def test_simplejson(self):
+        backend = load_backend('simplejson')
+        assert isinstance(backend, SimplejsonBackend)
+
+    def test_orjson(self):
+        backend = load_backend('orjson')
+        assert isinstance(backend, OrjsonBackend)
+        assert backend.dumps({'date': datetime.date(2017, 1, 2)}) == (
+            b'{"date":"2017-01-02"}')
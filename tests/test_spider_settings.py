@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+from mock import patch
+from scrapy.exceptions import ScrapyDeprecationWarning
+from scrapy.settings import Settings
+from scrapy.spiderloader import SpiderLoader
+from twisted.trial import unittest
+
+from scrapyrt.conf.spider_settings import (
+    ProjectSettingsCache, SettingsOverlay
+)
+
+from .spiders import MetaSpider
+
+
+class CustomSpiderLoader(SpiderLoader):
+    pass
+
+
+class IncompleteSpiderLoader(object):
+
+    @classmethod
+    def from_settings(cls, settings):
+        loader = cls()
+        loader.settings = settings
+        return loader
+
+
+class TestSettingsOverlay(unittest.TestCase):
+
+    def setUp(self):
+        self.base = Settings({'FOO': 'foo', 'BAR': {'a': 1}})
+        self.base.freeze()
+
+    def test_base_must_be_frozen(self):
+        self.assertRaises(AssertionError, SettingsOverlay, Settings())
+
+    def test_values(self):
+        overlay = SettingsOverlay(self.base, {'FOO': 'bar'})
+        self.assertEqual(overlay['FOO'], 'bar')
+        self.assertEqual(self.base['FOO'], 'foo')
+        self.assertEqual(overlay.attributes['FOO'].priority, 40)
+
+    def test_set_doesnt_change_base(self):
+        overlay = SettingsOverlay(self.base)
+        overlay.set('FOO', 'baz', priority='cmdline')
+        overlay.set('NEW', 'new')
+        self.assertEqual(overlay['FOO'], 'baz')
+        self.assertEqual(self.base['FOO'], 'foo')
+        self.assertNotIn('NEW', self.base.attributes)
+
+    def test_nested_dict_doesnt_change_base(self):
+        overlay = SettingsOverlay(self.base)
+        overlay['BAR']['b'] = 2
+        self.assertEqual(overlay.getdict('BAR'), {'a': 1, 'b': 2})
+        self.assertEqual(self.base.getdict('BAR'), {'a': 1})
+
+    def test_delete_doesnt_change_base(self):
+        overlay = SettingsOverlay(self.base)
+        del overlay['FOO']
+        self.assertNotIn('FOO', overlay.attributes)
+        self.assertEqual(self.base['FOO'], 'foo')
+
+    def test_copy(self):
+        overlay = SettingsOverlay(self.base, {'FOO': 'bar'})
+        settings_copy = overlay.copy()
+        settings_copy.set('FOO', 'baz', priority='cmdline')
+        self.assertEqual(overlay['FOO'], 'bar')
+        self.assertEqual(self.base['FOO'], 'foo')
+
+    def test_copy_shares_base(self):
+        overlay = SettingsOverlay(self.base, {'FOO': 'bar'})
+        settings_copy = overlay.copy()
+        self.assertIsInstance(settings_copy, SettingsOverlay)
+        self.assertFalse(settings_copy.frozen)
+        self.assertIs(settings_copy.attributes['BAR'],
+                      self.base.attributes['BAR'])
+        self.assertIsNot(settings_copy.attributes['FOO'],
+                         overlay.attributes['FOO'])
+        settings_copy['BAR']['b'] = 2
+        self.assertEqual(settings_copy.getdict('BAR'), {'a': 1, 'b': 2})
+        self.assertEqual(overlay.getdict('BAR'), {'a': 1})
+        self.assertEqual(self.base.getdict('BAR'), {'a': 1})
+
+
+class TestProjectSettingsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ProjectSettingsCache()
+        self.module = 'tests.test_settings.settings'
+
+    def test_project_settings(self):
+        result = self.cache.get(module=self.module)
+        self.assertTrue(result.frozen)
+        self.assertEqual(result['A'], 'B')
+        self.assertFalse(result.getbool('LOG_ENABLED'))
+        self.assertIs(self.cache.get(module=self.module), result)
+        self.assertEqual(self.cache.rebuilds, 1)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_spider_settings(self):
+        MetaSpider.custom_settings = {'A': 'C'}
+        self.addCleanup(setattr, MetaSpider, 'custom_settings', None)
+        with patch.object(self.cache, 'load_spider',
+                          return_value=MetaSpider) as load_spider:
+            result = self.cache.get('meta', module=self.module)
+            self.assertIs(self.cache.get('meta', module=self.module), result)
+        self.assertEqual(load_spider.call_count, 1)
+        self.assertTrue(result.frozen)
+        self.assertEqual(result['A'], 'C')
+        self.assertEqual(self.cache.get(module=self.module)['A'], 'B')
+        self.assertEqual(self.cache.rebuilds, 2)
+
+    def test_unknown_spider(self):
+        result = self.cache.get('unknown', module=self.module)
+        self.assertIs(result, self.cache.get(module=self.module))
+        self.assertEqual(self.cache.get_stats()['size'], 1)
+
+    def test_reload(self):
+        result = self.cache.get(module=self.module)
+        spider_loader = self.cache.get_spider_loader(result)
+        self.cache.reload()
+        self.assertIsNot(self.cache.get(module=self.module), result)
+        self.assertIsNot(self.cache.get_spider_loader(result), spider_loader)
+
+    def test_spider_loader_is_shared(self):
+        crawler_settings = Settings({'SPIDER_MODULES': ['tests.spiders']})
+        spider_loader = self.cache.get_spider_loader(crawler_settings)
+        self.assertIs(spider_loader.load('meta'), MetaSpider)
+        other_settings = Settings({'SPIDER_MODULES': ['tests.spiders']})
+        self.assertIs(
+            self.cache.get_spider_loader(other_settings), spider_loader)
+        other_settings.set('SPIDER_MODULES', [])
+        self.assertIsNot(
+            self.cache.get_spider_loader(other_settings), spider_loader)
+        self.assertEqual(self.cache.get_stats()['spider_loaders'], 2)
+
+    def test_spider_manager_class(self):
+        crawler_settings = Settings({'SPIDER_MODULES': ['tests.spiders']})
+        spider_loader = self.cache.get_spider_loader(crawler_settings)
+        crawler_settings.set(
+            'SPIDER_MANAGER_CLASS',
+            'tests.test_spider_settings.CustomSpiderLoader')
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            custom_loader = self.cache.get_spider_loader(crawler_settings)
+        self.assertIsInstance(custom_loader, CustomSpiderLoader)
+        self.assertIsNot(custom_loader, spider_loader)
+        self.assertEqual(w[0].category, ScrapyDeprecationWarning)
+        self.assertIn('SPIDER_MANAGER_CLASS', str(w[0].message))
+        self.assertIs(
+            self.cache.get_spider_loader(crawler_settings), custom_loader)
+
+    def test_incomplete_spider_loader(self):
+        crawler_settings = Settings({
+            'SPIDER_LOADER_CLASS':
+                'tests.test_spider_settings.IncompleteSpiderLoader',
+        })
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            spider_loader = self.cache.get_spider_loader(crawler_settings)
+        self.assertIsInstance(spider_loader, IncompleteSpiderLoader)
+        self.assertIn('ISpiderLoader', str(w[0].message))
+        # loader gets frozen copy of settings
+        self.assertTrue(spider_loader.settings.frozen)
+        self.assertFalse(crawler_settings.frozen)
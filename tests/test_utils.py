@@ -1,8 +1,14 @@
 import re
 
 import pytest
+from twisted.internet.defer import CancelledError, Deferred, succeed
+from twisted.python.failure import Failure
 
-from scrapyrt.utils import extract_scrapy_request_args
+from scrapyrt.utils import (
+    build_fields_tree, count_items, extract_scrapy_request_args,
+    filter_stats, get_crawl_fingerprint, get_failure_signature,
+    select_fields, SingleFlight
+)
 
 
 class TestUtils(object):
@@ -32,3 +38,144 @@ class TestUtils(object):
         expected_msg =u"'noise' is not a valid argument for scrapy.Request"
         assert re.search(expected_msg, str(e.value))
 
+
+    def test_crawl_fingerprint(self):
+        fingerprint = get_crawl_fingerprint(
+            'test', {'url': 'http://foo.com/?a=1&b=2', 'meta': {'x': 1}},
+            max_requests=1)
+        same = get_crawl_fingerprint(
+            'test', {'meta': {'x': 1}, 'url': 'http://foo.com/?b=2&a=1'},
+            max_requests='1')
+        assert fingerprint == same
+        other_requests = [
+            ('other', {'url': 'http://foo.com/?a=1&b=2', 'meta': {'x': 1}}),
+            ('test', {'url': 'http://foo.com/?a=1&b=3', 'meta': {'x': 1}}),
+            ('test', {'url': 'http://foo.com/?a=1&b=2', 'meta': {'x': 2}}),
+        ]
+        for spider_name, request_args in other_requests:
+            other = get_crawl_fingerprint(
+                spider_name, request_args, max_requests=1)
+            assert other != fingerprint
+        assert get_crawl_fingerprint(
+            'test', {'url': 'http://foo.com/?a=1&b=2', 'meta': {'x': 1}},
+            max_requests=2) != fingerprint
+
+    def test_count_items(self):
+        assert count_items({'status': 'ok', 'items': [1, 2]}) == 2
+        assert count_items({'results': [
+            {'items': [1]}, {'items': [1, 2, 3]}]}) == 4
+        assert count_items({'job_id': 'x', 'result': {'items': [1]}}) == 1
+        assert count_items({'items': None}) == 0
+        assert count_items('items') == 0
+
+    def test_build_fields_tree(self):
+        assert build_fields_tree(['name', 'offers.price', 'offers.seller']) \
+            == {'name': None, 'offers': {'price': None, 'seller': None}}
+        # whole field selected, nested path doesn't narrow it
+        assert build_fields_tree(['offers', 'offers.price']) == \
+            {'offers': None}
+        assert build_fields_tree(['offers.price', 'offers']) == \
+            {'offers': None}
+
+    def test_select_fields(self):
+        item = {
+            'name': 'Ada',
+            'url': 'http://example.com',
+            'offers': [{'price': 1, 'seller': 'a'}, {'price': 2}],
+            'meta': {'a': 1, 'b': 2},
+        }
+        tree = build_fields_tree(['name', 'offers.price', 'meta.b', 'x'])
+        assert select_fields(item, tree) == {
+            'name': 'Ada',
+            'offers': [{'price': 1}, {'price': 2}],
+            'meta': {'b': 2},
+        }
+        # item isn't changed
+        assert item['offers'][0] == {'price': 1, 'seller': 'a'}
+        assert select_fields(item, None) is item
+        assert select_fields('value', {'name': None}) == 'value'
+
+    def test_filter_stats(self):
+        stats = {
+            'finish_reason': 'finished',
+            'downloader/request_count': 1,
+            'downloader/response_count': 1,
+            'item_scraped_count': 2,
+        }
+        assert filter_stats(stats, ['finish_reason', 'downloader/*']) == {
+            'finish_reason': 'finished',
+            'downloader/request_count': 1,
+            'downloader/response_count': 1,
+        }
+        assert filter_stats(stats, []) == {}
+
+    def test_get_failure_signature(self):
+        def fail(exception):
+            try:
+                raise exception
+            except Exception:
+                return Failure()
+
+        failures = [fail(ValueError(message)) for message in ('a', 'b')]
+        assert (get_failure_signature(failures[0]) ==
+                get_failure_signature(failures[1]))
+        assert (get_failure_signature(failures[0]) !=
+                get_failure_signature(fail(KeyError('a'))))
+
+
+class TestSingleFlight(object):
+
+    def test_run(self):
+        single_flight = SingleFlight()
+        running = Deferred()
+        calls = []
+
+        def func(value):
+            calls.append(value)
+            return running
+
+        first, first_coalesced = single_flight.run('key', func, 1)
+        second, second_coalesced = single_flight.run('key', func, 2)
+        other, other_coalesced = single_flight.run(
+            'other', lambda: succeed('other'))
+        assert calls == [1]
+        assert not first_coalesced
+        assert second_coalesced
+        assert not other_coalesced
+
+        results = []
+        second.addCallback(results.append)
+        running.callback('result')
+        assert results == ['result']
+        assert single_flight.in_flight == {}
+        # key is not in flight anymore
+        single_flight.run('key', func, 3)
+        assert calls == [1, 3]
+
+    def test_cancel(self):
+        single_flight = SingleFlight()
+        cancelled = []
+        running = Deferred(cancelled.append)
+        first, _ = single_flight.run('key', lambda: running)
+        second, _ = single_flight.run('key', lambda: running)
+        first.addErrback(lambda failure: failure.trap(CancelledError))
+        first.cancel()
+        # second caller still waits for result
+        assert not cancelled
+        results = []
+        second.addErrback(results.append)
+        second.cancel()
+        assert cancelled == [running]
+        assert results[0].check(CancelledError)
+        assert single_flight.in_flight == {}
+        assert single_flight.calls == {}
+
+    def test_run_error(self):
+        single_flight = SingleFlight()
+
+        def func():
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            single_flight.run('key', func)
+        assert single_flight.in_flight == {}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os
+import signal
+import subprocess
+
+import pytest
+import requests
+from mock import patch
+
+from scrapyrt.workers import create_listening_socket, WorkerMaster
+from .servers import make_server
+
+
+class LimitedWorkerMaster(WorkerMaster):
+    """Stops after given number of spawned workers."""
+
+    def __init__(self, max_spawned, *args, **kwargs):
+        super(LimitedWorkerMaster, self).__init__(*args, **kwargs)
+        self.max_spawned = max_spawned
+        self.spawned = 0
+
+    def spawn_worker(self):
+        self.spawned += 1
+        pid = super(LimitedWorkerMaster, self).spawn_worker()
+        if self.spawned >= self.max_spawned:
+            self.stop()
+        return pid
+
+
+@pytest.fixture()
+def sock(request):
+    sock = create_listening_socket(0, '127.0.0.1')
+    request.addfinalizer(sock.close)
+    return sock
+
+
+class TestWorkerMaster(object):
+
+    @patch('scrapyrt.workers.RESTART_DELAY', 0)
+    def test_restart_exited_workers(self, sock):
+        master = LimitedWorkerMaster(5, 2, lambda sock: None, sock)
+        master.run()
+        assert master.spawned == 5
+        assert master.restarts == 3
+        assert master.workers == {}
+
+    def test_stop_workers(self, sock):
+        read_fd, write_fd = os.pipe()
+
+        def run_worker(sock):
+            os.write(write_fd, b'x')
+            signal.pause()
+
+        master = LimitedWorkerMaster(2, 2, run_worker, sock)
+        master.run()
+        os.close(write_fd)
+        assert os.read(read_fd, 2) == b'xx'
+        os.close(read_fd)
+        assert master.restarts == 0
+        assert master.workers == {}
+
+
+class TestWorkersServer(object):
+
+    @pytest.fixture()
+    def server(self, request):
+        server = make_server(request, '--workers', '2')
+
+        def terminate():
+            # SIGTERM lets master stop its workers, finalizer of
+            # make_server runs after this one
+            if server.proc.poll() is None:
+                server.proc.terminate()
+                server.proc.wait()
+
+        request.addfinalizer(terminate)
+        return server
+
+    def get_workers(self, server):
+        output = subprocess.check_output(
+            ['pgrep', '-P', str(server.proc.pid)])
+        return [int(pid) for pid in output.split()]
+
+    def test_crawl(self, server):
+        url = server.url('crawl.json')
+        for _ in range(4):
+            res = requests.get(url, params={
+                'spider_name': 'test',
+                'url': server.target_site.url('page1.html'),
+            })
+            assert res.status_code == 200
+            assert res.json()['items'] == [{'name': ['Page 1']}]
+
+    def test_workers_stopped(self, server):
+        workers = self.get_workers(server)
+        assert len(workers) == 2
+        server.proc.terminate()
+        server.proc.wait()
+        for pid in workers:
+            with pytest.raises(OSError):
+                os.kill(pid, 0)